@@ -1,27 +1,33 @@
-import json
-import re
+import asyncio
+import copy
+import time
 from abc import ABC
+from typing import TYPE_CHECKING, Callable
 from datetime import datetime
 
-from ollama import ChatResponse
-from ollama import chat
 
 from bring_a_crew import action_agent_log
+from bring_a_crew.budget import CycleDetector, PartialAnswer, current_budget, record_llm_call, within_deadline
+from bring_a_crew.checkpoint import checkpointed, current_journal
+from bring_a_crew.fast_path import FastPath
+from bring_a_crew.llm_backend import DEFAULT_MODEL, LLMBackend, get_default_backend
+from bring_a_crew.memory import Memory
+from bring_a_crew.prompt_cache import PromptCacheStats
+from bring_a_crew.react_parser import ACTION_RE, ANSWER_RE, parse_arguments, parse_response, tools_for_actions
+from bring_a_crew.retrieval import BM25Index
+from bring_a_crew.streaming import read_until_complete_line
+from bring_a_crew.tool_executor import ToolExecutor, get_default_executor, is_idempotent
+from bring_a_crew.tracing import get_tracer
 
-MODEL = 'phi4'
+if TYPE_CHECKING:
+    from ollama import ChatResponse
 
 
-def create_system_prompt(actions, agent_intro: str):
-    def _extract_arguments(arguments):
-        return ",".join([f" `{argument["name"]}`({argument["type"]})" for argument in arguments])
-    actions_str = "\n".join([f" - `{action}`; for {value["description"]} with arguments {_extract_arguments(value["arguments"])}" for action, value in actions.items()])
-    return f"""
-{agent_intro}
-
+# The instructions and the example are the same for all action agents and every day. They come first in the
+# system prompt, so the prompt cache of the model server can reuse them between agents and turns.
+REACT_PROMPT = """
 You are an AI agent following the ReAct framework, where you **Think**, **Act**, and process **Observations** in response to a given **Question**.  During thinking you analyse the question, break it down into subquestions, and decide on the actions to take to answer the question. You then act by performing the actions you decided on. After each action, you pause to observe the results of the action. You then continue the cycle by thinking about the new observation and deciding on the next action to take. You continue this cycle until you have enough information to answer the original question.
 
-The date for today is: {datetime.now().strftime("%Y-%m-%d")}
-
 Arguments for an action are provided as a json document with the arguments as keys and the values as the values.
 
 You will always follow this structured format:
@@ -43,8 +49,7 @@ Rules:
 1. Never answer a question directly; always go through the **Think → Action → PAUSE** cycle.
 2. Never generate output after "PAUSE"
 3. Observations will be provided as a response to an action; never generate your own output for an action.
-4. These are the only available actions, and there arguments:
-{actions_str}
+4. Only use the available actions listed below, with their arguments.
 
 Example Interactions:
 - User Input:
@@ -52,7 +57,7 @@ What is the weight for a bulldog?
 - Model Response:
 Question: What is the weight for a bulldog?
 Think: To solve this, I need to perform the dog_weight_for_breed action with the argument bulldog.
-Action: dog_weight_for_breed: {{"name": "bulldog"}}
+Action: dog_weight_for_breed: {"name": "bulldog"}
 PAUSE
 
 User Provides an Observation:
@@ -65,79 +70,352 @@ Answer: The average weight for a Bulldog is 40 lbs.
 """.strip()
 
 
+# With native tool calling the actions are passed as tools, the prompt does not have to explain the text format
+TOOL_CALLING_PROMPT = """
+You are an AI agent that answers a given **Question** using the available tools. During thinking you analyse the question, break it down into subquestions, and decide on the tools to call to answer the question. After each tool call, you receive the result. You continue until you have enough information to answer the original question.
+
+Rules:
+1. Never answer a question directly; always use the tools to find the information.
+2. Only use the available tools, with their arguments.
+3. When the final answer is ready, you will return it:
+Answer: [Use Final answer to write a friendly response with the answer to the question]
+""".strip()
+
+
+def create_system_prompt(actions, agent_intro: str):
+    def _extract_arguments(arguments):
+        return ",".join([f" `{argument["name"]}`({argument["type"]})" for argument in arguments])
+    actions_str = "\n".join([f" - `{action}`; for {value["description"]} with arguments {_extract_arguments(value["arguments"])}" for action, value in actions.items()])
+    return f"""
+{REACT_PROMPT}
+
+{agent_intro}
+
+These are the only available actions, and there arguments:
+{actions_str}
+""".strip()
+
+
+def create_tool_calling_prompt(agent_intro: str):
+    return f"""
+{TOOL_CALLING_PROMPT}
+
+{agent_intro}
+""".strip()
+
+
+def create_date_message():
+    """
+    The date changes every day, it is sent as a separate message after the stable system prompt.
+    """
+    return {"role": "system", "content": f"The date for today is: {datetime.now().strftime("%Y-%m-%d")}"}
+
+
 class ActionAgent(ABC):
-    def __init__(self, name: str, intro: str, actions=None):
+    def __init__(self, name: str, intro: str, actions=None, backend: LLMBackend | None = None,
+                 stream: bool = False, on_stream: Callable[[str, str], None] | None = None,
+                 memory: Memory | None = None, keep_alive: float | str | None = None,
+                 model: str = DEFAULT_MODEL,
+                 tool_executor: ToolExecutor | None = None, tool_calling: bool = False, prefetch: bool = True,
+                 max_turns: int = 10, max_repeats: int = 1, top_k_actions: int | None = None,
+                 fast_path: FastPath | None = None, is_name: Callable[[str], bool] | None = None):
         self.log = action_agent_log
-        self.log.info("Initializing Agent")
+        self.log.debug("Initializing Agent %s", name)
         self.name = name
         self.intro = intro
 
         # Initialize the messages with the system message
-        self.memory = []
-        system_prompt = create_system_prompt(actions, intro)
+        self.memory = memory if memory is not None else Memory()
+        # With tool calling, the actions are passed to the model as tools instead of the text protocol
+        self.tool_calling = tool_calling
+        self.tools = tools_for_actions(actions or {})
+        if tool_calling:
+            system_prompt = create_tool_calling_prompt(intro)
+        else:
+            system_prompt = create_system_prompt(actions, intro)
         self.memory.append({"role": "system", "content": system_prompt})
-        self.log.debug(f"Agent initialized for system {system_prompt}")
+        self.log.debug("Agent initialized for system %s", system_prompt)
 
         # Initialize the known actions
         self.known_actions = {}
+        self.action_definitions = {}
         if actions is not None:
             for action, value in actions.items():
                 self.known_actions[action] = value["function"]
+                # The executor reports its stats by the name of the action
+                self.action_definitions[action] = {"name": action, **value}
+        self.tool_executor = tool_executor if tool_executor is not None else get_default_executor()
+        # Run the predicted calls of read-only actions while the model is generating
+        self.prefetch = prefetch
+        # With many actions, only the top_k_actions that match the command are in the prompt
+        self.top_k_actions = top_k_actions
+        self.action_index = None
+        if top_k_actions is not None and len(self.action_definitions) > top_k_actions:
+            self.action_index = BM25Index({action: f"{action} {value["description"]}"
+                                           for action, value in self.action_definitions.items()})
+        # The commands the fast path recognises are answered by one action, without the LLM
+        self.fast_path = fast_path
+        # Whether a word of a command is the name of a person this agent knows, for the AgentResultCache
+        self.is_name = is_name
+        # The prompt and tools per selection of actions, shared by the sessions of this agent
+        self._selected_prompts = {}
+        # The number of commands, and of calls of actions with side effects, of read-only actions that succeeded
+        # and of actions that failed in the last command
+        self.commands = 0
+        self.side_effects = 0
+        self.read_actions = 0
+        self.failed_actions = 0
 
-        self.max_turns = 10
-        self.action_re = re.compile(r'^Action: (\w+): (.*)$')
-        self.answer_re = re.compile(r'^Answer: (.*)$')
+        self.backend = backend if backend is not None else get_default_backend()
+        self.model = model
+        # Stream the response and stop generating at the first complete action or answer line
+        self.stream = stream
+        self.on_stream = on_stream
+        # Keep the model loaded between turns, so the cached prompt prefix can be reused
+        self.keep_alive = keep_alive
+        self.prompt_cache = PromptCacheStats(count_tokens=self.memory.count_tokens)
+        self.max_turns = max_turns
+        # The number of times the model may repeat an action it already ran, before the agent stops
+        self.max_repeats = max_repeats
+        self.action_re = ACTION_RE
+        self.answer_re = ANSWER_RE
 
-    def __handle_user_message(self, message):
-        self.log.info(f"Received message: {message}")
-        self.memory.append({"role": "user", "content": message})
-        result = self.__call_llm()
-        self.memory.append({"role": "assistant", "content": result})
-        return result
+    def session(self, memory: Memory | None = None):
+        """
+        A copy of the agent for one request. It shares the prompt, the actions and the backend with this agent and
+        only gets a memory of its own, which makes it cheap to create.
+        """
+        session = copy.copy(self)
+        session.memory = memory if memory is not None else self.memory.fork()
+        return session
+
+    async def __handle_messages(self, messages: list[dict]):
+        for message in messages:
+            self.log.info("Received message: %s", message["content"])
+            self.memory.append(message)
+        # When the request is resumed, the responses of completed turns come from the journal
+        content, tool_calls = await within_deadline(lambda: checkpointed(self.name, "llm", self.__call_llm))
+        response = {"role": "assistant", "content": content}
+        if tool_calls:
+            response["tool_calls"] = tool_calls
+        self.memory.append(response)
+        return content, tool_calls
 
     def perform_action(self, command):
-        i = 0
-        next_prompt = command
-        while i < self.max_turns:
-            i += 1
-            result = self.__handle_user_message(next_prompt)
-
-            # Check if there is an action to run or an answer to return
-            actions = [self.action_re.match(a) for a in result.split('\n') if self.action_re.match(a)]
-            if actions:
-                next_prompt = self.__execute_action(actions)
+        """
+        Blocking wrapper around aperform_action, do not call this from a running event loop.
+        """
+        return asyncio.run(self.aperform_action(command))
+
+    async def aperform_action(self, command):
+        """
+        Runs the ReAct loop for the command. The LLM calls go through the async backend, so many commands
+        can be handled concurrently within one event loop. When the budget of the request or the turns of the
+        agent run out, or the model keeps repeating an action, the result is a PartialAnswer. A command that the
+        fast path recognises is answered by the observation of its action, without the LLM, unless the action fails.
+        """
+        with get_tracer().span("agent.perform_action", agent=self.name) as span:
+            self.memory.start_call()
+            self.commands += 1
+            self.side_effects = 0
+            self.read_actions = 0
+            self.failed_actions = 0
+            if self.fast_path is not None:
+                # The learned intents are not in the journal, a resumed request replays the recorded decision
+                matched = await checkpointed(self.name, "fast_path", self.__match_fast_path(command))
+                if matched is not None:
+                    matched = tuple(matched)
+                    span.set(fast_path=matched[0])
+                    answer = await self.__fast_answer(command, matched)
+                    if answer is not None:
+                        return answer
+            self.memory.set_context([create_date_message()])
+            if self.action_index is not None:
+                self.__select_actions(command)
+            budget = current_budget()
+            cycles = CycleDetector(self.max_repeats)
+            observations = []
+            i = 0
+            next_messages = [{"role": "user", "content": command}]
+            previous_calls = []
+            while i < self.max_turns:
+                reason = budget.exhausted() if budget is not None else None
+                if reason is not None:
+                    return self.__partial_answer(span, reason, observations, i)
+                i += 1
+                span.set(turns=i)
+                self.__prefetch(command, previous_calls)
+                try:
+                    content, tool_calls = await self.__handle_messages(next_messages)
+                except TimeoutError:
+                    return self.__partial_answer(span, "deadline", observations, i)
+
+                # Check if there is an action to run or an answer to return
+                if tool_calls:
+                    actions, answer = [(call["function"]["name"], call["function"]["arguments"])
+                                       for call in tool_calls], None
+                else:
+                    actions, answer = parse_response(content)
+                if not actions:
+                    answer = self.__extract_answer(answer, content)
+                    # Learning changes the path of later requests, not while a request is replayed from its journal
+                    if self.fast_path is not None and current_journal() is None and len(previous_calls) == 1 \
+                            and len(observations) == 1 and not self.failed_actions:
+                        action, arguments = previous_calls[0]
+                        self.fast_path.observe(command, action, arguments, self.action_definitions[action])
+                    return answer
+
+                # Every tool call needs a result, in the text protocol only the first action is executed
+                if not self.tool_calling:
+                    actions = actions[:1]
+                earlier = cycles.repeated(actions)
+                if earlier is None:
+                    results = await self.__execute_action(actions, previous_calls)
+                    cycles.record(actions, results)
+                    observations += results
+                elif cycles.cycling():
+                    return self.__partial_answer(span, "limit of repeated actions", observations, i)
+                else:
+                    self.log.warning("Repeated actions: %s", actions)
+                    results = [f"You already ran {action} with these arguments, the result was: {observation} Use this result to continue."
+                               for (action, _), observation in zip(actions, earlier)]
+                next_messages = self.__observation_messages(results)
+            return self.__partial_answer(span, "turn limit", observations, i)
+
+    def __match_fast_path(self, command):
+        async def _match():
+            return self.fast_path.match(command, self.action_definitions)
+        return _match
+
+    async def __fast_answer(self, command, matched):
+        """
+        Runs the action of the fast path. The command and the observation are added to the memory like a turn of
+        the model, so a later command of the same conversation can refer to it. Returns None when the action
+        failed, then the model answers the command.
+        """
+        self.log.info("Fast path for %s: %s %s", self.name, *matched)
+        failed_actions = self.failed_actions
+        observation = (await self.__execute_action([matched], []))[0]
+        if self.failed_actions > failed_actions:
+            self.log.warning("Fast path for %s failed, the model answers instead: %s", self.name, observation)
+            return None
+        self.memory.append({"role": "user", "content": command})
+        self.memory.append({"role": "assistant", "content": f"Answer: {observation}"})
+        self.log.info("Final answer: %s", observation)
+        return observation
+
+    def __select_actions(self, command):
+        """
+        Puts only the actions that match the command in the prompt. The other actions can still be called when the
+        model asks for them.
+        """
+        selected = tuple(self.action_index.search(command, self.top_k_actions))
+        prompt = self._selected_prompts.get(selected)
+        if prompt is None:
+            actions = {action: self.action_definitions[action] for action in selected}
+            if self.tool_calling:
+                prompt = (create_tool_calling_prompt(self.intro), tools_for_actions(actions))
             else:
-                return self.__extract_answer(result)
-
-    def __execute_action(self, actions):
-        action, action_input = actions[0].groups()
-        if action not in self.known_actions:
-            self.log.error("Unknown action: %s: %s", action, action_input)
-            raise Exception("Unknown action: {}: {}".format(action, action_input))
-
-        self.log.info(" -- running %s %s", action, action_input)
-        # Parse the JSON string into a dictionary
-        action_args = json.loads(action_input)
-        # Unpack the dictionary as keyword arguments
-        observation = self.known_actions[action](**action_args)
-
-        self.log.info("Observation: %s", observation)
-        return f"Observation: {observation}"
-
-    def __extract_answer(self, result):
-        answers = [self.answer_re.match(answer) for answer in result.split('\n') if self.answer_re.match(answer)]
-        if answers:
-            # There is an answer to return
-            self.log.info("Final answer: %s", answers[0].groups()[0])
-            return answers[0].groups()[0]
+                prompt = (create_system_prompt(actions, self.intro), self.tools)
+            self._selected_prompts[selected] = prompt
+        self.log.debug("Selected actions for %s: %s", self.name, selected)
+        self.memory.set_pinned([{"role": "system", "content": prompt[0]}])
+        self.tools = prompt[1]
+
+    def __partial_answer(self, span, reason: str, observations: list[str], turns: int) -> PartialAnswer:
+        self.log.warning("Stopped %s after %d turns: %s", self.name, turns, reason)
+        span.set(partial=reason)
+        return PartialAnswer(reason, observations, turns)
+
+    def __prefetch(self, command, previous_calls):
+        """
+        Starts the calls that the predict functions of the actions expect for this command, given the calls that
+        were already made. The executor only prefetches read-only actions, a matching call later in the loop gets
+        the prefetched result.
+        """
+        if not self.prefetch:
+            return
+        for action, definition in self.action_definitions.items():
+            if "predict" not in definition:
+                continue
+            try:
+                predicted = definition["predict"](command, previous_calls)
+            except Exception as e:
+                # A prediction is only a guess, it should never fail the command
+                self.log.warning("Failed to predict calls for %s: %s", action, e)
+                continue
+            for arguments in predicted:
+                if self.tool_executor.prefetch(definition, arguments) is not None:
+                    self.log.debug(" -- prefetching %s %s", action, arguments)
+
+    async def __execute_action(self, actions, previous_calls):
+        observations = []
+        for action, action_input in actions:
+            if action not in self.known_actions:
+                self.log.error("Unknown action: %s: %s", action, action_input)
+                raise Exception("Unknown action: {}: {}".format(action, action_input))
+
+            self.log.info(" -- running %s %s", action, action_input)
+            try:
+                # Parse the JSON string into a dictionary
+                action_args = parse_arguments(action_input)
+            except ValueError as e:
+                # The model gets the chance to correct the arguments, instead of failing the whole command
+                self.log.warning("Invalid arguments for %s: %s", action, e)
+                self.failed_actions += 1
+                observation = f"The arguments for {action} are not a valid json document: {e}"
+            else:
+                # The executor unpacks the dictionary as keyword arguments
+                definition = self.action_definitions[action]
+                if not is_idempotent(definition):
+                    self.side_effects += 1
+                try:
+                    with get_tracer().span("tool.call", agent=self.name, action=action):
+                        # A tool with side effects is never executed twice for one request, also not after a restart.
+                        # Like the LLM calls, a tool call does not run past the deadline of the request
+                        observation = await checkpointed(
+                            self.name, "tool",
+                            lambda: within_deadline(lambda: self.tool_executor.execute(definition, action_args)),
+                            write_ahead=not is_idempotent(definition),
+                            interrupted=lambda: f"The earlier call of {action} was interrupted, it is unknown whether it was executed. Check the result before you call it again.")
+                except Exception as e:
+                    # A failing or slow action is reported to the model, it does not fail the whole command
+                    self.log.warning("Action %s failed: %s", action, e)
+                    self.failed_actions += 1
+                    observation = f"The action {action} failed: {str(e) or type(e).__name__}"
+                else:
+                    if is_idempotent(definition):
+                        self.read_actions += 1
+                    else:
+                        # The cached results of read-only actions for the same people, rooms or dates may be out of date
+                        self.tool_executor.invalidate(action_args.values())
+                previous_calls.append((action, action_args))
+
+            self.log.info("Observation: %s", observation)
+            observations.append(str(observation))
+        return observations
+
+    def __observation_messages(self, observations):
+        if self.tool_calling:
+            return [{"role": "tool", "content": observation} for observation in observations]
+        return [{"role": "user", "content": f"Observation: {observation}"} for observation in observations]
+
+    def __extract_answer(self, answer, result):
+        if answer is None and self.tool_calling and result.strip():
+            # Without a tool call, the response of the model is the answer
+            answer = result.strip()
+        if answer is not None:
+            self.log.info("Final answer: %s", answer)
+            return answer
         else:
             self.log.error("No action or answer found in: %s", result)
             raise Exception("No action or answer found in: {}".format(result))
 
-    def __call_llm(self) -> str:
-        response: ChatResponse = chat(
-            model=MODEL,
-            messages=self.memory,
+    async def __call_llm(self):
+        messages = self.memory.messages()
+        request = dict(
+            model=self.model,
+            messages=messages,
             options={
                 "temperature": 0,
                 "stop": [
@@ -145,5 +423,30 @@ class ActionAgent(ABC):
                 ]
             }
         )
-        self.log.info(f"Response: {response.message.content}")
-        return response.message.content
+        if self.keep_alive is not None:
+            request["keep_alive"] = self.keep_alive
+        tool_calls = []
+        started = time.perf_counter()
+        with get_tracer().span("llm.call", agent=self.name, model=self.model, stream=self.stream) as span:
+            if self.stream and not self.tool_calling:
+                content = await read_until_complete_line(
+                    self.backend.chat_stream(**request),
+                    line_res=[self.action_re, self.answer_re],
+                    on_chunk=(lambda chunk: self.on_stream(self.name, chunk)) if self.on_stream else None
+                )
+                self.prompt_cache.record(messages)
+                # A stream reports no token counts, they are estimated
+                tokens = self.memory.tokens() + self.memory.count_tokens(content)
+            else:
+                if self.tool_calling:
+                    request["tools"] = self.tools
+                response: ChatResponse = await self.backend.chat(**request)
+                content = response.message.content or ""
+                tool_calls = [{"function": {"name": call.function.name, "arguments": dict(call.function.arguments)}}
+                              for call in response.message.tool_calls or []]
+                self.prompt_cache.record(messages, response.prompt_eval_count)
+                span.set(prompt_tokens=response.prompt_eval_count or 0, eval_tokens=response.eval_count or 0)
+                tokens = (response.prompt_eval_count or 0) + (response.eval_count or 0)
+        record_llm_call(tokens, time.perf_counter() - started)
+        self.log.info("Response: %s", content)
+        return content, tool_calls
@@ -0,0 +1,245 @@
+import logging
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from datetime import date, timedelta
+from typing import Awaitable, Callable
+
+from bring_a_crew.availability import TIMESLOTS, WEEKDAYS, parse_date, week_start
+from bring_a_crew.budget import PartialAnswer
+from bring_a_crew.retrieval import tokenize
+from bring_a_crew.tool_executor import is_idempotent
+from bring_a_crew.tracing import current_span
+
+MONTHS = ("january", "february", "march", "april", "may", "june", "july", "august", "september", "october",
+          "november", "december")
+WORD_NUMBERS = {word: number for number, word in enumerate(
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen sixteen "
+    "seventeen eighteen nineteen twenty".split())}
+# Words that do not change what a command asks for
+STOPWORDS = {"a", "an", "the", "of", "for", "in", "on", "at", "to", "by", "from", "with", "and", "or", "is", "are",
+             "be", "can", "could", "would", "will", "please", "check", "find", "ask", "tell", "me", "us", "what",
+             "when", "whether", "if", "there", "any", "this", "next", "starting", "start", "s"}
+
+_MONTH = "|".join(MONTHS)
+_WEEKDAY = "|".join(weekday.lower() for weekday in WEEKDAYS)
+_ORDINAL = r'(\d{1,2})(?:st|nd|rd|th)?'
+_DAY_MONTH_RE = re.compile(rf'\b(?:the )?{_ORDINAL} (?:of )?({_MONTH})(?:,? (\d{{4}}))?\b')
+_MONTH_DAY_RE = re.compile(rf'\b({_MONTH}) (?:the )?{_ORDINAL}(?:,? (\d{{4}}))?\b')
+_DAY_RE = re.compile(r'\b(?:the )?(\d{1,2})(?:st|nd|rd|th)\b')
+_WEEKDAY_RE = re.compile(rf'\b(?:(next|this|on) )?({_WEEKDAY})\b')
+# A weekday next to a date, like "tuesday 2026-10-20", adds nothing to the date
+_WEEKDAY_OF_DATE_RE = re.compile(rf'\b(?:{_WEEKDAY}),? (?=\d{{4}}-\d{{2}}-\d{{2}})|(?<=\d{{4}}-\d{{2}}-\d{{2}}),? (?:{_WEEKDAY})\b')
+_WEEK_RE = re.compile(r'\b(next|this) week\b')
+_RELATIVE_DAY_RE = re.compile(r'\b(today|tomorrow)\b')
+_TOKEN_RE = re.compile(r"\d{4}-\d{2}-\d{2}|[a-z0-9_]+")
+
+
+def _in_month(today: date, day: int, month: int, year: int | None = None) -> str | None:
+    """
+    The date of the day in the month, in the given year or else the first one from today.
+    """
+    try:
+        if year is not None:
+            return date(year, month, day).isoformat()
+        resolved = date(today.year, month, day)
+        if resolved < today:
+            resolved = date(today.year + 1, month, day)
+        return resolved.isoformat()
+    except ValueError:
+        return None
+
+
+def resolve_dates(text: str, today: date) -> str:
+    """
+    Replaces the dates in a lowercase text by the ISO date, like "the 19th of october", "the 19th", "tomorrow",
+    "next tuesday" and "next week", which becomes the week of its Monday. A day without a month is the first one
+    from today, a weekday the first one from today, or after today with next.
+    """
+    def _day_month(match, day, month, year):
+        resolved = _in_month(today, int(day), MONTHS.index(month) + 1, int(year) if year else None)
+        return resolved or match.group(0)
+
+    def _day(match):
+        day = int(match.group(1))
+        month, year = (today.month, today.year) if day >= today.day else \
+            (today.month % 12 + 1, today.year + (today.month == 12))
+        return _in_month(today, day, month, year) or match.group(0)
+
+    def _weekday(match):
+        days = (WEEKDAYS.index(match.group(2).capitalize()) - today.weekday()) % 7
+        if match.group(1) == "next" and days == 0:
+            days = 7
+        return (today + timedelta(days=days)).isoformat()
+
+    def _week(match):
+        return f"week of {(week_start(today) + timedelta(days=7 if match.group(1) == "next" else 0)).isoformat()}"
+
+    text = _DAY_MONTH_RE.sub(lambda match: _day_month(match, *match.groups()), text)
+    text = _MONTH_DAY_RE.sub(lambda match: _day_month(match, match.group(2), match.group(1), match.group(3)), text)
+    text = _DAY_RE.sub(_day, text)
+    text = _RELATIVE_DAY_RE.sub(lambda match: (today + timedelta(days=match.group(1) == "tomorrow")).isoformat(), text)
+    text = _WEEK_RE.sub(_week, text)
+    text = _WEEKDAY_OF_DATE_RE.sub("", text)
+    return _WEEKDAY_RE.sub(_weekday, text)
+
+
+def canonicalise(command: str, today: date | None = None,
+                 is_name: Callable[[str], bool] | None = None) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """
+    The canonical form of a command: the entities, the dates with relative dates resolved, the numbers, the names,
+    the timeslots and ids like a room id, and the stems of the other words without the stopwords. Commands that ask
+    the same in other words, like "check Bob's availability next week" and "is Bob available the week of the 19th",
+    get the same canonical form. Without is_name, no word is taken for a name.
+    """
+    today = today or date.today()
+    is_name = is_name or (lambda token: False)
+    text = resolve_dates(" ".join(command.lower().split()), today)
+    entities, words = set(), set()
+    for token in _TOKEN_RE.findall(text):
+        if re.fullmatch(r'\d{4}-\d{2}-\d{2}', token):
+            entities.add(f"date:{token}")
+        elif token.isdigit():
+            entities.add(f"number:{int(token)}")
+        elif token in WORD_NUMBERS:
+            entities.add(f"number:{WORD_NUMBERS[token]}")
+        elif token in TIMESLOTS:
+            entities.add(f"timeslot:{token}")
+        elif is_name(token):
+            entities.add(f"name:{token}")
+        elif re.search(r'[\d_]', token):
+            entities.add(f"id:{token}")
+        elif token not in STOPWORDS:
+            # The first letters of the stem, so "availability" and "available" are the same word
+            words.update(stem[:5] for stem in tokenize(token))
+    return tuple(sorted(entities)), tuple(sorted(words))
+
+
+def invalidation_tags(entities: tuple[str, ...]) -> set[str]:
+    """
+    The entities a booking can change: the names, the ids and the weeks of the dates.
+    """
+    tags = set()
+    for entity in entities:
+        kind, value = entity.split(":", 1)
+        if kind == "date":
+            tags.add(f"week:{week_start(parse_date(value)).isoformat()}")
+        elif kind in ("name", "id"):
+            tags.add(entity)
+    return tags
+
+
+def _cosine(words: tuple[str, ...], other: tuple[str, ...]) -> float:
+    if not words or not other:
+        return float(words == other)
+    counts, other_counts = Counter(words), Counter(other)
+    dot = sum(count * other_counts[word] for word, count in counts.items())
+    return dot / math.sqrt(sum(count * count for count in counts.values()) *
+                           sum(count * count for count in other_counts.values()))
+
+
+class AgentResultCache:
+    """
+    Caches the results of the agents that the orchestrator calls, by the canonical form of the command, so a sub
+    question in other words does not run the ReAct loop of the agent again. With similarity, a command with the
+    same entities and words that are similar enough, by the cosine of the word counts, also gets the cached result.
+
+    Only results of commands that called at least one read-only action and no action that failed or has side
+    effects are cached, so an answer about a failure or a write that never ran is not given again. A command that
+    called an action with side effects, like a booking, removes the cached results for the same people, ids and
+    weeks. A command that contains the first word of such an action, like "book", is never answered from the
+    cache. The entries have a time to live in seconds, the other writers of the data are not seen by the cache.
+
+    The names in a command are found with is_name, or else with the is_name of the agent, like the schedule
+    manager that knows the people of the store.
+    """
+    def __init__(self, ttl: float | None = 60, max_entries: int = 1024, similarity: float | None = None,
+                 is_name: Callable[[str], bool] | None = None):
+        self.log = logging.getLogger("main.AgentResultCache")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.is_name = is_name
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __expired(self, created: float) -> bool:
+        return self.ttl is not None and time.monotonic() - created > self.ttl
+
+    def get(self, agent: str, command: str, is_name: Callable[[str], bool] | None = None):
+        entities, words = canonicalise(command, is_name=self.is_name or is_name)
+        key, similar = (agent, entities, words), False
+        if key not in self._entries and self.similarity is not None:
+            score, closest = max(((_cosine(words, other[2]), other) for other in self._entries
+                                  if other[:2] == key[:2]), default=(0.0, None))
+            if score >= self.similarity:
+                key, similar = closest, True
+        entry = self._entries.get(key)
+        if entry is not None and self.__expired(entry[1]):
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.similar_hits += similar
+        return entry[0]
+
+    def put(self, agent: str, command: str, result, is_name: Callable[[str], bool] | None = None):
+        entities, words = canonicalise(command, is_name=self.is_name or is_name)
+        self._entries[(agent, entities, words)] = (result, time.monotonic(), invalidation_tags(entities))
+        self._entries.move_to_end((agent, entities, words))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, command: str, is_name: Callable[[str], bool] | None = None):
+        """
+        Removes the results for the people, ids and weeks in the command, after it changed them.
+        """
+        tags = invalidation_tags(canonicalise(command, is_name=self.is_name or is_name)[0])
+        stale = [key for key, (_, _, entry_tags) in self._entries.items() if not tags or entry_tags & tags]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        if stale:
+            self.log.info("Removed %d cached results after: %s", len(stale), command)
+
+    async def call(self, agent, command: str, run: Callable[[], Awaitable]):
+        """
+        The cached result of the command for the ActionAgent, or the result of run, which calls the agent.
+        """
+        verbs = {action.split("_")[0] for action, definition in agent.action_definitions.items()
+                 if not is_idempotent(definition)}
+        if verbs.isdisjoint(tokenize(command)):
+            result = self.get(agent.name, command, agent.is_name)
+            if result is not None:
+                self.log.info("Cached result for %s: %s", agent.name, command)
+                current_span().set(agent_cache=True)
+                return result
+
+        commands = agent.commands
+        result = await run()
+        if agent.commands != commands + 1:
+            # The result of the same command of another question in the batch, the counts of the agent are not for it
+            return result
+        if agent.side_effects:
+            self.invalidate(command, agent.is_name)
+        elif agent.read_actions and not agent.failed_actions and not isinstance(result, PartialAnswer):
+            self.put(agent.name, command, result, agent.is_name)
+        return result
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,255 @@
+import bisect
+from datetime import date, datetime, timedelta
+
+TIMESLOTS = ("morning", "afternoon")
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def parse_date(value: str | date) -> date:
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value.strip()[:10], "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}, use the format YYYY-MM-DD") from None
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def weekly_bits(pattern: dict[str, tuple[str, ...]]) -> int:
+    """
+    The bits of one week, starting on Monday, for a pattern like {"Monday": ("afternoon",), "Wednesday": TIMESLOTS}.
+    """
+    bits = 0
+    for weekday, timeslots in pattern.items():
+        for timeslot in timeslots:
+            bits |= 1 << (WEEKDAYS.index(weekday) * len(TIMESLOTS) + TIMESLOTS.index(timeslot))
+    return bits
+
+
+def join_words(words: list[str]) -> str:
+    if len(words) < 2:
+        return "".join(words)
+    return ", ".join(words[:-1]) + " and " + words[-1]
+
+
+def describe_slots(slots: list[tuple[date, str]]) -> str:
+    """
+    The slots as text for the model, like "Monday, Tuesday morning and Thursday afternoon".
+    """
+    days = {}
+    for day, timeslot in slots:
+        days.setdefault(day, []).append(timeslot)
+    return join_words([WEEKDAYS[day.weekday()] + ("" if len(timeslots) == len(TIMESLOTS) else f" {timeslots[0]}")
+                       for day, timeslots in days.items()])
+
+
+class AvailabilityStore:
+    """
+    The availability of people and rooms, with two timeslots per day. Every person and every room has a bitset of
+    free slots: a Python int with bit i set when slot i, counted from the Monday of start, is free. A week is 14
+    bits, so the free slots of a group of people in a week are one and over their bitsets.
+
+    Rooms are also indexed per slot, with a bitset of the free rooms, and by capacity, with a bitset of the rooms
+    that have at least a number of seats. Finding a room for a slot is an and of those two bitsets.
+    """
+    def __init__(self, start: str | date | None = None):
+        self.start = week_start(parse_date(start) if start is not None else date.today())
+        self._people = {}
+        self._names = {}
+        self._room_ids = []
+        self._room_index = {}
+        self._capacities = []
+        self._room_slots = []
+        self._free_rooms = {}
+        self._by_capacity = []
+        self._capacity_masks = {}
+
+    def slot(self, day: str | date, timeslot: str) -> int:
+        index = (parse_date(day) - self.start).days * len(TIMESLOTS)
+        if index < 0:
+            raise ValueError(f"No availability before {self.start}")
+        try:
+            return index + TIMESLOTS.index(timeslot.strip().lower())
+        except ValueError:
+            raise ValueError(f"Unknown timeslot: {timeslot}, use one of {', '.join(TIMESLOTS)}") from None
+
+    def __slots_from_bits(self, bits: int, first: int) -> list[tuple[date, str]]:
+        slots = []
+        while bits:
+            lowest = bits & -bits
+            index = first + lowest.bit_length() - 1
+            slots.append((self.start + timedelta(days=index // len(TIMESLOTS)), TIMESLOTS[index % len(TIMESLOTS)]))
+            bits ^= lowest
+        return slots
+
+    def __window(self, day: str | date, days: int) -> tuple[int, int]:
+        first = self.slot(day, TIMESLOTS[0])
+        return first, (1 << (days * len(TIMESLOTS))) - 1
+
+    # People
+
+    def has_person(self, name: str) -> bool:
+        return name.strip().lower() in self._people
+
+    def name(self, name: str) -> str:
+        """
+        The name of the person as it was added.
+        """
+        return self._names[self.__person_key(name)]
+
+    def __person_key(self, name: str) -> str:
+        key = name.strip().lower()
+        if key not in self._people:
+            raise KeyError(f"Unknown person: {name}")
+        return key
+
+    def add_person(self, name: str, weekly: int = 0, weeks: int = 0):
+        """
+        Adds a person, free in the slots of the weekly bits for the given number of weeks from the start.
+        """
+        key = name.strip().lower()
+        self._names[key] = name.strip()
+        self._people[key] = sum(weekly << (week * 7 * len(TIMESLOTS)) for week in range(weeks))
+
+    def set_person_free(self, name: str, day: str | date, timeslot: str, free: bool = True):
+        key = self.__person_key(name)
+        bit = 1 << self.slot(day, timeslot)
+        self._people[key] = self._people[key] | bit if free else self._people[key] & ~bit
+
+    def book_person(self, name: str, day: str | date, timeslot: str) -> bool:
+        """
+        Books the person for the slot, returns False when the person is not free.
+        """
+        key = self.__person_key(name)
+        bit = 1 << self.slot(day, timeslot)
+        if not self._people[key] & bit:
+            return False
+        self._people[key] &= ~bit
+        return True
+
+    def free_slots(self, names: list[str], day: str | date, days: int = 7) -> list[tuple[date, str]]:
+        """
+        The slots in which all people are free, in the days from day on. Raises a KeyError for an unknown person.
+        """
+        first, mask = self.__window(day, days)
+        bits = mask
+        for name in names:
+            bits &= self._people[self.__person_key(name)] >> first
+        return self.__slots_from_bits(bits, first)
+
+    # Rooms
+
+    def add_room(self, room_id: str, capacity: int, weekly: int = 0, weeks: int = 0):
+        """
+        Adds a room, free in the slots of the weekly bits for the given number of weeks from the start.
+        """
+        index = len(self._room_ids)
+        self._room_ids.append(room_id)
+        self._room_index[room_id] = index
+        self._capacities.append(capacity)
+        self._room_slots.append(0)
+        bisect.insort(self._by_capacity, (capacity, index))
+        self._capacity_masks.clear()
+        for week in range(weeks):
+            for bit in range(7 * len(TIMESLOTS)):
+                if weekly >> bit & 1:
+                    self.__set_room_slot(index, week * 7 * len(TIMESLOTS) + bit, True)
+
+    def __set_room_slot(self, index: int, slot: int, free: bool):
+        if free:
+            self._room_slots[index] |= 1 << slot
+            self._free_rooms[slot] = self._free_rooms.get(slot, 0) | 1 << index
+        else:
+            self._room_slots[index] &= ~(1 << slot)
+            self._free_rooms[slot] = self._free_rooms.get(slot, 0) & ~(1 << index)
+
+    def __first_with_capacity(self, number_of_people: int) -> int:
+        return bisect.bisect_left(self._by_capacity, (number_of_people, -1))
+
+    def __capacity_mask(self, number_of_people: int) -> int:
+        mask = self._capacity_masks.get(number_of_people)
+        if mask is None:
+            mask = 0
+            for _, index in self._by_capacity[self.__first_with_capacity(number_of_people):]:
+                mask |= 1 << index
+            self._capacity_masks[number_of_people] = mask
+        return mask
+
+    def capacity(self, room_id: str) -> int:
+        return self._capacities[self._room_index[room_id]]
+
+    def has_room(self, room_id: str) -> bool:
+        return room_id in self._room_index
+
+    def room_free_slots(self, room_id: str, day: str | date, days: int = 7) -> list[tuple[date, str]]:
+        first, mask = self.__window(day, days)
+        return self.__slots_from_bits(self._room_slots[self._room_index[room_id]] >> first & mask, first)
+
+    def set_room_free(self, room_id: str, day: str | date, timeslot: str, free: bool = True):
+        self.__set_room_slot(self._room_index[room_id], self.slot(day, timeslot), free)
+
+    def find_rooms(self, day: str | date, timeslot: str, number_of_people: int, limit: int | None = None) -> list[str]:
+        """
+        The free rooms with at least number_of_people seats, the smallest rooms first.
+        """
+        rooms = self._free_rooms.get(self.slot(day, timeslot), 0) & self.__capacity_mask(number_of_people)
+        found = []
+        for _, index in self._by_capacity[self.__first_with_capacity(number_of_people):]:
+            if not rooms or (limit is not None and len(found) >= limit):
+                break
+            if rooms >> index & 1:
+                found.append(self._room_ids[index])
+                rooms &= ~(1 << index)
+        return found
+
+    def book_room(self, room_id: str, day: str | date, timeslot: str) -> bool:
+        """
+        Books the room for the slot, returns False when the room is not free.
+        """
+        index = self._room_index[room_id]
+        slot = self.slot(day, timeslot)
+        if not self._room_slots[index] >> slot & 1:
+            return False
+        self.__set_room_slot(index, slot, False)
+        return True
+
+    def stats(self) -> dict:
+        return {"people": len(self._people), "rooms": len(self._room_ids), "start": self.start.isoformat()}
+
+
+DEMO_WEEKS = 104
+
+
+def load_demo_data(store: AvailabilityStore, weeks: int = DEMO_WEEKS):
+    """
+    The people and rooms of the examples, with the same availability every week.
+    """
+    store.add_person("Alice")
+    store.add_person("Bob", weekly_bits({"Monday": TIMESLOTS, "Tuesday": TIMESLOTS, "Thursday": TIMESLOTS}), weeks)
+    store.add_person("Charlie", weekly_bits({"Monday": ("afternoon",), "Wednesday": TIMESLOTS,
+                                             "Friday": ("afternoon",)}), weeks)
+    workdays = weekly_bits({weekday: TIMESLOTS for weekday in WEEKDAYS[:5]})
+    for capacity in (4, 8, 12, 20):
+        store.add_room(f"max_{capacity}_people", capacity, workdays, weeks)
+
+
+_default_store: AvailabilityStore | None = None
+
+
+def get_default_store() -> AvailabilityStore:
+    """
+    Returns the store used by the actions, with the demo data from a year back to a year ahead.
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = AvailabilityStore(start=date.today() - timedelta(weeks=DEMO_WEEKS // 2))
+        load_demo_data(_default_store)
+    return _default_store
+
+
+def set_default_store(store: AvailabilityStore):
+    global _default_store
+    _default_store = store
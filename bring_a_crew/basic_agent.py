@@ -1,13 +1,14 @@
 import re
+from datetime import date
 from dotenv import load_dotenv
 import logging
 
+from bring_a_crew.availability import TIMESLOTS, WEEKDAYS, AvailabilityStore, describe_slots, week_start, weekly_bits
+from bring_a_crew.budget import PartialAnswer
+from bring_a_crew.llm_backend import DEFAULT_MODEL, LLMBackend, get_default_backend
 from bring_a_crew.setup_logging import setup_logging
-from ollama import chat
 from ollama import ChatResponse
 
-MODEL = 'phi4'
-
 
 def create_system_prompt(actions):
     actions_str = "\n".join([f" - `{action}`; for {value["description"]}" for action, value in actions.items()])
@@ -56,7 +57,7 @@ Answer: The average weight for a Bulldog is 40 lbs.
 
 
 class Agent:
-    def __init__(self, system="", actions=None):
+    def __init__(self, system="", actions=None, backend: LLMBackend | None = None, model: str = DEFAULT_MODEL):
         self.log = logging.getLogger("main.Agent")
         self.log.info("Initializing Agent")
 
@@ -72,6 +73,8 @@ class Agent:
             for action, value in actions.items():
                 self.known_actions[action] = value["function"]
 
+        self.backend = backend if backend is not None else get_default_backend()
+        self.model = model
         self.max_turns = 10
         self.action_re = re.compile(r'^Action: (\w+): (.*)$')
         self.answer_re = re.compile(r'^Answer: (.*)$')
@@ -86,6 +89,7 @@ class Agent:
     def ask_question(self, question):
         i = 0
         next_prompt = question
+        observations = []
         while i < self.max_turns:
             i += 1
             result = self.handle_user_message(next_prompt)
@@ -94,8 +98,10 @@ class Agent:
             actions = [self.action_re.match(a) for a in result.split('\n') if self.action_re.match(a)]
             if actions:
                 next_prompt = self.__execute_action(actions)
+                observations.append(next_prompt.removeprefix("Observation: "))
             else:
                 return self.__extract_answer(result)
+        return PartialAnswer("turn limit", observations, i)
 
     def __execute_action(self, actions):
         action, action_input = actions[0].groups()
@@ -120,8 +126,8 @@ class Agent:
             raise Exception("No action or answer found in: {}".format(result))
 
     def __execute(self) -> str:
-        response: ChatResponse = chat(
-            model=MODEL,
+        response: ChatResponse = self.backend.chat_sync(
+            model=self.model,
             messages=self.messages,
             options={
                 "temperature": 0,
@@ -134,30 +140,33 @@ class Agent:
         return response.message.content
 
 
+def create_tutorial_store():
+    store = AvailabilityStore()
+    for name, weekdays in (("Jettro", WEEKDAYS[:2]), ("Daniel", WEEKDAYS[:4]), ("Joey", WEEKDAYS[:5])):
+        store.add_person(name, weekly_bits({weekday: TIMESLOTS for weekday in weekdays}), weeks=52)
+    for room_id, weekdays in (("room 1", WEEKDAYS[:2]), ("room 2", WEEKDAYS[1:4:2]), ("room 3", WEEKDAYS[:5])):
+        store.add_room(room_id, 0, weekly_bits({weekday: TIMESLOTS for weekday in weekdays}), weeks=52)
+    return store
+
+
+tutorial_store = create_tutorial_store()
+
+
 def find_person_availability(name: str):
     main_log.info("Finding person availability for '%s'", name)
-    compare_name = name.lower().strip()
-    if compare_name == "jettro":
-        return "Jettro is available on Monday and Tuesday"
-    elif compare_name == "daniel":
-        return "Daniel is available on Monday till Thursday"
-    elif compare_name == "joey":
-        return "Joey is available from Monday till Friday"
-    else:
+    if not tutorial_store.has_person(name):
         return f"Have no idea about the availability for {name}"
+    slots = tutorial_store.free_slots([name], week_start(date.today()))
+    return f"{tutorial_store.name(name)} is available on {describe_slots(slots)}"
 
 
 def find_meeting_room_availability(name: str):
     main_log.info("Finding meeting room availability for '%s'", name)
-    compare_name = name.lower().strip()
-    if compare_name == "room 1":
-        return "Room 1 is available on Monday and Tuesday"
-    elif compare_name == "room 2":
-        return "Room 2 is available on Tuesday and Thursday"
-    elif compare_name == "room 3":
-        return "Room 3 is available from Monday till Friday"
-    else:
+    room_id = name.lower().strip()
+    if not tutorial_store.has_room(room_id):
         return f"Have no idea about the availability for {name}"
+    slots = tutorial_store.room_free_slots(room_id, week_start(date.today()))
+    return f"{name.strip().capitalize()} is available on {describe_slots(slots)}"
 
 
 def complete_agent(question=None):
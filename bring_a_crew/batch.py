@@ -0,0 +1,126 @@
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable
+
+from bring_a_crew.budget import Budget, PartialAnswer, use_budget
+
+# The batch of the question that is handled by the current task
+_current_batch = contextvars.ContextVar("question_batch", default=None)
+
+_UNSHARED = object()
+
+
+def normalise_text(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+
+class Batch:
+    """
+    The calls to the agents shared by the questions of one batch. When questions send the same command to the same
+    agent, only the first one runs it and the others get its result, also when they ask later in the batch. A
+    result is only shared when the agent did not call an action with side effects, like a booking, and such a call
+    clears the results that were shared so far, because they may be out of date.
+    """
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def share(self, agent: str, command: str, run: Callable[[], Awaitable], shareable: Callable[[], bool]):
+        key = (agent, normalise_text(command))
+        future = self._calls.get(key)
+        if future is not None:
+            result = await asyncio.shield(future)
+            if result is not _UNSHARED:
+                self.shared += 1
+                return result
+            return await run()
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.calls += 1
+        try:
+            result = await run()
+        except BaseException:
+            future.set_result(_UNSHARED)
+            self._calls.pop(key, None)
+            raise
+        if shareable() and not isinstance(result, PartialAnswer):
+            future.set_result(result)
+        else:
+            future.set_result(_UNSHARED)
+            self._calls = {key: call for key, call in self._calls.items() if not call.done()}
+        return result
+
+
+@contextmanager
+def use_batch(batch: Batch):
+    token = _current_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _current_batch.reset(token)
+
+
+async def shared_agent_call(agent: str, command: str, run: Callable[[], Awaitable],
+                            shareable: Callable[[], bool] = lambda: True):
+    """
+    Calls the agent, or takes the result of the same call by another question of the current batch.
+    """
+    batch = _current_batch.get()
+    if batch is None:
+        return await run()
+    return await batch.share(agent, command, run, shareable)
+
+
+async def answer_batch(create_agent: Callable, questions: list[str], concurrency: int = 32,
+                       request_timeout: float | None = None, max_tokens: int | None = None) -> tuple[list, dict]:
+    """
+    Answers a batch of questions, concurrency questions at the same time so the model server gets many requests to
+    batch. Every question is answered, also when it is asked more than once, and the questions share the calls to
+    the agents through a Batch, which never shares a call with side effects like a booking. The tool calls of cacheable actions are already shared by the ToolExecutor. Every
+    question gets a session from create_agent and a Budget with request_timeout and max_tokens.
+
+    Returns the answers in the order of the questions, an exception for a question that failed, and the stats of
+    the batch.
+    """
+    # Imported here, serving imports the orchestration agent which imports this module
+    from bring_a_crew.serving import _isolate
+
+    log = logging.getLogger("main.Batch")
+    batch = Batch()
+    semaphore = asyncio.Semaphore(concurrency)
+    budgets = []
+
+    async def _answer(question):
+        async with semaphore:
+            agent = create_agent()
+            _isolate(agent)
+            budget = Budget(timeout=request_timeout, max_tokens=max_tokens)
+            budgets.append(budget)
+            with use_budget(budget), use_batch(batch):
+                return await agent.acall_agent(question)
+
+    started = time.perf_counter()
+    answers = await asyncio.gather(*[_answer(question) for question in questions], return_exceptions=True)
+    duration = time.perf_counter() - started
+
+    failed = sum(isinstance(answer, BaseException) for answer in answers)
+    tokens = sum(budget.tokens for budget in budgets)
+    stats = {
+        "questions": len(questions),
+        "unique_questions": len({normalise_text(question) for question in questions}),
+        "failed": failed,
+        "partial": sum(isinstance(answer, PartialAnswer) for answer in answers),
+        "duration": duration,
+        "questions_per_second": len(questions) / duration if duration > 0 else None,
+        "llm_calls": sum(budget.turns for budget in budgets),
+        "tokens": tokens,
+        "tokens_per_second": tokens / duration if duration > 0 else None,
+        "agent_calls": batch.calls,
+        "shared_agent_calls": batch.shared
+    }
+    log.info("Answered %d questions in %.1f seconds, %d failed", len(questions), duration, failed)
+    return answers, stats
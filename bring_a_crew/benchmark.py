@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import json
+import statistics
+import time
+from contextlib import aclosing
+from typing import Callable
+
+from bring_a_crew.llm_backend import FakeBackend, LLMBackend
+from bring_a_crew.serving import percentile
+
+# The measurements of the request that is handled by the current task
+_current_request = contextvars.ContextVar("benchmark_request", default=None)
+
+
+class RequestMeasurement:
+    def __init__(self):
+        self.llm_calls = 0
+        self.model_time = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency = 0.0
+
+
+class MeasuringBackend(LLMBackend):
+    """
+    Wraps a backend and adds the time spent waiting for the model and the token counts to the measurement of the
+    request that made the call.
+    """
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+
+    @staticmethod
+    def __record(started: float, response):
+        measurement = _current_request.get()
+        if measurement is None:
+            return
+        measurement.llm_calls += 1
+        measurement.model_time += time.perf_counter() - started
+        measurement.prompt_tokens += response.prompt_eval_count or 0
+        measurement.completion_tokens += response.eval_count or 0
+
+    async def chat(self, model, messages, options=None, keep_alive=None, tools=None):
+        started = time.perf_counter()
+        response = await self.backend.chat(model=model, messages=messages, options=options, keep_alive=keep_alive,
+                                           tools=tools)
+        self.__record(started, response)
+        return response
+
+    async def preload(self, model, keep_alive=None):
+        await self.backend.preload(model, keep_alive=keep_alive)
+
+    async def health(self):
+        return await self.backend.health()
+
+    async def chat_stream(self, model, messages, options=None, keep_alive=None):
+        started = time.perf_counter()
+        last = None
+        stream = self.backend.chat_stream(model=model, messages=messages, options=options, keep_alive=keep_alive)
+        try:
+            async with aclosing(stream) as chunks:
+                async for chunk in chunks:
+                    last = chunk
+                    yield chunk
+        finally:
+            # Also record a stream that is closed early by the agent
+            if last is not None:
+                self.__record(started, last)
+
+
+def demo_corpus(size: int = 16) -> dict:
+    """
+    A corpus of meeting planning questions, with the scripted responses of the orchestrator and the agents.
+    """
+    people = ["Bob", "Alice", "Charlie", "Dave"]
+    dates = ["2026-10-19", "2026-10-26", "2026-11-02", "2026-11-09"]
+    questions = []
+    script = {}
+    for i in range(size):
+        person = people[i % len(people)]
+        date = dates[(i // len(people)) % len(dates)]
+        number_of_people = 2 + i % 6
+        question = (f"Organise a meeting for {number_of_people} people with {person} in the week of {date}, "
+                    f"book a room and order lunch.")
+        availability = f"check availability for {person} in the week of {date}"
+        room = f"book a room for {number_of_people} people on {date} in the morning"
+        room_id = f"max_{number_of_people}_people"
+        lunch = f"prepare lunch for {number_of_people} people on {date} in the morning in room {room_id}"
+        questions.append(question)
+        script[question] = [
+            f"Think: I need to know when {person} is available.\nAction: schedule_manager: {availability}\nPAUSE",
+            f"Think: {person} is available, I need a room.\nAction: room_manager: {room}\nPAUSE",
+            f"Think: The room is booked, I need lunch.\nAction: food_manager: {lunch}\nPAUSE",
+            f"Think: Now I can answer.\nAnswer: The meeting with {person} on {date} is planned, with a room and lunch."
+        ]
+        script[availability] = [
+            f'Think: I check the calendar.\nAction: check_availability: {{"date": "{date}", "person": "{person}"}}\nPAUSE',
+            f"Think: I have the availability.\nAnswer: {person} is available on Monday morning."
+        ]
+        script[room] = [
+            f'Think: I book the room.\nAction: book_room: {{"req_date": "{date}", "timeslot": "morning", '
+            f'"number_of_people": {number_of_people}}}\nPAUSE',
+            f"Think: The room is booked.\nAnswer: Room {room_id} is booked."
+        ]
+        script[lunch] = [
+            f'Think: I order lunch.\nAction: prepare_lunch: {{"date": "{date}", "timeslot": "morning", '
+            f'"number_of_people": {number_of_people}, "room_id": "{room_id}"}}\nPAUSE',
+            "Think: Lunch is ordered.\nAnswer: Lunch is ordered."
+        ]
+    return {"questions": questions, "script": script}
+
+
+def _summarise(concurrency: int, wall_time: float, measurements: list[RequestMeasurement]) -> dict:
+    latencies = [m.latency for m in measurements]
+    turns = sum(m.llm_calls for m in measurements)
+    return {
+        "concurrency": concurrency,
+        "questions": len(measurements),
+        "wall_time": wall_time,
+        "throughput_qps": len(measurements) / wall_time if wall_time else None,
+        "latency": {f"p{q}": percentile(latencies, q) for q in (50, 90, 99)},
+        "turns_per_question": turns / len(measurements),
+        "prompt_tokens_per_turn": sum(m.prompt_tokens for m in measurements) / turns if turns else None,
+        "completion_tokens_per_turn": sum(m.completion_tokens for m in measurements) / turns if turns else None,
+        "model_time_per_question": statistics.mean(m.model_time for m in measurements),
+        "python_time_per_question": statistics.mean(max(0.0, m.latency - m.model_time) for m in measurements)
+    }
+
+
+async def run_level(run_question: Callable, questions: list[str], concurrency: int) -> dict:
+    """
+    Answers all questions with at most concurrency questions at the same time.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    measurements = []
+
+    async def _run(question):
+        async with semaphore:
+            measurement = RequestMeasurement()
+            _current_request.set(measurement)
+            started = time.perf_counter()
+            await run_question(question)
+            measurement.latency = time.perf_counter() - started
+            measurements.append(measurement)
+
+    started = time.perf_counter()
+    # Every question runs in its own task, with its own copy of the context
+    await asyncio.gather(*[asyncio.create_task(_run(question)) for question in questions])
+    return _summarise(concurrency, time.perf_counter() - started, measurements)
+
+
+def run_benchmark(create_runner: Callable[[LLMBackend], Callable], corpus: dict,
+                  concurrency_levels=(1, 8, 64, 256), questions_per_level: int | None = None,
+                  latency: float = 0.05, tokens_per_second: float | None = 200.0,
+                  output: str | None = None) -> dict:
+    """
+    Runs the corpus against a FakeBackend for every concurrency level. create_runner receives the backend and
+    returns an async function that answers one question. The results are written as json to output.
+    """
+    backend = MeasuringBackend(FakeBackend(corpus["script"], latency=latency, tokens_per_second=tokens_per_second))
+    run_question = create_runner(backend)
+
+    levels = []
+    for concurrency in concurrency_levels:
+        count = questions_per_level or max(len(corpus["questions"]), 2 * concurrency)
+        questions = [corpus["questions"][i % len(corpus["questions"])] for i in range(count)]
+        levels.append(asyncio.run(run_level(run_question, questions, concurrency)))
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"latency": latency, "tokens_per_second": tokens_per_second},
+        "levels": levels
+    }
+    if output is not None:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
@@ -0,0 +1,152 @@
+import asyncio
+import contextvars
+import json
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable
+
+# The budget of the request that is handled by the current task
+_current_budget = contextvars.ContextVar("request_budget", default=None)
+
+
+class Budget:
+    """
+    The limits of one request, shared by the orchestrator and the agents it calls: a deadline in seconds from now,
+    a number of tokens and a number of LLM calls. Every LLM call of the request counts against the budget. An agent
+    checks the budget before every turn and stops with a PartialAnswer when it is used up, it also stops when the
+    time left is shorter than an average LLM call, instead of starting a turn that cannot finish.
+    """
+    def __init__(self, timeout: float | None = None, max_tokens: int | None = None, max_turns: int | None = None,
+                 smoothing: float = 0.3):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.smoothing = smoothing
+        self.tokens = 0
+        self.turns = 0
+        self.turn_time = None
+
+    def remaining(self) -> float | None:
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+    def record(self, tokens: int, duration: float):
+        self.tokens += tokens
+        self.turns += 1
+        self.turn_time = duration if self.turn_time is None else (
+            self.smoothing * duration + (1 - self.smoothing) * self.turn_time)
+
+    def exhausted(self) -> str | None:
+        """
+        The reason to stop, or None when there is budget for another turn.
+        """
+        remaining = self.remaining()
+        if remaining is not None and (remaining <= 0 or (self.turn_time is not None and remaining < self.turn_time)):
+            return "deadline"
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return "token budget"
+        if self.max_turns is not None and self.turns >= self.max_turns:
+            return "turn budget"
+        return None
+
+    def stats(self) -> dict:
+        return {"tokens": self.tokens, "turns": self.turns, "remaining": self.remaining()}
+
+
+def current_budget() -> Budget | None:
+    return _current_budget.get()
+
+
+@contextmanager
+def use_budget(budget: Budget):
+    """
+    Makes the budget the budget of the current task, the tasks it starts share it.
+    """
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+async def within_deadline(run: Callable[[], Awaitable]):
+    """
+    Runs the call, with a TimeoutError when the deadline of the current budget passes first.
+    """
+    budget = _current_budget.get()
+    remaining = budget.remaining() if budget is not None else None
+    if remaining is None:
+        return await run()
+    async with asyncio.timeout(max(remaining, 0.0)):
+        return await run()
+
+
+def record_llm_call(tokens: int, duration: float):
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.record(tokens, duration)
+
+
+class PartialAnswer(str):
+    """
+    The result of an agent that stopped before it found the answer, because the budget of the request was used
+    up, the turn limit of the agent was reached or the agent kept repeating an action. It is the text for the user
+    or the orchestrator, with the reason, the number of turns and the observations collected so far as attributes.
+    """
+    complete = False
+
+    def __new__(cls, reason: str, observations: list[str] | None = None, turns: int = 0):
+        # The partial answers of the agents that were called are flattened into their observations
+        observations = [item for observation in observations or []
+                        for item in (observation.observations if isinstance(observation, PartialAnswer)
+                                     else [str(observation)])]
+        text = f"I could not finish, the {reason} was reached."
+        if observations:
+            text += " What I found so far: " + " ".join(observations)
+        answer = super().__new__(cls, text)
+        answer.reason = reason
+        answer.observations = observations
+        answer.turns = turns
+        return answer
+
+    def __reduce__(self):
+        return PartialAnswer, (self.reason, self.observations, self.turns)
+
+
+class CycleDetector:
+    """
+    Remembers the actions of one call of an agent with their observations. When the model asks for actions it
+    already ran with the same arguments, the agent gets the earlier observations back instead of running them
+    again; after max_repeats of those repeats the agent is going round in circles and stops.
+    """
+    def __init__(self, max_repeats: int = 1):
+        self.max_repeats = max_repeats
+        self.repeats = 0
+        self._observations = {}
+
+    @staticmethod
+    def __key(action: str, action_input) -> tuple[str, str]:
+        if isinstance(action_input, str):
+            try:
+                action_input = json.loads(action_input)
+            except ValueError:
+                pass
+        if isinstance(action_input, dict):
+            return action, json.dumps(action_input, sort_keys=True, default=str)
+        return action, " ".join(str(action_input).split())
+
+    def repeated(self, actions: list[tuple[str, object]]) -> list[str] | None:
+        """
+        The earlier observations when all actions ran before, otherwise None.
+        """
+        keys = [self.__key(action, action_input) for action, action_input in actions]
+        if not keys or any(key not in self._observations for key in keys):
+            return None
+        self.repeats += 1
+        return [self._observations[key] for key in keys]
+
+    def cycling(self) -> bool:
+        return self.repeats > self.max_repeats
+
+    def record(self, actions: list[tuple[str, object]], observations: list[str]):
+        for (action, action_input), observation in zip(actions, observations):
+            self._observations[self.__key(action, action_input)] = observation
@@ -0,0 +1,200 @@
+import contextvars
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable
+
+from bring_a_crew.budget import PartialAnswer
+from bring_a_crew.tracing import current_span
+
+_MISSING = object()
+
+# The journal of the request that is handled by the current task
+_current_journal = contextvars.ContextVar("checkpoint_journal", default=None)
+
+
+class Journal:
+    """
+    The checkpoints of one request. Every agent numbers its steps, an LLM call or a tool call, within the request.
+    When a step is found in the journal, its recorded result is returned instead of calling the LLM or the tool
+    again. A resumed request therefore replays the completed turns, which rebuilds the memory of the agents, and
+    continues live from the first step that was not completed.
+    """
+    def __init__(self, store: "CheckpointStore", request_id: str, entries: dict):
+        self.store = store
+        self.request_id = request_id
+        self._entries = entries
+        self._steps = {}
+        self.replayed = 0
+
+    def next_step(self, agent: str) -> int:
+        step = self._steps.get(agent, 0)
+        self._steps[agent] = step + 1
+        return step
+
+    def get(self, agent: str, step: int, phase: str = "done"):
+        return self._entries.get((agent, step, phase), _MISSING)
+
+    def record(self, agent: str, step: int, kind: str, data, phase: str = "done"):
+        self._entries[(agent, step, phase)] = data
+        self.store.append(self.request_id, agent, step, phase, kind, data)
+
+
+def current_journal() -> Journal | None:
+    return _current_journal.get()
+
+
+async def checkpointed(agent: str, kind: str, run: Callable[[], Awaitable], write_ahead: bool = False,
+                       interrupted: Callable[[], object] | None = None):
+    """
+    Runs a step of the agent and records its result in the journal of the current request. A step that was
+    recorded before returns the recorded result. With write_ahead, the start of the step is recorded before it
+    runs; when a resumed request finds a start without a result, the step is not run again and the result of
+    interrupted is returned instead. Use it for tools with side effects, like a booking.
+    """
+    journal = _current_journal.get()
+    if journal is None:
+        return await run()
+
+    step = journal.next_step(agent)
+    result = journal.get(agent, step)
+    if result is not _MISSING:
+        journal.replayed += 1
+        current_span().set(replayed=True)
+        return result
+    if write_ahead:
+        if journal.get(agent, step, "start") is not _MISSING:
+            result = interrupted()
+            journal.record(agent, step, kind, result)
+            return result
+        journal.record(agent, step, kind, None, phase="start")
+
+    result = await run()
+    journal.record(agent, step, kind, result)
+    return result
+
+
+def encode_answer(answer) -> str:
+    """
+    The answer as json. A PartialAnswer keeps its reason, observations and turns, so it is still partial when the
+    answer is read back.
+    """
+    if isinstance(answer, PartialAnswer):
+        return json.dumps({"partial": {"reason": answer.reason, "observations": answer.observations,
+                                       "turns": answer.turns}})
+    return json.dumps({"answer": answer}, default=str)
+
+
+def decode_answer(data: str):
+    document = json.loads(data)
+    if isinstance(document, dict) and "partial" in document:
+        partial = document["partial"]
+        return PartialAnswer(partial["reason"], partial["observations"], partial["turns"])
+    if isinstance(document, dict) and "answer" in document:
+        return document["answer"]
+    # Answers stored before the answers were wrapped
+    return document
+
+
+class CheckpointStore:
+    """
+    An append-only log of the steps of requests in an SQLite database. A step is written as soon as it completes,
+    so a request that is interrupted by a crash or a restart can be resumed with the same request id. The log of
+    a request is kept until it is removed with forget or prune, the answer of a finished request is returned
+    again for the same request id.
+    """
+    def __init__(self, path: str = "checkpoints.db"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Every commit is a checkpoint, the write-ahead log keeps them cheap and survives a crash of the process
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS requests (request_id TEXT PRIMARY KEY, question TEXT, answer TEXT, "
+            "created REAL, finished REAL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS steps (request_id TEXT, agent TEXT, step INTEGER, phase TEXT, kind TEXT, "
+            "data TEXT, created REAL, PRIMARY KEY (request_id, agent, step, phase))")
+        self._db.commit()
+
+    def append(self, request_id: str, agent: str, step: int, phase: str, kind: str, data):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (request_id, agent, step, phase, kind, json.dumps(data, default=str), time.time()))
+            self._db.commit()
+
+    @contextmanager
+    def journal(self, request_id: str, question: str | None = None):
+        """
+        Makes the journal of the request the journal of the current task, the steps that were recorded before are
+        loaded for replay.
+        """
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO requests (request_id, question, created) VALUES (?, ?, ?)",
+                             (request_id, question, time.time()))
+            self._db.commit()
+            rows = self._db.execute("SELECT agent, step, phase, data FROM steps WHERE request_id = ?",
+                                    (request_id,)).fetchall()
+        journal = Journal(self, request_id, {(agent, step, phase): json.loads(data)
+                                             for agent, step, phase, data in rows})
+        token = _current_journal.set(journal)
+        try:
+            yield journal
+        finally:
+            _current_journal.reset(token)
+
+    async def run(self, request_id: str, question: str, answer_question: Callable[[str], Awaitable[str]]) -> str:
+        """
+        Answers the question with checkpoints, or resumes the request when it was started before. A finished
+        request returns its answer without running again.
+        """
+        answer = self.answer(request_id)
+        if answer is not None:
+            return answer
+        with self.journal(request_id, question):
+            answer = await answer_question(question)
+        with self._lock:
+            self._db.execute("UPDATE requests SET answer = ?, finished = ? WHERE request_id = ?",
+                             (encode_answer(answer), time.time(), request_id))
+            self._db.commit()
+        return answer
+
+    def answer(self, request_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT answer FROM requests WHERE request_id = ? AND finished IS NOT NULL",
+                                   (request_id,)).fetchone()
+        return decode_answer(row[0]) if row is not None else None
+
+    def unfinished(self) -> list[tuple[str, str]]:
+        """
+        The request id and question of the requests that were started and did not finish.
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT request_id, question FROM requests WHERE finished IS NULL ORDER BY created").fetchall()
+
+    def prune(self, max_age: float = 86400.0) -> int:
+        """
+        Removes the finished requests that are older than max_age seconds, returns the number of requests removed.
+        """
+        with self._lock:
+            request_ids = [row[0] for row in self._db.execute(
+                "SELECT request_id FROM requests WHERE finished IS NOT NULL AND finished < ?",
+                (time.time() - max_age,))]
+            for request_id in request_ids:
+                self._db.execute("DELETE FROM steps WHERE request_id = ?", (request_id,))
+                self._db.execute("DELETE FROM requests WHERE request_id = ?", (request_id,))
+            self._db.commit()
+        return len(request_ids)
+
+    def forget(self, request_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM steps WHERE request_id = ?", (request_id,))
+            self._db.execute("DELETE FROM requests WHERE request_id = ?", (request_id,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
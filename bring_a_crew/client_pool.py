@@ -0,0 +1,69 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+from typing import Callable
+
+
+class AsyncClientPool:
+    """
+    A bounded pool of async clients, by default ollama AsyncClient connections shared by all agents. The size of
+    the pool limits the number of concurrent requests to the server, other callers wait until a client is
+    returned. Clients are bound to an event loop, therefore the pool keeps a separate set of clients for each
+    running loop.
+    """
+    def __init__(self, size: int = 8, host: str | None = None, client_factory: Callable[[], object] | None = None):
+        if size < 1:
+            raise ValueError("The size of the pool must be at least 1")
+        self.size = size
+        self.host = host
+        self.client_factory = client_factory if client_factory is not None else self.__ollama_client
+        self._queues = weakref.WeakKeyDictionary()
+
+    def __ollama_client(self):
+        # Imported on first use, importing ollama is a large part of the startup time
+        from ollama import AsyncClient
+        return AsyncClient(host=self.host)
+
+    def __queue(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        queue = self._queues.get(loop)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.size)
+            # Clients are created lazily, the first time a slot is used
+            for _ in range(self.size):
+                queue.put_nowait(None)
+            self._queues[loop] = queue
+        return queue
+
+    @asynccontextmanager
+    async def client(self):
+        """
+        Borrow a client from the pool, waits when all clients are in use.
+        """
+        queue = self.__queue()
+        client = await queue.get()
+        if client is None:
+            client = self.client_factory()
+        try:
+            yield client
+        finally:
+            queue.put_nowait(client)
+
+
+_default_pool: AsyncClientPool | None = None
+
+
+def get_default_pool() -> AsyncClientPool:
+    """
+    Returns the pool that is shared by all agents that are not given a pool of their own.
+    """
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = AsyncClientPool()
+    return _default_pool
+
+
+def set_default_pool(pool: AsyncClientPool):
+    global _default_pool
+    _default_pool = pool
@@ -0,0 +1,140 @@
+import logging
+import re
+
+from bring_a_crew.tool_executor import is_idempotent
+
+# The groups for the intents of the agents. Every manager has FAST_PATH_INTENTS for the commands the orchestrator
+# sends most, with an exact date, those do not need the LLM.
+DATE_PATTERN = r'\d{4}-\d{2}-\d{2}'
+TIMESLOT_PATTERN = r'morning|afternoon'
+
+_DATE_RE = re.compile(rf'^{DATE_PATTERN}$')
+_CONVERTERS = {"int": int, "float": float, "str": str}
+
+
+def normalise_command(command: str) -> str:
+    return " ".join(command.split()).rstrip(".?!")
+
+
+class Intent:
+    """
+    A kind of command that is answered by one action, without the LLM. The pattern has to match the whole
+    command, ignoring case, with single spaces and without a final period or question mark. The named groups of
+    the pattern are the arguments of the action, the defaults fill in the arguments the command does not name.
+    """
+    def __init__(self, action: str, pattern: str | re.Pattern, defaults: dict | None = None):
+        self.action = action
+        self.pattern = re.compile(pattern, re.IGNORECASE) if isinstance(pattern, str) else pattern
+        self.defaults = defaults or {}
+
+    def arguments(self, command: str) -> dict | None:
+        match = self.pattern.fullmatch(command)
+        if match is None:
+            return None
+        return {**self.defaults, **{name: value for name, value in match.groupdict().items() if value is not None}}
+
+
+class FastPath:
+    """
+    Answers the commands it recognises by calling the action directly, the observation of the action is the
+    answer. A command only takes the fast path when an intent matches the whole command and all arguments of the
+    action are found and have the right type; everything else goes to the LLM as before.
+
+    With learn, the fast path also learns intents from the commands the LLM answered with a single successful call
+    of a read-only action: the values of the arguments are replaced by groups in a pattern of the command. A
+    learned pattern is used once min_examples commands with that pattern led to the same action. Actions with side
+    effects, like a booking, only take the fast path with an intent that is given explicitly.
+    """
+    def __init__(self, intents: list[Intent] | None = None, learn: bool = False, min_examples: int = 2):
+        self.log = logging.getLogger("main.FastPath")
+        self.intents = list(intents or [])
+        self.learn = learn
+        self.min_examples = min_examples
+        self._examples = {}
+        self.matches = 0
+        self.misses = 0
+
+    def match(self, command: str, definitions: dict) -> tuple[str, dict] | None:
+        """
+        The action and the arguments for the command, or None when the command is not recognised.
+        """
+        text = normalise_command(command)
+        for intent in self.intents:
+            definition = definitions.get(intent.action)
+            arguments = intent.arguments(text) if definition is not None else None
+            if arguments is not None:
+                arguments = self.__convert(arguments, definition)
+            if arguments is not None:
+                self.matches += 1
+                return intent.action, arguments
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def __convert(arguments: dict, definition: dict) -> dict | None:
+        converted = {}
+        for argument in definition.get("arguments", []):
+            if argument["name"] not in arguments:
+                return None
+            try:
+                converted[argument["name"]] = _CONVERTERS.get(argument["type"], str)(arguments[argument["name"]])
+            except ValueError:
+                return None
+        return converted
+
+    def observe(self, command: str, action: str, arguments: dict, definition: dict):
+        """
+        Records a command that the LLM answered with one successful call of the action, to learn its pattern.
+        """
+        if not self.learn or not is_idempotent(definition):
+            return
+        pattern = learn_pattern(normalise_command(command), arguments)
+        if pattern is None:
+            return
+        actions, count = self._examples.get(pattern, (set(), 0))
+        actions.add(action)
+        self._examples[pattern] = (actions, count + 1)
+        # A pattern that led to different actions is not a reliable intent
+        if count + 1 == self.min_examples and len(actions) == 1:
+            self.log.info("Learned the intent %s for %s", pattern, action)
+            self.intents.append(Intent(action, pattern))
+
+    def stats(self) -> dict:
+        return {"intents": len(self.intents), "matches": self.matches, "misses": self.misses}
+
+
+def learn_pattern(command: str, arguments: dict) -> str | None:
+    """
+    The pattern of a normalised command, with a named group for the value of every argument. Returns None when a
+    value is not literally in the command, then the command cannot be answered without the LLM.
+    """
+    spans = []
+    for name, value in arguments.items():
+        if not re.fullmatch(r'\w+', name):
+            return None
+        text = str(value).lower()
+        found = None
+        for match in re.finditer(rf'(?<!\w){re.escape(text)}(?!\w)', command, re.IGNORECASE):
+            if not any(match.start() < end and start < match.end() for start, end, _, _ in spans):
+                found = match
+                break
+        if found is None:
+            return None
+        if _DATE_RE.match(text):
+            group = DATE_PATTERN
+        elif isinstance(value, int):
+            group = r'\d+'
+        elif text in TIMESLOT_PATTERN.split("|"):
+            group = TIMESLOT_PATTERN
+        elif re.fullmatch(r'[\w-]+', text):
+            group = r'[\w-]+'
+        else:
+            return None
+        spans.append((found.start(), found.end(), name, group))
+
+    # In lowercase, so commands that only differ in case count as examples of the same pattern
+    pattern, position = "", 0
+    for start, end, name, group in sorted(spans):
+        pattern += re.escape(command[position:start].lower()) + f"(?P<{name}>{group})"
+        position = end
+    return pattern + re.escape(command[position:].lower())
@@ -1,13 +1,24 @@
 from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.fast_path import DATE_PATTERN, TIMESLOT_PATTERN, FastPath, Intent
+from bring_a_crew.llm_backend import DEFAULT_MODEL
 
-def create_agent():
+FAST_PATH_INTENTS = [
+    Intent("prepare_lunch", rf'(?:prepare|order) lunch for (?P<number_of_people>\d+) (?:people|persons) on (?P<date>{DATE_PATTERN}) (?:in the |at )?(?P<timeslot>{TIMESLOT_PATTERN}) in room (?P<room_id>[\w-]+)'),
+    Intent("prepare_lunch", rf'(?:prepare|order) lunch for (?P<number_of_people>\d+) (?:people|persons) in room (?P<room_id>[\w-]+) on (?P<date>{DATE_PATTERN}) (?:in the |at )?(?P<timeslot>{TIMESLOT_PATTERN})')
+]
+
+
+def create_agent(model: str = DEFAULT_MODEL, fast_path: bool = False):
     return ActionAgent(
         name="food_manager",
+        model=model,
+        fast_path=FastPath(FAST_PATH_INTENTS, learn=True) if fast_path else None,
         intro="This agent prepares and serves food for the meetings. You can book food in a specific room using the id of the room. Always return that it is ok and the booking is received.",
         actions={
             "prepare_lunch": {
                 "description": "Prepare lunch for the number of people in the room on the given date and time.",
                 "function": lambda date, timeslot, number_of_people, room_id: f"Lunch is prepared for {number_of_people} people in room {room_id} on {date} at {timeslot}.".lower(),
+                "inline": True,
                 "arguments": [
                     {"name": "date", "type": "str"},
                     {"name": "timeslot", "type": "str"},
@@ -0,0 +1,315 @@
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+from contextlib import aclosing
+from typing import TYPE_CHECKING, AsyncIterator, Callable
+
+from bring_a_crew.client_pool import AsyncClientPool, get_default_pool
+from bring_a_crew.memory import estimate_tokens
+from bring_a_crew.react_parser import LINE_RE, parse_arguments
+
+# Importing ollama takes a while, it is imported when the first response is created
+if TYPE_CHECKING:
+    from ollama import ChatResponse
+
+DEFAULT_MODEL = 'phi4'
+
+
+class LLMBackend(ABC):
+    """
+    The interface between the agents and an LLM. All backends return ollama ChatResponse objects, so the agents
+    do not have to know which backend they use. The options follow the Ollama names, like temperature and stop.
+    Tools follow the function schema of Ollama and OpenAI, tool calls come back in the message of the response.
+    """
+    @abstractmethod
+    async def chat(self, model: str, messages: list[dict], options: dict | None = None,
+                   keep_alive: float | str | None = None, tools: list[dict] | None = None) -> "ChatResponse":
+        pass
+
+    @abstractmethod
+    def chat_stream(self, model: str, messages: list[dict], options: dict | None = None,
+                    keep_alive: float | str | None = None) -> AsyncIterator["ChatResponse"]:
+        pass
+
+    def chat_sync(self, **kwargs) -> "ChatResponse":
+        """
+        Blocking version of chat, do not call this from a running event loop.
+        """
+        return asyncio.run(self.chat(**kwargs))
+
+    async def preload(self, model: str, keep_alive: float | str | None = None):
+        """
+        Loads the model on the server before the first request, a keep_alive of -1 keeps it loaded. Backends
+        without a model to load do nothing.
+        """
+
+    async def health(self) -> bool:
+        """
+        Returns whether the server can be reached, backends without a server are always healthy.
+        """
+        return True
+
+
+class OllamaBackend(LLMBackend):
+    """
+    Calls an Ollama server, using a pool of AsyncClients.
+    """
+    def __init__(self, pool: AsyncClientPool | None = None):
+        self.pool = pool if pool is not None else get_default_pool()
+
+    async def chat(self, model, messages, options=None, keep_alive=None, tools=None):
+        async with self.pool.client() as client:
+            return await client.chat(model=model, messages=messages, options=options, keep_alive=keep_alive,
+                                     tools=tools)
+
+    async def preload(self, model, keep_alive=None):
+        # Ollama loads the model for a chat request without messages
+        async with self.pool.client() as client:
+            await client.chat(model=model, messages=[], keep_alive=keep_alive)
+
+    async def health(self):
+        try:
+            async with self.pool.client() as client:
+                await client.list()
+            return True
+        except Exception:
+            return False
+
+    async def chat_stream(self, model, messages, options=None, keep_alive=None):
+        # The client stays borrowed until the stream is closed
+        async with self.pool.client() as client:
+            stream = await client.chat(model=model, messages=messages, options=options, keep_alive=keep_alive,
+                                       stream=True)
+            async with aclosing(stream) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Calls an OpenAI compatible server, like OpenAI itself or the /v1 endpoint of Ollama. The api key and base url
+    are taken from the environment when not given.
+    """
+    def __init__(self, base_url: str | None = None, api_key: str | None = None, size: int = 8):
+        from openai import AsyncOpenAI
+
+        self.pool = AsyncClientPool(size=size,
+                                    client_factory=lambda: AsyncOpenAI(base_url=base_url, api_key=api_key))
+
+    async def health(self):
+        try:
+            async with self.pool.client() as client:
+                await client.models.list()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def __messages(messages):
+        # OpenAI links the tool results to the tool calls by id, Ollama uses the order of the messages
+        converted = []
+        call_ids = []
+        for index, message in enumerate(messages):
+            if message["role"] == "tool":
+                converted.append({"role": "tool", "content": message["content"],
+                                  "tool_call_id": call_ids.pop(0) if call_ids else ""})
+            elif message.get("tool_calls"):
+                call_ids = [f"call_{index}_{i}" for i in range(len(message["tool_calls"]))]
+                converted.append({"role": "assistant", "content": message["content"], "tool_calls": [{
+                    "id": call_id,
+                    "type": "function",
+                    "function": {"name": call["function"]["name"],
+                                 "arguments": json.dumps(call["function"]["arguments"])}
+                } for call_id, call in zip(call_ids, message["tool_calls"])]})
+            else:
+                converted.append({"role": message["role"], "content": message["content"]})
+        return converted
+
+    @staticmethod
+    def __arguments(model, messages, options):
+        options = options or {}
+        arguments = dict(model=model, messages=OpenAIBackend.__messages(messages))
+        if "temperature" in options:
+            arguments["temperature"] = options["temperature"]
+        if "stop" in options:
+            arguments["stop"] = options["stop"]
+        return arguments
+
+    async def chat(self, model, messages, options=None, keep_alive=None, tools=None):
+        from ollama import ChatResponse, Message
+
+        arguments = self.__arguments(model, messages, options)
+        if tools:
+            arguments["tools"] = tools
+        async with self.pool.client() as client:
+            completion = await client.chat.completions.create(**arguments)
+        usage = completion.usage
+        message = completion.choices[0].message
+        tool_calls = [Message.ToolCall(function=Message.ToolCall.Function(
+            name=call.function.name, arguments=json.loads(call.function.arguments or "{}")))
+            for call in message.tool_calls or []]
+        return ChatResponse(
+            model=completion.model,
+            done=True,
+            done_reason=completion.choices[0].finish_reason,
+            prompt_eval_count=usage.prompt_tokens if usage else None,
+            eval_count=usage.completion_tokens if usage else None,
+            message=Message(role="assistant", content=message.content or "", tool_calls=tool_calls or None)
+        )
+
+    async def chat_stream(self, model, messages, options=None, keep_alive=None):
+        from ollama import ChatResponse, Message
+
+        async with self.pool.client() as client:
+            stream = await client.chat.completions.create(stream=True,
+                                                          **self.__arguments(model, messages, options))
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    yield ChatResponse(
+                        model=chunk.model,
+                        done=chunk.choices[0].finish_reason is not None,
+                        message=Message(role="assistant", content=chunk.choices[0].delta.content or "")
+                    )
+            finally:
+                await stream.close()
+
+
+class FakeBackend(LLMBackend):
+    """
+    A deterministic stand-in for an LLM that needs no server. The script maps a question, the last user message
+    that is not an Observation, to the responses for the consecutive turns of that question. A function that
+    receives the messages and returns the response can be given instead. Questions that are not in the script
+    get the default response.
+
+    Every call waits latency seconds before the first token, plus the time to generate the response at
+    tokens_per_second. Stop sequences in the options are applied like a real server does. When tools are given,
+    the action lines for those tools in a scripted response are returned as tool calls, so the same script works
+    for the text protocol and for native tool calling. Set down to True to make it fail like a server that cannot
+    be reached.
+    """
+    def __init__(self, script: dict[str, list[str]] | Callable[[list[dict]], str] | None = None,
+                 latency: float = 0.0, tokens_per_second: float | None = None,
+                 default: str = "Answer: I do not know.", chunk_size: int = 16):
+        self.script = script or {}
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.default = default
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.down = False
+
+    def respond(self, messages: list[dict]) -> str:
+        if callable(self.script):
+            return self.script(messages)
+
+        turn = 0
+        for message in reversed(messages):
+            if message["role"] == "assistant":
+                turn += 1
+            elif message["role"] == "user" and not message["content"].startswith("Observation"):
+                responses = self.script.get(message["content"].strip())
+                if responses is not None and turn < len(responses):
+                    return responses[turn]
+                break
+        return self.default
+
+    @staticmethod
+    def __apply_stop(content: str, options: dict | None) -> str:
+        for stop in (options or {}).get("stop", []):
+            index = content.find(stop)
+            if index >= 0:
+                content = content[:index]
+        return content
+
+    @staticmethod
+    def __tool_calls(content: str, tools: list[dict]):
+        from ollama import Message
+
+        tool_parameters = {tool["function"]["name"]: tool["function"]["parameters"]["required"] for tool in tools}
+        lines = []
+        tool_calls = []
+        for line in content.split("\n"):
+            match = LINE_RE.match(line)
+            if match is None or match.group(1) not in tool_parameters:
+                lines.append(line)
+                continue
+            action, action_input = match.group(1), match.group(2)
+            try:
+                arguments = parse_arguments(action_input)
+            except ValueError:
+                # A plain text input, like the command for an agent, is the value of the first parameter
+                arguments = {tool_parameters[action][0]: action_input} if tool_parameters[action] else {}
+            tool_calls.append(Message.ToolCall(function=Message.ToolCall.Function(name=action, arguments=arguments)))
+        return "\n".join(lines).strip(), tool_calls
+
+    def __generation_time(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def __response(self, model, content, messages, done=True, started=None, completion=None) -> "ChatResponse":
+        from ollama import ChatResponse, Message
+
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        eval_tokens = estimate_tokens(completion if completion is not None else content)
+        return ChatResponse(
+            model=model,
+            done=done,
+            done_reason="stop" if done else None,
+            total_duration=int((time.perf_counter() - started) * 1e9) if started is not None else None,
+            prompt_eval_count=prompt_tokens if done else None,
+            eval_count=eval_tokens if done else None,
+            eval_duration=int(self.__generation_time(eval_tokens) * 1e9) if done else None,
+            message=Message(role="assistant", content=content)
+        )
+
+    def __check_down(self):
+        if self.down:
+            raise ConnectionError("The fake server is down")
+
+    async def health(self):
+        return not self.down
+
+    async def chat(self, model, messages, options=None, keep_alive=None, tools=None):
+        self.__check_down()
+        started = time.perf_counter()
+        self.calls += 1
+        content = self.__apply_stop(self.respond(messages), options)
+        await asyncio.sleep(self.latency + self.__generation_time(estimate_tokens(content)))
+        response = self.__response(model, content, messages, started=started)
+        if tools:
+            response.message.content, tool_calls = self.__tool_calls(content, tools)
+            response.message.tool_calls = tool_calls or None
+        return response
+
+    async def chat_stream(self, model, messages, options=None, keep_alive=None):
+        self.__check_down()
+        started = time.perf_counter()
+        self.calls += 1
+        content = self.__apply_stop(self.respond(messages), options)
+        await asyncio.sleep(self.latency)
+        for i in range(0, len(content), self.chunk_size):
+            chunk = content[i:i + self.chunk_size]
+            await asyncio.sleep(self.__generation_time(estimate_tokens(chunk)))
+            yield self.__response(model, chunk, messages, done=False)
+        yield self.__response(model, "", messages, started=started, completion=content)
+
+
+_default_backend: LLMBackend | None = None
+
+
+def get_default_backend() -> LLMBackend:
+    """
+    Returns the backend that is used by all agents that are not given a backend of their own, by default an
+    OllamaBackend on the shared client pool.
+    """
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = OllamaBackend()
+    return _default_backend
+
+
+def set_default_backend(backend: LLMBackend):
+    global _default_backend
+    _default_backend = backend
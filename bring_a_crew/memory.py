@@ -0,0 +1,146 @@
+import copy
+from typing import Callable
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    A cheap estimate for the number of tokens in a text, around four characters per token.
+    """
+    return len(text) // 4 + 1
+
+
+def is_observation(message: dict) -> bool:
+    # The results of tool calls are observations too
+    return message["role"] == "tool" or (message["role"] == "user" and message["content"].startswith("Observation"))
+
+
+def truncate_summary(text: str, max_chars: int = 200) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+
+class Memory:
+    """
+    The memory of an agent, the messages that are sent to the LLM for every call. System messages are pinned,
+    they are always sent first and are never removed. The context holds messages that change over time, like the
+    date of today, they follow the pinned messages. The other messages form the history of the conversation.
+    With isolate_calls, the history is cleared at the start of every call to the agent, so calls do not see
+    each other's messages. The base class keeps all messages.
+    """
+    def __init__(self, isolate_calls: bool = False, count_tokens: Callable[[str], int] = estimate_tokens):
+        self.isolate_calls = isolate_calls
+        self.count_tokens = count_tokens
+        self.pinned = []
+        self.context = []
+        self.history = []
+        self.evicted_turns = 0
+        self.compacted_observations = 0
+
+    def append(self, message: dict):
+        if message["role"] == "system":
+            self.pinned.append(message)
+        else:
+            self.history.append(message)
+            self._after_append()
+
+    def _after_append(self):
+        pass
+
+    def set_context(self, messages: list[dict]):
+        self.context = messages
+
+    def set_pinned(self, messages: list[dict]):
+        """
+        Replaces the pinned messages, for a system prompt that is chosen per call.
+        """
+        self.pinned = messages
+
+    def messages(self) -> list[dict]:
+        return self.pinned + self.context + self.history
+
+    def start_call(self):
+        if self.isolate_calls:
+            self.history = []
+
+    def fork(self):
+        """
+        A new memory with the same settings and pinned messages, without context and history. The pinned
+        messages are shared, they are never changed.
+        """
+        forked = copy.copy(self)
+        forked.pinned = list(self.pinned)
+        forked.context = []
+        forked.history = []
+        forked.evicted_turns = 0
+        forked.compacted_observations = 0
+        return forked
+
+    def tokens(self) -> int:
+        return sum(self.count_tokens(message["content"]) for message in self.messages())
+
+    def stats(self) -> dict:
+        return {
+            "messages": len(self),
+            "tokens": self.tokens(),
+            "evicted_turns": self.evicted_turns,
+            "compacted_observations": self.compacted_observations
+        }
+
+    def __len__(self):
+        return len(self.pinned) + len(self.context) + len(self.history)
+
+
+class WindowMemory(Memory):
+    """
+    A memory with a token budget. When the messages exceed max_tokens, the oldest turns are evicted, a turn
+    being a user message that is not an observation, with the responses and observations that follow it. The
+    system messages and the last turn, with the command of the current call, are always kept. With
+    keep_observations, only the most recent observations are kept in full, older observations are replaced by a
+    summary.
+    """
+    def __init__(self, max_tokens: int = 4096, keep_observations: int | None = None,
+                 summarise: Callable[[str], str] = truncate_summary, **kwargs):
+        super().__init__(**kwargs)
+        self.max_tokens = max_tokens
+        self.keep_observations = keep_observations
+        self.summarise = summarise
+        self._summaries = set()
+
+    def _after_append(self):
+        if self.keep_observations is not None:
+            self.__compact_observations()
+        self.__evict_turns()
+
+    def __compact_observations(self):
+        observations = [i for i, message in enumerate(self.history) if is_observation(message)]
+        for i in observations[:max(0, len(observations) - self.keep_observations)]:
+            if id(self.history[i]) in self._summaries:
+                continue
+            summary = {"role": self.history[i]["role"], "content": self.summarise(self.history[i]["content"])}
+            self.history[i] = summary
+            self._summaries.add(id(summary))
+            self.compacted_observations += 1
+
+    def __evict_turns(self):
+        tokens = self.tokens()
+        while tokens > self.max_tokens:
+            turn_starts = [i for i, message in enumerate(self.history)
+                           if message["role"] == "user" and not is_observation(message)]
+            if len(turn_starts) < 2:
+                return
+            evicted = self.history[:turn_starts[1]]
+            self.history = self.history[turn_starts[1]:]
+            self._summaries.difference_update(id(message) for message in evicted)
+            tokens -= sum(self.count_tokens(message["content"]) for message in evicted)
+            self.evicted_turns += 1
+
+    def fork(self):
+        forked = super().fork()
+        forked._summaries = set()
+        return forked
+
+    def start_call(self):
+        if self.isolate_calls:
+            self._summaries.clear()
+        super().start_call()
@@ -1,22 +1,36 @@
+import asyncio
+import copy
 import logging
-import re
+import time
 from abc import ABC
-from datetime import datetime
+from typing import TYPE_CHECKING, Callable
 
-from ollama import ChatResponse
-from ollama import chat
 
-from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.action_agent import ACTION_RE, ANSWER_RE, ActionAgent, create_date_message
+from bring_a_crew.agent_cache import AgentResultCache
+from bring_a_crew.batch import shared_agent_call
+from bring_a_crew.budget import CycleDetector, PartialAnswer, current_budget, record_llm_call, within_deadline
+from bring_a_crew.checkpoint import checkpointed, current_journal
+from bring_a_crew.llm_backend import DEFAULT_MODEL, LLMBackend, get_default_backend
+from bring_a_crew.memory import Memory
+from bring_a_crew.prompt_cache import PromptCacheStats
+from bring_a_crew.planning import check_plan, describe_outcomes, execute_plan
+from bring_a_crew.react_parser import parse_plan, parse_response, tools_for_agents
+from bring_a_crew.retrieval import BM25Index
+from bring_a_crew.streaming import read_until_complete_line
+from bring_a_crew.tracing import get_tracer
 
-MODEL = 'phi4'
+if TYPE_CHECKING:
+    from ollama import ChatResponse
 
+PARALLEL_ACTIONS_RULE = """
+When subquestions for different agents do not depend on each other, write all their actions before "PAUSE", one "Action:" line per agent. You receive one "Observation: [agent]: [result]" line for each action."""
 
-def create_system_prompt(agents: list[ActionAgent]):
-    agents_str = "\n".join([f" - `{agent.name}`; for {agent.intro}" for agent in agents])
-    return f"""
-You are an AI Orchestration agent following the ReAct framework, where you **Think**, **Act**, and process **Observations** in response to a given **Question**.  During thinking you analyse the question, break it down into subquestions, and decide on the actions to take to answer the question. You then act by calling other agents. After each action, you pause to observe the results of the action. You then continue the cycle by thinking about the new observation and deciding on the next action to take. You continue this cycle until you have enough information to answer the original question.
 
-The date for today is: {datetime.now().strftime("%Y-%m-%d")}
+# The instructions and the example do not change, they come first in the system prompt so the prompt cache of
+# the model server can reuse them between turns.
+ORCHESTRATION_PROMPT = """
+You are an AI Orchestration agent following the ReAct framework, where you **Think**, **Act**, and process **Observations** in response to a given **Question**.  During thinking you analyse the question, break it down into subquestions, and decide on the actions to take to answer the question. You then act by calling other agents. After each action, you pause to observe the results of the action. You then continue the cycle by thinking about the new observation and deciding on the next action to take. You continue this cycle until you have enough information to answer the original question.
 
 You will always follow this structured format:
 Question: [User’s question]
@@ -37,8 +51,7 @@ Rules:
 1. Never answer a question directly; always go through the **Think → Action → PAUSE** cycle.
 2. Never generate output after "PAUSE"
 3. Observations will be provided as a response to an action; never generate your own output for an action.
-4. These are the only available actions:
-{agents_str}
+4. Only call the available agents listed below.
 
 Example Interactions:
 - User Input:
@@ -71,6 +84,95 @@ Think: Now that I have the result, I can provide the final answer.
 Answer: I have booked a room for 4 people for next tuesday in the morning including lunch in room max_8_people.
 """.strip()
 
+
+# With native tool calling the agents are passed as tools, the prompt does not have to explain the text format
+ORCHESTRATION_TOOL_CALLING_PROMPT = """
+You are an AI Orchestration agent that answers a given **Question** by calling other agents, they are available as tools. During thinking you analyse the question, break it down into subquestions, and decide on the agents to call to answer the question. After each call, you receive the result. You continue until you have enough information to answer the original question.
+
+Rules:
+1. Never answer a question directly; always call the agents to find the information.
+2. Only call the available agents, with a subquestion as the command.
+3. When the final answer is ready, you will return it:
+Answer: [Use Final answer to write a friendly response with the answer to the question]
+""".strip()
+
+
+# In planning mode the orchestrator writes all calls to the agents as one plan, the plan is executed for it
+PLANNING_PROMPT = """
+You are an AI Orchestration agent that answers a given **Question** by calling other agents. You first **Think** about the subquestions for the agents and how they depend on each other, and write one **Plan** with all the calls that are needed. The plan is executed for you, calls that do not depend on each other run at the same time. You then receive an **Observation** with the results of all calls, and you return the answer.
+
+A plan is a json list of steps. Every step has an "id", the "agent" to call, the "command" for the agent and "after", the ids of the steps whose results it needs. In a command, {id} is replaced by the result of that step.
+
+You will always follow this structured format:
+Question: [User’s question]
+Think: [Your reasoning about the calls to the agents and the results they need from each other]
+Plan: [json list of steps]
+PAUSE
+
+After receiving the **Observation**, with a line for every step, you will continue:
+Observation: [The results of the steps]
+Think: [Check whether all steps are done]
+If a step failed or was skipped, you write a new plan for the remaining work, with new ids. It can use the results of the earlier steps:
+Plan: [json list of steps]
+PAUSE
+Else, if the final answer is ready, you will return it:
+Answer: [Use Final answer to write a friendly response with the answer to the question]
+
+Rules:
+1. Never answer a question directly; always plan the calls to the agents first.
+2. Never generate output after "PAUSE"
+3. Observations will be provided as a response to a plan; never generate your own output for a plan.
+4. Only call the available agents listed below.
+
+Example Interactions:
+- User Input:
+I like to book a room for 4 people for next tuesday in the morning including lunch?
+- Model Response:
+Question: I like to book a room for 4 people for next tuesday in the morning including lunch?
+Think: The room_manager books the room, the food_manager needs the id of that room to serve lunch.
+Plan: [{"id": "s1", "agent": "room_manager", "command": "book a room for 4 people for next tuesday in the morning", "after": []}, {"id": "s2", "agent": "food_manager", "command": "prepare lunch for 4 people next tuesday in the morning in the room of this booking: {s1}", "after": ["s1"]}]
+PAUSE
+
+User Provides an Observation:
+- Observation: s1 room_manager done: I have booked room max_8_people.
+s2 food_manager done: Lunch will be served next tuesday for 4 people in the room max_8_people.
+
+Model Continues:
+Think: All steps are done, I can provide the final answer.
+Answer: I have booked a room for 4 people for next tuesday in the morning including lunch in room max_8_people.
+""".strip()
+
+
+def create_system_prompt(agents: list[ActionAgent], parallel_actions: bool = False):
+    agents_str = "\n".join([f" - `{agent.name}`; for {agent.intro}" for agent in agents])
+    if parallel_actions:
+        agents_str += "\n" + PARALLEL_ACTIONS_RULE
+    return f"""
+{ORCHESTRATION_PROMPT}
+
+These are the only available agents:
+{agents_str}
+""".strip()
+
+
+def create_planning_prompt(agents: list[ActionAgent]):
+    agents_str = "\n".join([f" - `{agent.name}`; for {agent.intro}" for agent in agents])
+    return f"""
+{PLANNING_PROMPT}
+
+These are the only available agents:
+{agents_str}
+""".strip()
+
+
+def describe_agent(agent: ActionAgent) -> str:
+    """
+    The text to find the agent by, its name and intro and the descriptions of its actions.
+    """
+    actions = getattr(agent, "action_definitions", {})
+    return " ".join([agent.name, agent.intro] + [f"{action} {value["description"]}" for action, value in actions.items()])
+
+
 class OrchestrationAgent(ABC):
     """
     An agent that orchestrates the conversation between the user and the other agents. The
@@ -81,79 +183,271 @@ class OrchestrationAgent(ABC):
     then continues the cycle by thinking about the new observation and deciding on the next action to take.
     It continues this cycle until it has enough information to answer the original question.
     """
-    def __init__(self, name: str, description: str, agents: list[ActionAgent]):
+    def __init__(self, name: str, description: str, agents: list[ActionAgent],
+                 backend: LLMBackend | None = None, parallel_actions: bool = False,
+                 stream: bool = False, on_stream: Callable[[str, str], None] | None = None,
+                 memory: Memory | None = None, keep_alive: float | str | None = None,
+                 model: str = DEFAULT_MODEL, tool_calling: bool = False, max_turns: int = 10,
+                 max_repeats: int = 1, top_k_agents: int | None = None, planning: bool = False,
+                 agent_cache: AgentResultCache | None = None):
         self.log = logging.getLogger("main.OrchestrationAgent")
-        self.log.info("Initializing Orchestration Agent")
+        self.log.debug("Initializing Orchestration Agent %s", name)
+        self.name = name
 
         # Initialize the messages with the system message
-        self.memory = []
-        system_prompt = create_system_prompt(agents=agents)
+        self.memory = memory if memory is not None else Memory()
+        # In planning mode the model writes one plan of calls instead of one action per turn, in the text protocol
+        self.planning = planning
+        # With tool calling, the agents are passed to the model as tools instead of the text protocol
+        self.tool_calling = tool_calling and not planning
+        self.tools = tools_for_agents(agents or [])
+        if planning:
+            system_prompt = create_planning_prompt(agents)
+        elif self.tool_calling:
+            system_prompt = ORCHESTRATION_TOOL_CALLING_PROMPT
+        else:
+            system_prompt = create_system_prompt(agents=agents, parallel_actions=parallel_actions)
         self.memory.append(
             {
                 "role": "system",
                 "content": system_prompt
             }
         )
-        self.log.debug(f"Agent initialized for system {system_prompt}")
+        self.log.debug("Agent initialized for system %s", system_prompt)
 
         # Initialize the known agents
         self.known_agents = {}
         if agents is not None:
             for agent in agents:
                 self.known_agents[agent.name] = agent
+        # With many agents, only the top_k_agents that match the question are in the prompt
+        self.top_k_agents = top_k_agents
+        self.agent_index = None
+        if top_k_agents is not None and len(self.known_agents) > top_k_agents:
+            self.agent_index = BM25Index({agent.name: describe_agent(agent) for agent in self.known_agents.values()})
+        # The prompt and tools per selection of agents, shared by the sessions of this orchestrator
+        self._selected_prompts = {}
+        # The results of read-only calls to the agents, shared by the sessions of this orchestrator
+        self.agent_cache = agent_cache
 
-        self.max_turns = 10
-        self.action_re = re.compile(r'^Action: (\w+): (.*)$')
-        self.answer_re = re.compile(r'^Answer: (.*)$')
+        self.backend = backend if backend is not None else get_default_backend()
+        self.model = model
+        # When enabled, all actions in one response are executed and the observations are combined
+        self.parallel_actions = parallel_actions
+        # Stream the response and stop generating at the first complete action or answer line
+        self.stream = stream
+        self.on_stream = on_stream
+        # Keep the model loaded between turns, so the cached prompt prefix can be reused
+        self.keep_alive = keep_alive
+        self.prompt_cache = PromptCacheStats(count_tokens=self.memory.count_tokens)
+        self.max_turns = max_turns
+        # The number of times the model may repeat a call to an agent, before the orchestrator stops
+        self.max_repeats = max_repeats
+        self.action_re = ACTION_RE
+        self.answer_re = ANSWER_RE
+
+    def session(self, memory: Memory | None = None):
+        """
+        A copy of the orchestrator for one request, with a memory of its own and sessions of the known agents.
+        The prompts, the tools and the backend are shared with this agent.
+        """
+        session = copy.copy(self)
+        session.memory = memory if memory is not None else self.memory.fork()
+        session.known_agents = {name: agent.session() for name, agent in self.known_agents.items()}
+        return session
 
     def call_agent(self, question):
-        i = 0
-        next_prompt = question
-        while i < self.max_turns:
-            i += 1
-            result = self.__handle_user_message(next_prompt)
-
-            # Check if there is an action to run or an answer to return
-            actions = [self.action_re.match(a) for a in result.split('\n') if self.action_re.match(a)]
-            if actions:
-                next_prompt = self.__execute_action(actions)
+        """
+        Blocking wrapper around acall_agent, do not call this from a running event loop.
+        """
+        return asyncio.run(self.acall_agent(question))
+
+    async def acall_agent(self, question):
+        """
+        Runs the ReAct loop for the question, the calls to the other agents are awaited on the same event loop.
+        The budget of the request is shared with the agents; when it runs out, when the turns of the orchestrator
+        run out or when the model keeps repeating a call, the result is a PartialAnswer with the observations so far.
+        """
+        tracer = get_tracer()
+        with tracer.span("orchestrator.call", agent=self.name) as span:
+            self.memory.start_call()
+            self.memory.set_context([create_date_message()])
+            if self.agent_index is not None:
+                self.__select_agents(question)
+            budget = current_budget()
+            cycles = CycleDetector(self.max_repeats)
+            observations = []
+            # The results of the done steps of the plans, by step id
+            plan_results = {}
+            i = 0
+            next_messages = [{"role": "user", "content": question}]
+            while i < self.max_turns:
+                reason = budget.exhausted() if budget is not None else None
+                if reason is not None:
+                    return self.__partial_answer(span, reason, observations, i)
+                i += 1
+                span.set(turns=i)
+                with tracer.span("orchestrator.turn", agent=self.name, turn=i):
+                    try:
+                        content, tool_calls = await self.__handle_messages(next_messages)
+                    except TimeoutError:
+                        return self.__partial_answer(span, "deadline", observations, i)
+
+                    # Check if there is an action to run or an answer to return
+                    if tool_calls:
+                        actions, answer = [(call["function"]["name"], call["function"]["arguments"])
+                                           for call in tool_calls], None
+                    else:
+                        actions, answer = parse_response(content)
+                    if self.planning:
+                        try:
+                            plan = parse_plan(content)
+                            if plan == [] and answer is not None:
+                                # No agent has to be called, the answer is given directly
+                                plan = None
+                            if plan is not None:
+                                check_plan(plan, self.known_agents, plan_results)
+                        except ValueError as e:
+                            # The model gets the chance to correct the plan
+                            self.log.warning("Invalid plan: %s", e)
+                            next_messages = [{"role": "user", "content": f"Observation: The plan is not valid: {e}"}]
+                            continue
+                        if plan is not None:
+                            next_messages = await self.__execute_plan(plan, plan_results, observations)
+                            continue
+                    if not actions:
+                        return self.__extract_answer(answer, content)
+
+                    # Every tool call needs a result, in the text protocol only the first action is executed
+                    if not self.parallel_actions and not self.tool_calling:
+                        actions = actions[:1]
+                    earlier = cycles.repeated(actions)
+                    if earlier is None:
+                        results = await self.__execute_action(actions)
+                        cycles.record(actions, results)
+                        observations += results
+                    elif cycles.cycling():
+                        return self.__partial_answer(span, "limit of repeated actions", observations, i)
+                    else:
+                        self.log.warning("Repeated actions: %s", actions)
+                        results = [f"You already asked {action} this, the answer was: {observation} Use this answer to continue."
+                                   for (action, _), observation in zip(actions, earlier)]
+                    next_messages = self.__observation_messages(actions, results)
+            return self.__partial_answer(span, "turn limit", observations, i)
+
+    async def __execute_plan(self, plan, plan_results, observations):
+        self.log.info(" -- running plan %s", plan)
+        with get_tracer().span("orchestrator.plan", agent=self.name, steps=len(plan)):
+            outcomes = await execute_plan(plan, plan_results, self.__call_known_agent)
+        observations += [observation for _, status, observation in outcomes if status == "done"]
+        observation = describe_outcomes(outcomes)
+        self.log.info("Observation: %s", observation)
+        return [{"role": "user", "content": f"Observation: {observation}"}]
+
+    def __select_agents(self, question):
+        """
+        Puts only the agents that match the question in the prompt. The other agents can still be called when the
+        model names them.
+        """
+        selected = tuple(self.agent_index.search(question, self.top_k_agents))
+        prompt = self._selected_prompts.get(selected)
+        if prompt is None:
+            agents = [self.known_agents[name] for name in selected]
+            if self.planning:
+                prompt = (create_planning_prompt(agents), self.tools)
+            elif self.tool_calling:
+                prompt = (ORCHESTRATION_TOOL_CALLING_PROMPT, tools_for_agents(agents))
             else:
-                return self.__extract_answer(result)
+                prompt = (create_system_prompt(agents=agents, parallel_actions=self.parallel_actions), self.tools)
+            self._selected_prompts[selected] = prompt
+        self.log.debug("Selected agents for %s: %s", self.name, selected)
+        self.memory.set_pinned([{"role": "system", "content": prompt[0]}])
+        self.tools = prompt[1]
+
+    def __partial_answer(self, span, reason: str, observations: list[str], turns: int) -> PartialAnswer:
+        self.log.warning("Stopped %s after %d turns: %s", self.name, turns, reason)
+        span.set(partial=reason)
+        return PartialAnswer(reason, observations, turns)
+
+    async def __execute_action(self, actions):
+        for action, action_input in actions:
+            self.__check_known_agent(action, action_input)
 
-    def __execute_action(self, actions):
-        action, action_input = actions[0].groups()
+        observations = [None] * len(actions)
+        if self.parallel_actions:
+            # An agent has one memory, calls to the same agent run in order, different agents run concurrently
+            indexes_per_agent = {}
+            for index, (action, _) in enumerate(actions):
+                indexes_per_agent.setdefault(action, []).append(index)
+
+            async def _run_commands(indexes):
+                for index in indexes:
+                    observations[index] = await self.__call_known_agent(*actions[index])
+
+            await asyncio.gather(*[_run_commands(indexes) for indexes in indexes_per_agent.values()])
+        else:
+            for index, (action, action_input) in enumerate(actions):
+                observations[index] = await self.__call_known_agent(action, action_input)
+        return observations
+
+    def __observation_messages(self, actions, observations):
+        if self.tool_calling:
+            return [{"role": "tool", "content": str(observation)} for observation in observations]
+        if self.parallel_actions:
+            return [{"role": "user", "content": "\n".join(
+                [f"Observation: {action}: {observation}" for (action, _), observation in zip(actions, observations)])}]
+        return [{"role": "user", "content": f"Observation: {observations[0]}"}]
+
+    def __check_known_agent(self, action, action_input):
         if action not in self.known_agents:
             self.log.error("Unknown action: %s: %s", action, action_input)
             raise Exception("Unknown action: {}: {}".format(action, action_input))
 
+    async def __call_known_agent(self, action, action_input):
         self.log.info(" -- running %s %s", action, action_input)
-        observation = self.known_agents[action].perform_action(command=action_input)
+        # A tool call has the command as argument
+        command = action_input.get("command", "") if isinstance(action_input, dict) else action_input
+        agent = self.known_agents[action]
+        # In a batch, the same command from another question can share its result, unless it booked something
+        run = lambda: shared_agent_call(action, command, lambda: agent.aperform_action(command=command),
+                                        shareable=lambda: not agent.side_effects)
+        # A resumed request replays the steps of the agents, a cached result would skip them
+        if self.agent_cache is not None and current_journal() is None:
+            observation = await self.agent_cache.call(agent, command, run)
+        else:
+            observation = await run()
 
         self.log.info("Observation: %s", observation)
-        return f"Observation: {observation}"
-
-    def __extract_answer(self, result):
-        answers = [self.answer_re.match(answer) for answer in result.split('\n') if self.answer_re.match(answer)]
-        if answers:
-            # There is an answer to return
-            self.log.info("Final answer: %s", answers[0].groups()[0])
-            return answers[0].groups()[0]
+        return observation
+
+    def __extract_answer(self, answer, result):
+        if answer is None and self.tool_calling and result.strip():
+            # Without a tool call, the response of the model is the answer
+            answer = result.strip()
+        if answer is not None:
+            self.log.info("Final answer: %s", answer)
+            return answer
         else:
             self.log.error("No action or answer found in: %s", result)
             raise Exception("No action or answer found in: {}".format(result))
 
+    async def __handle_messages(self, messages: list[dict]):
+        for message in messages:
+            self.log.info("Received message: %s", message["content"])
+            self.memory.append(message)
+        # When the request is resumed, the responses of completed turns come from the journal
+        content, tool_calls = await within_deadline(lambda: checkpointed(self.name, "llm", self.__execute))
+        response = {"role": "assistant", "content": content}
+        if tool_calls:
+            response["tool_calls"] = tool_calls
+        self.memory.append(response)
+        return content, tool_calls
 
-    def __handle_user_message(self, message):
-        self.log.info(f"Received message: {message}")
-        self.memory.append({"role": "user", "content": message})
-        result = self.__execute()
-        self.memory.append({"role": "assistant", "content": result})
-        return result
-
-    def __execute(self) -> str:
-        response: ChatResponse = chat(
-            model=MODEL,
-            messages=self.memory,
+    async def __execute(self):
+        messages = self.memory.messages()
+        request = dict(
+            model=self.model,
+            messages=messages,
             options={
                 "temperature": 0,
                 "stop": [
@@ -161,5 +455,32 @@ class OrchestrationAgent(ABC):
                 ]
             }
         )
-        self.log.info(f"Response: {response.message.content}")
-        return response.message.content
+        if self.keep_alive is not None:
+            request["keep_alive"] = self.keep_alive
+        tool_calls = []
+        started = time.perf_counter()
+        with get_tracer().span("llm.call", agent=self.name, model=self.model, stream=self.stream) as span:
+            if self.stream and not self.tool_calling:
+                # With parallel actions or a plan the model can write multiple action lines, only stop at the answer
+                line_res = [self.answer_re] if self.parallel_actions or self.planning else [self.action_re, self.answer_re]
+                content = await read_until_complete_line(
+                    self.backend.chat_stream(**request),
+                    line_res=line_res,
+                    on_chunk=(lambda chunk: self.on_stream(self.name, chunk)) if self.on_stream else None
+                )
+                self.prompt_cache.record(messages)
+                # A stream reports no token counts, they are estimated
+                tokens = self.memory.tokens() + self.memory.count_tokens(content)
+            else:
+                if self.tool_calling:
+                    request["tools"] = self.tools
+                response: ChatResponse = await self.backend.chat(**request)
+                content = response.message.content or ""
+                tool_calls = [{"function": {"name": call.function.name, "arguments": dict(call.function.arguments)}}
+                              for call in response.message.tool_calls or []]
+                self.prompt_cache.record(messages, response.prompt_eval_count)
+                span.set(prompt_tokens=response.prompt_eval_count or 0, eval_tokens=response.eval_count or 0)
+                tokens = (response.prompt_eval_count or 0) + (response.eval_count or 0)
+        record_llm_call(tokens, time.perf_counter() - started)
+        self.log.info("Response: %s", content)
+        return content, tool_calls
@@ -0,0 +1,84 @@
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable
+
+from bring_a_crew.budget import PartialAnswer
+from bring_a_crew.react_parser import PLACEHOLDER_RE
+
+
+def check_plan(steps: list[dict], agents, results: dict[str, str]):
+    """
+    Raises a ValueError when the plan has no steps, a step calls an unknown agent, comes after a step that does
+    not exist, or when the steps depend on each other in a circle. A step can come after a done step of an earlier
+    plan, in results.
+    """
+    if not steps:
+        # An empty plan runs nothing, the model would plan again until the turns run out
+        raise ValueError("A plan needs at least one step, give the Answer when no agent has to be called")
+    ids = [step["id"] for step in steps]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Every step of the plan needs its own id")
+    for step in steps:
+        if step["agent"] not in agents:
+            raise ValueError(f"Unknown agent {step["agent"]} in step {step["id"]}")
+        for step_id in step["after"]:
+            if step_id not in ids and step_id not in results:
+                raise ValueError(f"Step {step["id"]} comes after {step_id}, which is not a step of the plan")
+
+    # Remove the steps without open dependencies until none are left, what remains is a circle
+    remaining = {step["id"]: {step_id for step_id in step["after"] if step_id in ids} for step in steps}
+    while remaining:
+        ready = [step_id for step_id, after in remaining.items() if not after]
+        if not ready:
+            raise ValueError(f"The steps {", ".join(remaining)} depend on each other in a circle")
+        for step_id in ready:
+            del remaining[step_id]
+        for after in remaining.values():
+            after.difference_update(ready)
+
+
+async def execute_plan(steps: list[dict], results: dict[str, str],
+                       call_agent: Callable[[str, str], Awaitable[str]]) -> list[tuple[dict, str, str]]:
+    """
+    Runs the steps of a checked plan, every step as soon as the steps it comes after are done, so independent
+    steps run at the same time. A placeholder like {s1} in a command is replaced by the result of that step.
+    Steps for the same agent run one after the other, an agent has one memory. A step fails when its agent raises
+    an exception or returns a PartialAnswer, the steps after it are skipped.
+
+    Returns the step, the status (done, failed or skipped) and the observation for every step. The results of the
+    done steps are added to results.
+    """
+    loop = asyncio.get_running_loop()
+    done = {step["id"]: loop.create_future() for step in steps}
+    locks = defaultdict(asyncio.Lock)
+    outcomes = {}
+
+    async def _run(step):
+        for step_id in step["after"]:
+            if step_id in done and not await done[step_id]:
+                outcomes[step["id"]] = (step, "skipped", f"it comes after {step_id}, which did not succeed")
+                done[step["id"]].set_result(False)
+                return
+        command = PLACEHOLDER_RE.sub(lambda match: results.get(match.group(1), match.group(0)), step["command"])
+        try:
+            async with locks[step["agent"]]:
+                observation = await call_agent(step["agent"], command)
+        except Exception as e:
+            outcomes[step["id"]] = (step, "failed", f"{type(e).__name__}: {e}")
+        else:
+            if isinstance(observation, PartialAnswer):
+                outcomes[step["id"]] = (step, "failed", str(observation))
+            else:
+                outcomes[step["id"]] = (step, "done", str(observation))
+                results[step["id"]] = str(observation)
+        done[step["id"]].set_result(outcomes[step["id"]][1] == "done")
+
+    await asyncio.gather(*[_run(step) for step in steps])
+    return [outcomes[step["id"]] for step in steps]
+
+
+def describe_outcomes(outcomes: list[tuple[dict, str, str]]) -> str:
+    """
+    The outcomes of the steps as one observation for the model, a line per step.
+    """
+    return "\n".join(f"{step["id"]} {step["agent"]} {status}: {observation}" for step, status, observation in outcomes)
@@ -0,0 +1,55 @@
+from typing import Callable
+
+from bring_a_crew.memory import estimate_tokens
+
+
+class PromptCacheStats:
+    """
+    Measures how much of each prompt can be served from the prompt cache of the model server. The prefix hit rate
+    compares the messages with the messages of the previous call, the leading messages that did not change can be
+    reused by the server. The prompt_eval_count reported by Ollama is the number of prompt tokens that were
+    evaluated and not taken from the cache. The server hit rate compares it with the total number of prompt tokens
+    counted by the server, it is None when the server does not report that total; the estimated token counts are in
+    other units and cannot be compared with the counts of the server.
+    """
+    def __init__(self, count_tokens: Callable[[str], int] = estimate_tokens):
+        self.count_tokens = count_tokens
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.prefix_tokens = 0
+        self.evaluated_tokens = 0
+        self.server_prompt_tokens = 0
+        self.server_evaluated_tokens = 0
+        self._previous = []
+
+    def record(self, messages: list[dict], prompt_eval_count: int | None = None, prompt_tokens: int | None = None):
+        tokens = [self.count_tokens(message["content"]) for message in messages]
+        shared = 0
+        for previous, message in zip(self._previous, messages):
+            if previous != message:
+                break
+            shared += 1
+
+        self.calls += 1
+        self.prompt_tokens += sum(tokens)
+        self.prefix_tokens += sum(tokens[:shared])
+        if prompt_eval_count is not None:
+            self.evaluated_tokens += prompt_eval_count
+            if prompt_tokens is not None:
+                self.server_prompt_tokens += prompt_tokens
+                self.server_evaluated_tokens += prompt_eval_count
+        self._previous = list(messages)
+
+    def stats(self) -> dict:
+        prefix_hit_rate = self.prefix_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        server_hit_rate = None
+        if self.server_prompt_tokens:
+            server_hit_rate = 1 - self.server_evaluated_tokens / self.server_prompt_tokens
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "prefix_tokens": self.prefix_tokens,
+            "prefix_hit_rate": prefix_hit_rate,
+            "evaluated_tokens": self.evaluated_tokens,
+            "server_hit_rate": server_hit_rate
+        }
@@ -0,0 +1,141 @@
+import json
+import re
+
+# The action and answer lines, allowing the small deviations models often make, like bold markers, backticks
+# around the action name or a missing colon after it. LINE_RE matches both kinds in one pass.
+_ACTION = r'Action\**:\**\s*`?(\w+)`?\s*:?\s*(.*?)'
+_ANSWER = r'Answer\**:\**\s*(.*?)'
+ACTION_RE = re.compile(rf'^\s*\**{_ACTION}\s*$')
+ANSWER_RE = re.compile(rf'^\s*\**{_ANSWER}\s*$')
+LINE_RE = re.compile(rf'^\s*\**(?:{_ACTION}|{_ANSWER})\s*$')
+
+PLAN_RE = re.compile(r'^\s*\**Plan\**:', re.MULTILINE)
+PLACEHOLDER_RE = re.compile(r'\{(\w+)\}')
+
+_JSON_TYPES = {"str": "string", "int": "integer", "float": "number", "bool": "boolean"}
+
+
+class ReActParser:
+    """
+    Parses the text of a model response in a single pass, also when the text comes in as a stream of chunks.
+    Complete lines are matched once, the actions and the first answer are collected.
+    """
+    def __init__(self):
+        self.actions = []
+        self.answer = None
+        self._buffer = ""
+
+    def feed(self, text: str) -> bool:
+        """
+        Adds a chunk of text, returns True when a complete action or answer line was found in it.
+        """
+        self._buffer += text
+        found = False
+        while (end := self._buffer.find("\n")) >= 0:
+            found = self.__parse_line(self._buffer[:end]) or found
+            self._buffer = self._buffer[end + 1:]
+        return found
+
+    def close(self) -> bool:
+        line, self._buffer = self._buffer, ""
+        return self.__parse_line(line)
+
+    def __parse_line(self, line: str) -> bool:
+        match = LINE_RE.match(line)
+        if match is None:
+            return False
+        action, action_input, answer = match.groups()
+        if action is not None:
+            self.actions.append((action, action_input))
+        elif self.answer is None:
+            self.answer = answer
+        return True
+
+
+def parse_response(text: str) -> tuple[list[tuple[str, str]], str | None]:
+    """
+    Returns the actions, as pairs of name and input, and the answer in a complete response.
+    """
+    parser = ReActParser()
+    parser.feed(text)
+    parser.close()
+    return parser.actions, parser.answer
+
+
+def parse_plan(text: str) -> list[dict] | None:
+    """
+    Returns the steps of the plan in a response, or None when there is no "Plan:" line. A step has an id, an
+    agent, a command and the ids of the steps it comes after; a step whose result is used in the command, like
+    {s1}, also comes after that step. Raises a ValueError when the plan is not a json list of steps.
+    """
+    match = PLAN_RE.search(text)
+    if match is None:
+        return None
+    start = text.find("[", match.end())
+    if start < 0:
+        raise ValueError("No json list of steps after Plan:")
+    steps, _ = json.JSONDecoder().raw_decode(text[start:])
+    if not isinstance(steps, list) or not all(isinstance(step, dict) and "agent" in step and "command" in step
+                                              for step in steps):
+        raise ValueError("A plan is a json list of steps, each with an id, an agent, a command and after")
+    plan = []
+    for index, step in enumerate(steps):
+        command = str(step["command"])
+        after = [str(step_id) for step_id in step.get("after") or []]
+        after += [step_id for step_id in PLACEHOLDER_RE.findall(command) if step_id not in after]
+        plan.append({"id": str(step.get("id", f"s{index + 1}")), "agent": str(step["agent"]), "command": command,
+                     "after": after})
+    return plan
+
+
+def parse_arguments(action_input: str | dict) -> dict:
+    """
+    Parses the json arguments of an action. Text around the json document, like a trailing remark or markdown
+    backticks, is ignored. Raises a ValueError when there is no json object.
+    """
+    if isinstance(action_input, dict):
+        return action_input
+    start = action_input.find("{")
+    if start < 0:
+        raise ValueError(f"No json object in: {action_input}")
+    arguments, _ = json.JSONDecoder().raw_decode(action_input[start:])
+    if not isinstance(arguments, dict):
+        raise ValueError(f"No json object in: {action_input}")
+    return arguments
+
+
+def tools_for_actions(actions: dict) -> list[dict]:
+    """
+    The tools schema for native tool calling, generated from the action definitions of an ActionAgent.
+    """
+    return [{
+        "type": "function",
+        "function": {
+            "name": action,
+            "description": value["description"],
+            "parameters": {
+                "type": "object",
+                "properties": {argument["name"]: {"type": _JSON_TYPES.get(argument["type"], "string")}
+                               for argument in value.get("arguments", [])},
+                "required": [argument["name"] for argument in value.get("arguments", [])]
+            }
+        }
+    } for action, value in actions.items()]
+
+
+def tools_for_agents(agents) -> list[dict]:
+    """
+    The tools schema for native tool calling by the OrchestrationAgent, one tool per agent with the command.
+    """
+    return [{
+        "type": "function",
+        "function": {
+            "name": agent.name,
+            "description": agent.intro,
+            "parameters": {
+                "type": "object",
+                "properties": {"command": {"type": "string", "description": "The subquestion for the agent"}},
+                "required": ["command"]
+            }
+        }
+    } for agent in agents]
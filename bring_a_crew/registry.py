@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Callable
+
+
+class AgentRegistry:
+    """
+    Builds every agent once and hands out sessions of it. An agent is registered by name with a factory, the
+    factory is called the first time the agent is used, once for every set of options. The built agents are
+    templates that are never used for a request themselves: a request gets a session, a copy of the template
+    with a memory of its own.
+    """
+    def __init__(self):
+        self.log = logging.getLogger("main.AgentRegistry")
+        self._factories = {}
+        self._agents = {}
+
+    def register(self, name: str, factory: Callable[..., object]):
+        self._factories[name] = factory
+        # Agents built by an earlier factory for this name are out of date
+        for key in [key for key in self._agents if key[0] == name]:
+            del self._agents[key]
+
+    def get(self, name: str, **options):
+        """
+        Returns the template of the agent, it is built on first use.
+        """
+        key = (name, tuple(sorted(options.items())))
+        agent = self._agents.get(key)
+        if agent is None:
+            if name not in self._factories:
+                raise Exception(f"Unknown agent: {name}")
+            self.log.debug("Building agent %s %s", name, options)
+            agent = self._agents[key] = self._factories[name](**options)
+        return agent
+
+    def session(self, name: str, **options):
+        """
+        Returns a new session of the agent for one request.
+        """
+        return self.get(name, **options).session()
+
+    async def warm_up(self, names: list[str] | None = None, keep_alive: float | str | None = None):
+        """
+        Builds the agents and loads their models on the servers, so the first request does not have to. Call it
+        once at startup, a keep_alive of -1 keeps the models loaded.
+        """
+        agents = [self.get(name) for name in names or self._factories]
+        agents += [known_agent for agent in agents for known_agent in getattr(agent, "known_agents", {}).values()]
+        models = {(id(agent.backend), agent.model): agent for agent in agents}
+        await asyncio.gather(*[agent.backend.preload(agent.model, keep_alive=keep_alive) for agent in models.values()])
+        self.log.info("Warmed up %d agents and %d models", len(agents), len(models))
+
+
+_default_registry: AgentRegistry | None = None
+
+
+def get_default_registry() -> AgentRegistry:
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = AgentRegistry()
+    return _default_registry
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import TYPE_CHECKING
+
+from bring_a_crew.llm_backend import LLMBackend
+from bring_a_crew.tracing import current_span
+
+if TYPE_CHECKING:
+    from ollama import ChatResponse
+
+
+def _normalise(message: dict) -> dict:
+    normalised = {"role": message["role"], "content": message["content"].strip()}
+    if message.get("tool_calls"):
+        normalised["tool_calls"] = message["tool_calls"]
+    return normalised
+
+
+def cache_key(model: str, options: dict | None, messages: list[dict], tools: list[dict] | None = None) -> str:
+    """
+    A hash of the model, the options, the messages and the tools. Only the role, the stripped content and the tool
+    calls of the messages are used, so small differences in whitespace do not result in a different key.
+    """
+    document = {"model": model, "options": options or {}, "messages": [_normalise(message) for message in messages]}
+    if tools:
+        document["tools"] = tools
+    document = json.dumps(document, sort_keys=True)
+    return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caches the content of LLM responses by key. The entries are kept in memory in least recently used order, with a
+    maximum number of entries and a time to live in seconds. When a path is given, the entries are also stored in
+    an SQLite database with the same bounds, so the cache survives a restart.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float | None = 3600, path: str | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT, created REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+            self.__prune_db()
+            self._db.commit()
+
+    def __expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = row
+                    self.__put_in_memory(key, entry)
+            if entry is not None and self.__expired(entry[1]):
+                self.__remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, content: str):
+        entry = (content, time.time())
+        with self._lock:
+            self.__put_in_memory(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, content, created) VALUES (?, ?, ?)",
+                                 (key, *entry))
+                self.__prune_db()
+                self._db.commit()
+
+    def __prune_db(self):
+        """
+        Bounds the database like the memory: the expired rows are deleted and only the newest max_entries are kept.
+        """
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        self._db.execute("DELETE FROM responses WHERE key NOT IN "
+                         "(SELECT key FROM responses ORDER BY created DESC LIMIT ?)", (self.max_entries,))
+
+    def __put_in_memory(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __remove(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class CachedBackend(LLMBackend):
+    """
+    Puts a ResponseCache in front of a backend, agents use it like any other backend. Only requests with a
+    temperature of 0 are cached, other requests go straight to the backend. With tools, the content and the tool
+    calls of a response are stored together as json.
+    """
+    def __init__(self, cache: ResponseCache, backend: LLMBackend):
+        self.cache = cache
+        self.backend = backend
+
+    @staticmethod
+    def __key(model, messages, options, tools=None) -> str | None:
+        if (options or {}).get("temperature") != 0:
+            return None
+        return cache_key(model, options, messages, tools)
+
+    @staticmethod
+    def __response(model: str, content: str, tool_calls: list[dict] | None = None) -> "ChatResponse":
+        from ollama import ChatResponse, Message
+
+        return ChatResponse(model=model, done=True,
+                            message=Message(role="assistant", content=content, tool_calls=tool_calls or None))
+
+    async def chat(self, model, messages, options=None, keep_alive=None, tools=None):
+        key = self.__key(model, messages, options, tools)
+        if key is not None:
+            content = self.cache.get(key)
+            if content is not None:
+                current_span().set(cache_hit=True)
+                if tools:
+                    return self.__response(model, **json.loads(content))
+                return self.__response(model, content)
+
+        response = await self.backend.chat(model=model, messages=messages, options=options, keep_alive=keep_alive,
+                                           tools=tools)
+        if key is not None:
+            content = response.message.content or ""
+            if tools:
+                content = json.dumps({"content": content, "tool_calls": [
+                    {"function": {"name": call.function.name, "arguments": dict(call.function.arguments)}}
+                    for call in response.message.tool_calls or []]})
+            self.cache.put(key, content)
+        return response
+
+    async def preload(self, model, keep_alive=None):
+        await self.backend.preload(model, keep_alive=keep_alive)
+
+    async def health(self):
+        return await self.backend.health()
+
+    async def chat_stream(self, model, messages, options=None, keep_alive=None):
+        key = self.__key(model, messages, options)
+        if key is not None:
+            content = self.cache.get(key)
+            if content is not None:
+                current_span().set(cache_hit=True)
+                yield self.__response(model, content)
+                return
+
+        # Only a stream that is read till the end is a complete response
+        content = ""
+        stream = self.backend.chat_stream(model=model, messages=messages, options=options, keep_alive=keep_alive)
+        async with aclosing(stream) as chunks:
+            async for chunk in chunks:
+                content += chunk.message.content or ""
+                yield chunk
+        if key is not None:
+            self.cache.put(key, content)
@@ -0,0 +1,66 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    The lowercase words of the text, with a plural s and an ing removed so "rooms" matches "room" and "parking"
+    matches "park".
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        if len(token) > 5 and token.endswith("ing"):
+            token = token[:-3]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    A small in-process search index over named descriptions, like the agents of the orchestrator or the actions
+    of an agent, ranked with BM25. The index is built once, a search only visits the postings of the words in the
+    query.
+    """
+    def __init__(self, documents: dict[str, str], k1: float = 1.5, b: float = 0.75):
+        self.names = list(documents)
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for index, text in enumerate(documents.values()):
+            tokens = tokenize(text)
+            self._lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                self._postings[term].append((index, count))
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 1.0
+        total = len(self.names)
+        self._idf = {term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                     for term, postings in self._postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def scores(self, query: str) -> list[float]:
+        scores = [0.0] * len(self.names)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for index, count in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / self._average_length)
+                scores[index] += idf * count * (self.k1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query: str, k: int) -> list[str]:
+        """
+        The names of the k best matches, in the order they were added so the same selection always gives the same
+        prompt. Without enough matches, the first names fill up the selection.
+        """
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.names)), key=lambda index: -scores[index])
+        return [self.names[index] for index in sorted(ranked[:k])]
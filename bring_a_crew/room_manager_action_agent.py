@@ -1,31 +1,69 @@
 import logging
-
-from dotenv import load_dotenv
+import re
 
 from bring_a_crew import action_agent_log
 from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.availability import get_default_store
+from bring_a_crew.fast_path import DATE_PATTERN, TIMESLOT_PATTERN, FastPath, Intent
+from bring_a_crew.llm_backend import DEFAULT_MODEL
 from bring_a_crew.setup_logging import setup_logging
 
 
 def check_available_room(req_date: str, timeslot: str, number_of_people: int):
-    # This is a placeholder for the actual implementation
-    return f"Room with more then {number_of_people} seats is available on {req_date} for {timeslot}. You can book it."
+    store = get_default_store()
+    try:
+        rooms = store.find_rooms(req_date, timeslot, int(number_of_people), limit=1)
+    except ValueError as e:
+        return f"Cannot check the rooms: {e}"
+    if not rooms:
+        return f"No room with {number_of_people} or more seats is available on {req_date} for {timeslot}."
+    return f"Room {rooms[0]} with {store.capacity(rooms[0])} seats is available on {req_date} for {timeslot}. You can book it."
+
+
+def predict_room_check(command: str, previous_calls: list[tuple[str, dict]]):
+    """
+    A room is checked before it is booked, the date, timeslot and number of people are often in the command.
+    """
+    date = re.search(r'\b\d{4}-\d{2}-\d{2}\b', command)
+    timeslot = re.search(r'\b(morning|afternoon)\b', command, re.IGNORECASE)
+    number_of_people = re.search(r'\b(\d+) (?:people|persons)\b', command)
+    if not (date and timeslot and number_of_people) or previous_calls:
+        return []
+    return [{"req_date": date.group(0), "timeslot": timeslot.group(1).lower(),
+             "number_of_people": int(number_of_people.group(1))}]
 
 
 def book_room(req_date: str, timeslot: str, number_of_people: int):
-    room_id = f"max_{str(number_of_people)}_people"
-    # This is a placeholder for the actual implementation
-    return f"Room with more then {number_of_people} seats is booked on {req_date} for {timeslot} with id {room_id}."
+    store = get_default_store()
+    try:
+        # The smallest free room that is large enough
+        for room_id in store.find_rooms(req_date, timeslot, int(number_of_people)):
+            if store.book_room(room_id, req_date, timeslot):
+                return f"Room with {store.capacity(room_id)} seats is booked on {req_date} for {timeslot} with id {room_id}."
+    except ValueError as e:
+        return f"Cannot book a room: {e}"
+    return f"No room with {number_of_people} or more seats is available on {req_date} for {timeslot}."
+
 
+FAST_PATH_INTENTS = [
+    Intent("check_available_room", rf'(?:check (?:for )?(?:an )?available room|is there a room available|find an available room) for (?P<number_of_people>\d+) (?:people|persons) on (?P<req_date>{DATE_PATTERN}) (?:in the )?(?P<timeslot>{TIMESLOT_PATTERN})'),
+    Intent("book_room", rf'book a room for (?P<number_of_people>\d+) (?:people|persons) on (?P<req_date>{DATE_PATTERN}) (?:in the )?(?P<timeslot>{TIMESLOT_PATTERN})')
+]
 
-def create_agent():
+
+def create_agent(model: str = DEFAULT_MODEL, fast_path: bool = False):
     return  ActionAgent(
         name="room_manager",
+        model=model,
+        fast_path=FastPath(FAST_PATH_INTENTS, learn=True) if fast_path else None,
         intro="This agent checks the availability of rooms and books them.",
         actions={
             "check_available_room": {
                 "description": "Find an available room with more then requested seats for the asked time and day. Rooms are only available to book for morning or afternoon.",
                 "function": check_available_room,
+                "inline": True,
+                "cache_ttl": 60,
+                "predict": predict_room_check,
                 "arguments": [
                     {"name": "req_date", "type": "str"},
                     {"name": "timeslot", "type": "str"},
@@ -35,6 +73,7 @@ def create_agent():
             "book_room": {
                 "description": "Book a room with more then requested seats for the asked time and day. Rooms are only available to book for morning or afternoon. Return the room id.",
                 "function": book_room,
+                "inline": True,
                 "arguments": [
                     {"name": "req_date", "type": "str"},
                     {"name": "timeslot", "type": "str"},
@@ -45,6 +84,8 @@ def create_agent():
     )
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
     _ = load_dotenv()
     setup_logging()
     main_log = logging.getLogger("main")
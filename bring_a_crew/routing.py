@@ -0,0 +1,185 @@
+import asyncio
+import time
+from contextlib import aclosing
+
+from bring_a_crew.client_pool import AsyncClientPool
+from bring_a_crew.llm_backend import LLMBackend, OllamaBackend
+from bring_a_crew.tracing import current_span
+
+
+class Endpoint:
+    """
+    A model server behind the RoutingBackend. With models, only requests for those models are sent to it, like a
+    small server that only runs the fast model. The router keeps track of the requests in flight, the latency and
+    the failures of the endpoint.
+    """
+    def __init__(self, backend: LLMBackend, name: str | None = None, models: set[str] | None = None):
+        self.backend = backend
+        self.name = name or type(backend).__name__
+        self.models = set(models) if models else None
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.unhealthy_until = 0.0
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def score(self) -> float:
+        # The expected wait, an endpoint without a measured latency is tried first
+        return (self.in_flight + 1) * (self.latency or 0.0)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "latency": self.latency,
+            "healthy": self.healthy()
+        }
+
+
+def ollama_endpoints(hosts: list[str], size: int = 8) -> list[Endpoint]:
+    """
+    An endpoint for every Ollama host, each with its own pool of clients.
+    """
+    return [Endpoint(OllamaBackend(AsyncClientPool(size=size, host=host)), name=host) for host in hosts]
+
+
+class RoutingBackend(LLMBackend):
+    """
+    Spreads the LLM calls over a list of endpoints. Every call goes to the healthy endpoint for the model with the
+    lowest expected wait, the requests in flight times the smoothed latency. When a call fails, it is retried on
+    the next endpoint; after failure_threshold failures in a row an endpoint is skipped for cooldown seconds, or
+    until a health check succeeds. A stream is only retried when it failed before the first chunk.
+
+    Tiers map a model name used by the agents to the model to run, for instance {"fast": "phi4-mini",
+    "large": "phi4"}, so simple agents can use a smaller model than the orchestrator.
+    """
+    def __init__(self, endpoints: list[Endpoint | LLMBackend], tiers: dict[str, str] | None = None,
+                 failure_threshold: int = 3, cooldown: float = 30.0, smoothing: float = 0.2,
+                 max_attempts: int | None = None):
+        self.endpoints = [endpoint if isinstance(endpoint, Endpoint) else Endpoint(endpoint, name=f"endpoint-{i}")
+                          for i, endpoint in enumerate(endpoints)]
+        self.tiers = tiers or {}
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.max_attempts = max_attempts or len(self.endpoints)
+
+    def resolve(self, model: str) -> str:
+        return self.tiers.get(model, model)
+
+    def candidates(self, model: str) -> list[Endpoint]:
+        """
+        The endpoints for the model in the order they are tried.
+        """
+        serving = [endpoint for endpoint in self.endpoints if endpoint.serves(model)]
+        if not serving:
+            raise Exception(f"No endpoint serves the model {model}")
+        # When no endpoint is healthy, the unhealthy ones are tried anyway
+        healthy = [endpoint for endpoint in serving if endpoint.healthy()]
+        return sorted(healthy or serving, key=lambda endpoint: (endpoint.score(), endpoint.in_flight))
+
+    def __succeeded(self, endpoint: Endpoint, started: float):
+        duration = time.perf_counter() - started
+        endpoint.latency = duration if endpoint.latency is None else (
+            self.smoothing * duration + (1 - self.smoothing) * endpoint.latency)
+        endpoint.consecutive_failures = 0
+        current_span().set(endpoint=endpoint.name)
+
+    def __failed(self, endpoint: Endpoint):
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.failure_threshold:
+            endpoint.unhealthy_until = time.monotonic() + self.cooldown
+
+    async def chat(self, model, messages, options=None, keep_alive=None, tools=None):
+        model = self.resolve(model)
+        last_error = None
+        for endpoint in self.candidates(model)[:self.max_attempts]:
+            started = time.perf_counter()
+            endpoint.in_flight += 1
+            endpoint.calls += 1
+            try:
+                response = await endpoint.backend.chat(model=model, messages=messages, options=options,
+                                                       keep_alive=keep_alive, tools=tools)
+            except Exception as e:
+                self.__failed(endpoint)
+                last_error = e
+                continue
+            finally:
+                endpoint.in_flight -= 1
+            self.__succeeded(endpoint, started)
+            return response
+        raise last_error
+
+    async def chat_stream(self, model, messages, options=None, keep_alive=None):
+        model = self.resolve(model)
+        last_error = None
+        for endpoint in self.candidates(model)[:self.max_attempts]:
+            started = time.perf_counter()
+            endpoint.in_flight += 1
+            endpoint.calls += 1
+            received, finished, failed = False, False, False
+            try:
+                stream = endpoint.backend.chat_stream(model=model, messages=messages, options=options,
+                                                      keep_alive=keep_alive)
+                async with aclosing(stream) as chunks:
+                    async for chunk in chunks:
+                        received = True
+                        yield chunk
+                finished = True
+            except Exception as e:
+                failed = True
+                self.__failed(endpoint)
+                if received:
+                    raise
+                last_error = e
+                continue
+            finally:
+                endpoint.in_flight -= 1
+                # The agent closes the stream at the first complete line, that is a success as well
+                if not failed and (received or finished):
+                    self.__succeeded(endpoint, started)
+            return
+        raise last_error
+
+    async def preload(self, model, keep_alive=None):
+        model = self.resolve(model)
+        await asyncio.gather(*[endpoint.backend.preload(model, keep_alive=keep_alive)
+                               for endpoint in self.endpoints if endpoint.serves(model)])
+
+    async def health(self):
+        return any((await self.check_health()).values())
+
+    async def check_health(self) -> dict[str, bool]:
+        """
+        Checks all endpoints, a healthy endpoint is used again right away, an unhealthy one is skipped for
+        cooldown seconds.
+        """
+        results = await asyncio.gather(*[endpoint.backend.health() for endpoint in self.endpoints],
+                                       return_exceptions=True)
+        for endpoint, healthy in zip(self.endpoints, results):
+            if healthy is True:
+                endpoint.unhealthy_until = 0.0
+                endpoint.consecutive_failures = 0
+            else:
+                endpoint.unhealthy_until = time.monotonic() + self.cooldown
+        return {endpoint.name: healthy is True for endpoint, healthy in zip(self.endpoints, results)}
+
+    async def run_health_checks(self, interval: float = 10.0):
+        """
+        Checks the health of the endpoints every interval seconds, run it as a task next to the agents.
+        """
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {endpoint.name: endpoint.stats() for endpoint in self.endpoints}
@@ -1,39 +1,124 @@
+import re
+
 from bring_a_crew import action_agent_log
 from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.availability import describe_slots, get_default_store, join_words
+from bring_a_crew.fast_path import DATE_PATTERN, TIMESLOT_PATTERN, FastPath, Intent
+from bring_a_crew.llm_backend import DEFAULT_MODEL
+
+DATE_RE = re.compile(r'\b\d{4}-\d{2}-\d{2}\b')
+# People that take over when someone is away
+REPLACEMENTS = {"alice": "Charlie"}
+
 
 def check_availability(date: str, person: str):
     action_agent_log.info("check_availability: date=%s, person=%s", date, person)
-    if person.lower() == "alice":
-        return f"{person} is not available in the week starting with {date}, Charlie will replace her until further notice."
-    elif person.lower() == "bob":
-        return f"{person} is available in the week starting with {date} on Monday, Tuesday, and Thursday."
-    elif person.lower() == "charlie":
-        return f"{person} is not available in the week starting with {date} on Monday in the morning, Tuesday, Thursday, and Friday in the morning."
-    else:
+    store = get_default_store()
+    if not store.has_person(person):
         return f"{person} is unknown to the system."
+    try:
+        slots = store.free_slots([person], date)
+    except ValueError as e:
+        return f"Cannot check the availability of {person}: {e}"
+    if slots:
+        return f"{person} is available in the week starting with {date} on {describe_slots(slots)}."
+    replacement = REPLACEMENTS.get(person.strip().lower())
+    if replacement is not None:
+        return f"{person} is not available in the week starting with {date}, {replacement} will replace them until further notice."
+    return f"{person} is not available in the week starting with {date}."
+
+
+def check_availability_batch(requests: list[dict]):
+    # The store answers from memory, one call for all requests of the batch
+    return [check_availability(**request) for request in requests]
+
+
+def check_common_availability(date: str, people: str):
+    action_agent_log.info("check_common_availability: date=%s, people=%s", date, people)
+    store = get_default_store()
+    names = [name.strip() for name in re.split(r',|\band\b', people) if name.strip()]
+    unknown = [name for name in names if not store.has_person(name)]
+    if unknown:
+        return f"{join_words(unknown)} {'is' if len(unknown) == 1 else 'are'} unknown to the system."
+    try:
+        # One intersection of the bitsets of all people
+        slots = store.free_slots(names, date)
+    except ValueError as e:
+        return f"Cannot check the availability of {join_words(names)}: {e}"
+    if not slots:
+        return f"{join_words(names)} are not available together in the week starting with {date}."
+    return f"{join_words(names)} are all available in the week starting with {date} on {describe_slots(slots)}."
+
+
+def predict_availability_checks(command: str, previous_calls: list[tuple[str, dict]]):
+    """
+    The availability is checked for every known person in the command, in the week of a date in the command or
+    of an earlier check.
+    """
+    store = get_default_store()
+    checked = [arguments for action, arguments in previous_calls if action == "check_availability"]
+    dates = DATE_RE.findall(command) or [arguments.get("date") for arguments in checked]
+    people = [store.name(word) for word in dict.fromkeys(re.findall(r'\b[A-Za-z]+\b', command))
+              if store.has_person(word)]
+    predicted = [{"date": date, "person": person} for date in dict.fromkeys(dates) for person in people]
+    return [arguments for arguments in predicted if arguments not in checked]
 
 
 def book_person(date: str, timeslot: str, person: str):
     action_agent_log.info("book_person: date=%s, timeslot=%s, person=%s", date, timeslot, person)
+    store = get_default_store()
+    if not store.has_person(person):
+        return f"{person} is unknown to the system."
+    try:
+        booked = store.book_person(person, date, timeslot)
+    except ValueError as e:
+        return f"Cannot book {person}: {e}"
+    if not booked:
+        return f"{person} is not available on {date} at {timeslot}."
     return f"{person} is booked for a meeting on {date} at {timeslot}."
 
 
-def create_agent():
+FAST_PATH_INTENTS = [
+    Intent("check_availability", rf'(?:check (?:the )?)?availability (?:of|for) (?P<person>[a-z]+) (?:in|for) the week (?:of|starting (?:with|on)) (?P<date>{DATE_PATTERN})'),
+    Intent("check_availability", rf'is (?P<person>[a-z]+) available in the week (?:of|starting (?:with|on)) (?P<date>{DATE_PATTERN})'),
+    Intent("book_person", rf'book (?P<person>[a-z]+) (?:for a meeting )?on (?P<date>{DATE_PATTERN}) (?:in the |at )?(?P<timeslot>{TIMESLOT_PATTERN})')
+]
+
+
+def create_agent(model: str = DEFAULT_MODEL, fast_path: bool = False):
     return ActionAgent(
         name="schedule_manager",
+        model=model,
+        fast_path=FastPath(FAST_PATH_INTENTS, learn=True) if fast_path else None,
+        is_name=lambda word: get_default_store().has_person(word),
         intro="This agent manages the schedule of people. You can check for availability of people and book them for a meeting.",
         actions={
             "check_availability": {
                 "description": "Ask for the availability of a person during a week, providing the start of the week. Availability for a person is in the morning and or the afternoon.",
                 "function": check_availability,
+                "inline": True,
+                "batch_function": check_availability_batch,
+                "cache_ttl": 60,
+                "predict": predict_availability_checks,
                 "arguments": [
                     {"name": "date", "type": "str"},
                     {"name": "person", "type": "str"}
                 ]
             },
+            "check_common_availability": {
+                "description": "Ask when a group of people are all available during a week, providing the start of the week and the names separated by commas.",
+                "function": check_common_availability,
+                "inline": True,
+                "cache_ttl": 60,
+                "arguments": [
+                    {"name": "date", "type": "str"},
+                    {"name": "people", "type": "str"}
+                ]
+            },
             "book_person": {
                 "description": "Book a person for a meeting on a given date and time.",
                 "function": book_person,
+                "inline": True,
                 "arguments": [
                     {"name": "date", "type": "str"},
                     {"name": "timeslot", "type": "str"},
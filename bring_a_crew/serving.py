@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Callable
+
+from bring_a_crew.budget import Budget, PartialAnswer, use_budget
+from bring_a_crew.checkpoint import CheckpointStore
+from bring_a_crew.orchestration_agent import OrchestrationAgent
+from bring_a_crew.tracing import get_tracer
+
+
+class EngineOverloaded(Exception):
+    """
+    Raised when a request is not admitted, because the queue of the engine stays full.
+    """
+
+
+def percentile(values, q: float) -> float | None:
+    """
+    The q-th percentile (0-100) of the values, using the nearest rank.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _isolate(agent: OrchestrationAgent):
+    # Each request starts with an empty history, for the orchestrator and all agents it calls
+    agent.memory.isolate_calls = True
+    for known_agent in agent.known_agents.values():
+        known_agent.memory.isolate_calls = True
+
+
+class ServingEngine:
+    """
+    Serves questions with a pool of workers. Questions are put on a bounded queue, each worker takes the next
+    question and answers it with a new agent from create_agent, so the memory of a request is never shared with
+    another request. Use a factory that returns a session of a pre-built agent, like the sessions of an
+    AgentRegistry, to keep this cheap. When the queue is full, a new request waits at most admission_timeout seconds for a
+    place in the queue, after that it is rejected with EngineOverloaded. The number of workers limits the number
+    of requests that use the LLM at the same time.
+
+    With a CheckpointStore, every request is checkpointed under its request id. A request that is submitted again
+    with the same id, for instance by a client that retries after a restart of the server, resumes from its last
+    completed step, or returns its answer when it was finished.
+
+    Every request gets a Budget: at most request_timeout seconds from the moment it was queued, max_tokens tokens
+    and max_turns LLM calls over the orchestrator and its agents. A request that runs out of budget is answered
+    with a PartialAnswer, which bounds the latency of a question.
+    """
+    def __init__(self, create_agent: Callable[[], OrchestrationAgent], workers: int = 8, queue_size: int = 64,
+                 admission_timeout: float = 0.0, latency_window: int = 1000,
+                 checkpoints: CheckpointStore | None = None, request_timeout: float | None = None,
+                 max_tokens: int | None = None, max_turns: int | None = None):
+        self.log = logging.getLogger("main.ServingEngine")
+        self.create_agent = create_agent
+        self.workers = workers
+        self.queue_size = queue_size
+        self.admission_timeout = admission_timeout
+        self.checkpoints = checkpoints
+        self.request_timeout = request_timeout
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self._running = {}
+        self._queue = None
+        self._tasks = []
+        self._server = None
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.partial = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.queue_waits = deque(maxlen=latency_window)
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self.__work(), name=f"serving-worker-{i}"))
+        self.log.info("Started %d workers", self.workers)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def submit(self, question: str, request_id: str | None = None) -> str:
+        """
+        Puts the question on the queue and waits for the answer. A request with the id of a request that is
+        still running waits for the answer of that request.
+        """
+        if request_id is not None and request_id in self._running:
+            return await asyncio.shield(self._running[request_id])
+        if request_id is None and self.checkpoints is not None:
+            request_id = uuid.uuid4().hex
+
+        future = asyncio.get_running_loop().create_future()
+        # Registered before the first await, so a request with the same id that comes in meanwhile joins this one
+        if request_id is not None:
+            self._running[request_id] = future
+            future.add_done_callback(
+                lambda _: self._running.pop(request_id) if self._running.get(request_id) is future else None)
+        request = (question, request_id, future, time.perf_counter())
+        try:
+            if self.admission_timeout > 0:
+                await asyncio.wait_for(self._queue.put(request), timeout=self.admission_timeout)
+            else:
+                self._queue.put_nowait(request)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.rejected += 1
+            error = EngineOverloaded(f"Queue is full with {self._queue.qsize()} requests")
+            # The requests that joined this one are rejected as well
+            future.set_exception(error)
+            future.exception()
+            raise error
+        return await future
+
+    async def resume_unfinished(self) -> dict:
+        """
+        Resumes the checkpointed requests that did not finish, like the requests that were running when the
+        server stopped. Returns the answers by request id.
+        """
+        unfinished = self.checkpoints.unfinished() if self.checkpoints is not None else []
+        results = await asyncio.gather(*[self.submit(question, request_id) for request_id, question in unfinished],
+                                       return_exceptions=True)
+        return {request_id: result for (request_id, _), result in zip(unfinished, results)}
+
+    async def __work(self):
+        while True:
+            question, request_id, future, enqueued = await self._queue.get()
+            started = time.perf_counter()
+            self.queue_waits.append(started - enqueued)
+            self.in_flight += 1
+            try:
+                agent = self.create_agent()
+                _isolate(agent)
+                # The time in the queue counts against the deadline of the request
+                timeout = self.request_timeout - (started - enqueued) if self.request_timeout is not None else None
+                with use_budget(Budget(timeout=timeout, max_tokens=self.max_tokens, max_turns=self.max_turns)):
+                    if self.checkpoints is not None and request_id is not None:
+                        answer = await self.checkpoints.run(request_id, question, agent.acall_agent)
+                    else:
+                        answer = await agent.acall_agent(question)
+                self.completed += 1
+                if isinstance(answer, PartialAnswer):
+                    self.partial += 1
+                if not future.done():
+                    future.set_result(answer)
+            except Exception as e:
+                self.failed += 1
+                self.log.error("Failed to answer %s: %s", question, e)
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.in_flight -= 1
+                self.latencies.append(time.perf_counter() - enqueued)
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "partial": self.partial,
+            "latency": {f"p{q}": percentile(self.latencies, q) for q in (50, 90, 99)},
+            "queue_wait": {f"p{q}": percentile(self.queue_waits, q) for q in (50, 90, 99)}
+        }
+
+    async def serve_http(self, host: str = "127.0.0.1", port: int = 8080):
+        """
+        Starts a small HTTP server. POST a json document with a question to /ask, GET /stats for the metrics of the
+        engine and GET /metrics for the metrics of the tracer in the Prometheus text format.
+        """
+        self._server = await asyncio.start_server(self.__handle_http, host, port)
+        self.log.info("Listening on http://%s:%d", host, port)
+        return self._server
+
+    async def __handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                length = -1
+            body = await reader.readexactly(length) if length > 0 else b""
+
+            if len(request_line) < 2 or length < 0:
+                status, response = 400, {"error": "Bad request"}
+            elif request_line[:2] == ["GET", "/stats"]:
+                status, response = 200, self.stats()
+            elif request_line[:2] == ["GET", "/metrics"]:
+                status, response = 200, get_tracer().to_prometheus()
+            elif request_line[:2] == ["POST", "/ask"]:
+                status, response = await self.__ask(body)
+            else:
+                status, response = 404, {"error": "Not found"}
+
+            if isinstance(response, str):
+                content, content_type = response.encode("utf-8"), "text/plain; version=0.0.4"
+            else:
+                content, content_type = json.dumps(response).encode("utf-8"), "application/json"
+            writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(content)}\r\nConnection: close\r\n\r\n".encode("latin-1") + content)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def __ask(self, body: bytes) -> tuple[int, dict]:
+        try:
+            document = json.loads(body)
+            question = document["question"]
+            request_id = document.get("request_id")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": "Expected a json document with a question"}
+        try:
+            answer = await self.submit(question, request_id)
+            return 200, {"answer": answer, "complete": not isinstance(answer, PartialAnswer)}
+        except EngineOverloaded as e:
+            return 429, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
@@ -0,0 +1,278 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from typing import Callable
+
+from bring_a_crew.serving import _isolate, percentile
+from bring_a_crew.tool_executor import get_default_executor
+
+
+class _Worker:
+    """
+    Runs in a worker process. Requests come in over the pipe, every request runs in its own task on the event
+    loop of the process, the result and its metrics go back over the same pipe.
+    """
+    def __init__(self, conn, create_agent: Callable, max_sessions: int):
+        self.conn = conn
+        self.create_agent = create_agent
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.tasks = set()
+        self.completed = 0
+        self.failed = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = loop.create_future()
+        # Build the agents before the first request comes in
+        self.create_agent()
+        threading.Thread(target=self.__read, args=(loop,), daemon=True).start()
+        await self.stopped
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def __read(self, loop):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                message = ("stop",)
+            loop.call_soon_threadsafe(self.__handle, message)
+            if message[0] == "stop":
+                return
+
+    def __handle(self, message):
+        if message[0] == "ask":
+            task = asyncio.create_task(self.__ask(*message[1:]))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        elif message[0] == "stats":
+            self.conn.send(("stats", message[1], self.stats()))
+        elif message[0] == "stop" and not self.stopped.done():
+            self.stopped.set_result(None)
+
+    def __session(self, session_key: str | None):
+        if session_key is None:
+            agent = self.create_agent()
+            _isolate(agent)
+            return agent, None
+        # The requests of a session share the memory of its agent, they run one after the other
+        session = self.sessions.get(session_key)
+        if session is None:
+            session = self.sessions[session_key] = (self.create_agent(), asyncio.Lock())
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        self.sessions.move_to_end(session_key)
+        return session
+
+    async def __ask(self, request_id: int, session_key: str | None, question: str):
+        started = time.perf_counter()
+        answer, error = None, None
+        try:
+            agent, lock = self.__session(session_key)
+            if lock is None:
+                answer = await agent.acall_agent(question)
+            else:
+                async with lock:
+                    answer = await agent.acall_agent(question)
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            error = f"{type(e).__name__}: {e}"
+        metrics = {"pid": os.getpid(), "latency": time.perf_counter() - started}
+        self.conn.send(("result", request_id, answer, error, metrics))
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "in_flight": len(self.tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "sessions": len(self.sessions),
+            "tool_executor": get_default_executor().stats()
+        }
+
+
+def _worker_main(conn, create_agent: Callable, initializer: Callable | None, max_sessions: int):
+    if initializer is not None:
+        initializer()
+    asyncio.run(_Worker(conn, create_agent, max_sessions).run())
+
+
+class _Shard:
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.pending = {}
+        self.completed = 0
+        self.failed = 0
+        # False once the pipe to the process is closed, the shard gets no new requests
+        self.alive = True
+
+
+class ShardedEngine:
+    """
+    Answers questions with OrchestrationAgents in a pool of worker processes, so the Python work of the agent loops
+    is spread over the cores. Every process builds its agents once with create_agent, which has to be a function
+    that can be pickled, like run_orchestration.create_orchestration_agent. The initializer runs first in every
+    process, for instance to set the default backend.
+
+    Questions with the same session_key always go to the same process and share the memory of one agent, so a
+    conversation stays local to its process. Questions without a session key go to the process with the fewest
+    questions in flight and get a new agent. Answers and metrics come back over a pipe per process.
+
+    When a process dies, its questions in flight fail and a new process takes its place, the sessions of the dead
+    process start again with an empty memory.
+    """
+    def __init__(self, create_agent: Callable, processes: int | None = None, initializer: Callable | None = None,
+                 max_sessions: int = 1024, latency_window: int = 1000):
+        self.log = logging.getLogger("main.ShardedEngine")
+        self.create_agent = create_agent
+        self.processes = processes or os.cpu_count() or 1
+        self.initializer = initializer
+        self.max_sessions = max_sessions
+        self._shards = []
+        self._ids = itertools.count(1)
+        self._stopping = False
+        self.restarts = 0
+        self.latencies = deque(maxlen=latency_window)
+
+    def __start_shard(self, index: int, loop: asyncio.AbstractEventLoop) -> _Shard:
+        # Spawn fresh processes, forking a process with a running event loop and threads is not safe
+        context = multiprocessing.get_context("spawn")
+        conn, worker_conn = context.Pipe()
+        process = context.Process(target=_worker_main, name=f"shard-{index}", daemon=True,
+                                  args=(worker_conn, self.create_agent, self.initializer, self.max_sessions))
+        process.start()
+        worker_conn.close()
+        shard = _Shard(index, process, conn)
+        threading.Thread(target=self.__read, args=(shard, loop), daemon=True).start()
+        return shard
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._shards = [self.__start_shard(index, loop) for index in range(self.processes)]
+        self.log.info("Started %d worker processes", self.processes)
+
+    async def stop(self):
+        self._stopping = True
+        for shard in self._shards:
+            try:
+                shard.conn.send(("stop",))
+            except OSError:
+                pass
+        for shard in self._shards:
+            await asyncio.to_thread(shard.process.join, 10)
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.conn.close()
+        self._shards = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def __read(self, shard: _Shard, loop: asyncio.AbstractEventLoop):
+        while True:
+            try:
+                message = shard.conn.recv()
+            except (EOFError, OSError):
+                break
+            loop.call_soon_threadsafe(self.__resolve, shard, message)
+        loop.call_soon_threadsafe(self.__stopped, shard, loop)
+
+    def __resolve(self, shard: _Shard, message):
+        future = shard.pending.pop(message[1], None)
+        if future is None or future.done():
+            return
+        if message[0] == "stats":
+            future.set_result(message[2])
+            return
+        _, _, answer, error, metrics = message
+        self.latencies.append(metrics["latency"])
+        if error is not None:
+            shard.failed += 1
+            future.set_exception(Exception(error))
+        else:
+            shard.completed += 1
+            future.set_result(answer)
+
+    def __stopped(self, shard: _Shard, loop: asyncio.AbstractEventLoop):
+        """
+        The pipe to the process of the shard is closed: its questions in flight fail and, unless the engine is
+        stopping, a new process takes its place.
+        """
+        shard.alive = False
+        for future in shard.pending.values():
+            if not future.done():
+                future.set_exception(Exception(f"Worker process {shard.index} stopped"))
+        shard.pending.clear()
+        if self._stopping or shard not in self._shards:
+            return
+        self.log.warning("Worker process %d stopped, starting a new one", shard.index)
+        try:
+            self._shards[shard.index] = self.__start_shard(shard.index, loop)
+            self.restarts += 1
+        except Exception as e:
+            self.log.error("Failed to restart worker process %d: %s", shard.index, e)
+
+    def shard_for(self, session_key: str | None) -> _Shard:
+        if session_key is None:
+            alive = [shard for shard in self._shards if shard.alive]
+            if not alive:
+                raise Exception("No worker process is running")
+            return min(alive, key=lambda shard: len(shard.pending))
+        # A stable hash, the same session goes to the same process
+        return self._shards[zlib.crc32(session_key.encode("utf-8")) % len(self._shards)]
+
+    def __send(self, shard: _Shard, request_id: int, message: tuple) -> asyncio.Future:
+        """
+        Sends a message that expects a reply, fails at once when the process of the shard is gone.
+        """
+        if not shard.alive:
+            raise Exception(f"Worker process {shard.index} stopped")
+        future = shard.pending[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            shard.conn.send(message)
+        except (OSError, ValueError) as e:
+            shard.pending.pop(request_id, None)
+            shard.alive = False
+            raise Exception(f"Worker process {shard.index} stopped: {e}") from e
+        return future
+
+    async def submit(self, question: str, session_key: str | None = None) -> str:
+        shard = self.shard_for(session_key)
+        request_id = next(self._ids)
+        return await self.__send(shard, request_id, ("ask", request_id, session_key, question))
+
+    async def worker_stats(self) -> list[dict]:
+        """
+        The stats reported by the worker processes.
+        """
+        futures = []
+        for shard in self._shards:
+            if shard.alive:
+                request_id = next(self._ids)
+                futures.append(self.__send(shard, request_id, ("stats", request_id)))
+        return await asyncio.gather(*futures)
+
+    def stats(self) -> dict:
+        return {
+            "processes": len(self._shards),
+            "restarts": self.restarts,
+            "in_flight": [len(shard.pending) for shard in self._shards],
+            "completed": sum(shard.completed for shard in self._shards),
+            "failed": sum(shard.failed for shard in self._shards),
+            "latency": {f"p{q}": percentile(self.latencies, q) for q in (50, 90, 99)}
+        }
@@ -0,0 +1,31 @@
+import re
+from contextlib import aclosing
+from typing import AsyncIterator, Callable
+
+
+async def read_until_complete_line(chunks: AsyncIterator, line_res: list[re.Pattern],
+                                   on_chunk: Callable[[str], None] | None = None) -> str:
+    """
+    Reads the content from a stream of ChatResponse chunks. As soon as a complete line matches one of the
+    regular expressions, the stream is closed, which cancels the generation on the server. The content is cut
+    after that line, so text the model wrote after it, like an invented observation, is dropped. Every chunk of
+    content is passed to on_chunk, so callers can follow the partial response.
+    """
+    content = ""
+    checked_until = 0
+    async with aclosing(chunks) as stream:
+        async for chunk in stream:
+            text = chunk.message.content or ""
+            if on_chunk is not None and text:
+                on_chunk(text)
+            content += text
+
+            # Only lines that end with a newline are complete
+            end_of_lines = content.rfind("\n")
+            if end_of_lines < checked_until:
+                continue
+            for line in content[checked_until:end_of_lines].split("\n"):
+                if any(line_re.match(line) for line_re in line_res):
+                    return content[:checked_until + len(line)]
+                checked_until += len(line) + 1
+    return content
@@ -0,0 +1,361 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from bring_a_crew.tracing import current_span
+
+_MISSING = object()
+# The separators of a list of names in one argument, like "Bob, Charlie and Dave"
+_LIST_SEPARATOR_RE = re.compile(r'\s*(?:,|\band\b)\s*')
+
+
+class ToolTimeout(TimeoutError):
+    """
+    Raised when an action does not finish within the timeout of its definition.
+    """
+
+
+class ToolStats:
+    """
+    The calls of one action, with the time spent waiting for a place to run and the time spent running.
+    """
+    def __init__(self, window: int = 1000):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.queue_times = deque(maxlen=window)
+        self.run_times = deque(maxlen=window)
+
+    def to_dict(self) -> dict:
+        # Imported here, the serving module imports the agents which import this module
+        from bring_a_crew.serving import percentile
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "queue_time": {f"p{q}": percentile(list(self.queue_times), q) for q in (50, 99)},
+            "run_time": {f"p{q}": percentile(list(self.run_times), q) for q in (50, 99)}
+        }
+
+
+def _split_values(values) -> set[str]:
+    return {item for value in values for item in _LIST_SEPARATOR_RE.split(str(value).strip().lower()) if item}
+
+
+def is_idempotent(definition: dict) -> bool:
+    """
+    Cacheable actions only read, other actions have side effects unless they are marked `idempotent`.
+    """
+    return bool(definition.get("pure") or definition.get("idempotent")) or definition.get("cache_ttl") is not None
+
+
+class ToolExecutor:
+    """
+    Executes the functions of actions. The definition of an action can declare how its results can be reused:
+     - `pure`: the result only depends on the arguments, it is cached without expiry.
+     - `cache_ttl`: the result is cached for the given number of seconds.
+     - `batch_function`: a function that receives a list of argument dicts and returns a list of results. Calls
+       that arrive within batch_window seconds of each other are combined into one call of the batch function,
+       which runs like a call of the action itself, with its timeout, concurrency limit, retries and stats.
+    Concurrent calls with the same arguments to a cacheable action share one execution. One executor is shared
+    by all agents, so results are reused across agents and requests. Cacheable actions can also be prefetched,
+    to run a likely call while the model is still generating.
+
+    The function of an action can be an `async def` function, it is awaited on the event loop. A plain function
+    runs on a pool of threads, so a function that waits for a database or a remote service does not block the
+    event loop. Mark a cheap in-memory function `inline` to call it on the event loop instead, without the hop to
+    a thread; it also runs atomically between the other tasks of the loop. The definition can also set:
+     - `timeout`: the seconds a call may take, including the wait for a place to run. A slow call raises a
+       ToolTimeout instead of holding up the agent, a call on a thread keeps its thread until it returns. An
+       inline call cannot be interrupted, the timeout only applies to async functions and calls on the threads.
+     - `max_concurrency`: the number of calls of the action that run at the same time, the others wait.
+     - `retries` and `retry_backoff`: the number of times a failed call is tried again, with a backoff in
+       seconds that doubles every time. Only idempotent actions are retried, a booking is never made twice.
+    stats() reports the calls, errors, timeouts, retries and the queue and run times per action.
+    """
+    def __init__(self, batch_window: float = 0.005, threads: int = 8, default_timeout: float | None = None):
+        self.log = logging.getLogger("main.ToolExecutor")
+        self.batch_window = batch_window
+        self.threads = threads
+        self.default_timeout = default_timeout
+        self._pool = None
+        self._limits = {}
+        self._tool_stats = {}
+        self._cache = {}
+        self._in_flight = {}
+        self._batches = {}
+        self._batch_tasks = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_calls = 0
+        self._prefetched = set()
+        self.prefetches = 0
+        self.prefetch_hits = 0
+
+    @staticmethod
+    def __ttl(definition: dict):
+        return None if definition.get("pure") else definition.get("cache_ttl")
+
+    @staticmethod
+    def __cacheable(definition: dict) -> bool:
+        return bool(definition.get("pure")) or definition.get("cache_ttl") is not None
+
+    async def execute(self, definition: dict, arguments: dict):
+        if not self.__cacheable(definition):
+            return await self.__run(definition, arguments)
+
+        key = (definition["function"], json.dumps(arguments, sort_keys=True))
+        result = self.__cached(key)
+        if result is not _MISSING:
+            self.hits += 1
+            current_span().set(cache_hit=True)
+            self.__count_prefetch_hit(key)
+            return result
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            current_span().set(coalesced=True)
+            self.__count_prefetch_hit(key)
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        return await self.__complete(key, self.__register(key), definition, arguments)
+
+    def prefetch(self, definition: dict, arguments: dict) -> asyncio.Task | None:
+        """
+        Starts a call in the background, so a later execute with the same arguments gets the result from the cache
+        or joins the call in flight. Only cacheable actions, which are read-only, are prefetched. Returns None when
+        the action is not cacheable or the result is already cached or in flight. A prefetched result that is
+        never asked for stays in the cache until it expires, like any other result.
+        """
+        if not self.__cacheable(definition):
+            return None
+        key = (definition["function"], json.dumps(arguments, sort_keys=True))
+        if key in self._in_flight or self.__cached(key) is not _MISSING:
+            return None
+        self.prefetches += 1
+        self._prefetched.add(key)
+        task = asyncio.create_task(self.__complete(key, self.__register(key), definition, arguments))
+        # Nobody awaits the task, an exception is raised again to the callers that join the call
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return task
+
+    def __count_prefetch_hit(self, key):
+        if key in self._prefetched:
+            self._prefetched.discard(key)
+            self.prefetch_hits += 1
+            current_span().set(prefetched=True)
+
+    def __register(self, key) -> asyncio.Future:
+        # The call is registered before it starts, so a call that comes in before the first await joins it
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        return future
+
+    async def __complete(self, key, future: asyncio.Future, definition: dict, arguments: dict):
+        ttl = self.__ttl(definition)
+        try:
+            result = await self.__run(definition, arguments)
+            self._cache[key] = (result, None if ttl is None else time.monotonic() + ttl)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # The exception is raised to this caller, mark it as retrieved for the future
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._in_flight[key]
+
+    def __cached(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return _MISSING
+        result, expires = entry
+        if expires is not None and time.monotonic() > expires:
+            del self._cache[key]
+            self._prefetched.discard(key)
+            return _MISSING
+        return result
+
+    async def __run(self, definition: dict, arguments: dict):
+        if "batch_function" not in definition:
+            return await self.__call(definition, arguments)
+
+        loop = asyncio.get_running_loop()
+        batch_key = (loop, definition["batch_function"])
+        future = loop.create_future()
+        pending = self._batches.get(batch_key)
+        if pending is None:
+            pending = self._batches[batch_key] = []
+            loop.call_later(self.batch_window, self.__flush, batch_key, definition)
+        pending.append((arguments, future))
+        return await future
+
+    async def __call(self, definition: dict, arguments: dict):
+        name = definition.get("name") or getattr(definition["function"], "__name__", "action")
+        stats = self._tool_stats.get(name)
+        if stats is None:
+            stats = self._tool_stats[name] = ToolStats()
+        attempts = 1 + (definition.get("retries", 0) if is_idempotent(definition) else 0)
+        for attempt in range(attempts):
+            stats.calls += 1
+            try:
+                return await self.__attempt(definition, arguments, stats)
+            except Exception as e:
+                stats.errors += 1
+                if isinstance(e, ToolTimeout):
+                    stats.timeouts += 1
+                if attempt + 1 >= attempts:
+                    raise
+                stats.retries += 1
+                self.log.warning("Retrying %s after: %s", name, e)
+                await asyncio.sleep(definition.get("retry_backoff", 0.1) * 2 ** attempt)
+
+    async def __attempt(self, definition: dict, arguments: dict, stats: ToolStats):
+        function = definition["function"]
+        timeout = definition.get("timeout", self.default_timeout)
+        limit = self.__limit(definition)
+        submitted = time.perf_counter()
+        acquired = False
+        deadline = asyncio.timeout(timeout)
+        try:
+            async with deadline:
+                if limit is not None:
+                    await limit.acquire()
+                    acquired = True
+                if inspect.iscoroutinefunction(function):
+                    return await self.__timed_async(function, arguments, stats, submitted)
+                if definition.get("inline"):
+                    return self.__timed(function, arguments, stats, submitted)
+                call = self.__thread_pool().submit(self.__timed, function, arguments, stats, submitted)
+                if limit is not None:
+                    # The place is given back when the thread is done, also when the caller stopped waiting
+                    loop = asyncio.get_running_loop()
+                    call.add_done_callback(lambda _: loop.call_soon_threadsafe(limit.release))
+                    acquired = False
+                return await asyncio.wrap_future(call)
+        except TimeoutError:
+            if not deadline.expired():
+                raise
+            raise ToolTimeout(f"{definition.get("name", "The action")} did not finish within {timeout} seconds") from None
+        finally:
+            if acquired:
+                limit.release()
+
+    @staticmethod
+    def __timed(function, arguments: dict, stats: ToolStats, submitted: float):
+        started = time.perf_counter()
+        stats.queue_times.append(started - submitted)
+        try:
+            return function(**arguments)
+        finally:
+            stats.run_times.append(time.perf_counter() - started)
+
+    @staticmethod
+    async def __timed_async(function, arguments: dict, stats: ToolStats, submitted: float):
+        started = time.perf_counter()
+        stats.queue_times.append(started - submitted)
+        try:
+            return await function(**arguments)
+        finally:
+            stats.run_times.append(time.perf_counter() - started)
+
+    def __limit(self, definition: dict) -> asyncio.Semaphore | None:
+        if definition.get("max_concurrency") is None:
+            return None
+        # A semaphore belongs to one event loop, the calls of a batch function share the limit of the action
+        key = (asyncio.get_running_loop(), definition.get("batch_function") or definition["function"])
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(definition["max_concurrency"])
+        return limit
+
+    def __thread_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="tool")
+        return self._pool
+
+    def __flush(self, batch_key, definition: dict):
+        pending = self._batches.pop(batch_key)
+        self.batches += 1
+        self.batched_calls += len(pending)
+        # The batch runs in a task of its own, a callback of the loop must not block it
+        task = asyncio.create_task(self.__run_batch(definition, pending))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def __run_batch(self, definition: dict, pending: list):
+        requests = [arguments for arguments, _ in pending]
+        batch = {**definition, "function": functools.partial(definition["batch_function"], requests)}
+        try:
+            results = await self.__call(batch, {})
+            if not isinstance(results, list) or len(results) != len(pending):
+                raise ValueError(f"The batch function of {definition.get("name", "the action")} returned "
+                                 f"{len(results) if isinstance(results, list) else type(results).__name__} results "
+                                 f"for {len(pending)} calls")
+        except Exception as e:
+            # Every call of the batch gets an answer, also when the batch function failed
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+    def invalidate(self, values):
+        """
+        Removes the cached results of the actions with a cache_ttl whose arguments share a value with values, like
+        the person and the date of a booking. A list of values in one argument, like "Bob, Charlie and Dave", counts
+        as its separate values. The results of pure actions never change.
+        """
+        values = _split_values(values)
+        for key, (_, expires) in list(self._cache.items()):
+            if expires is not None and values & _split_values(json.loads(key[1]).values()):
+                del self._cache[key]
+                self._prefetched.discard(key)
+
+    def clear(self):
+        self._cache.clear()
+        self._prefetched.clear()
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "batched_calls": self.batched_calls,
+            "prefetches": self.prefetches,
+            "prefetch_hits": self.prefetch_hits,
+            "tools": {name: stats.to_dict() for name, stats in self._tool_stats.items()}
+        }
+
+
+_default_executor: ToolExecutor | None = None
+
+
+def get_default_executor() -> ToolExecutor:
+    """
+    Returns the executor that is shared by all agents that are not given an executor of their own.
+    """
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = ToolExecutor()
+    return _default_executor
@@ -0,0 +1,221 @@
+import contextvars
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed piece of work, like a turn of an agent, an LLM call or a tool call. Spans started within another span
+    get that span as parent and share its trace id.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, name: str, trace_id: int, span_id: int, parent_id: int | None, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        return ((self.end or time.time_ns()) - self.start) / 1e9
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[i] += 1
+
+
+class Tracer:
+    """
+    Records spans and turns them into metrics. Every finished span adds its duration to a histogram per span name
+    and agent, token counts and cache hits in the attributes of a span are added to counters. The most recent
+    spans are kept for export as a Chrome trace or as OTLP json. A disabled tracer records nothing.
+    """
+    def __init__(self, enabled: bool = True, max_spans: int = 10000):
+        self.enabled = enabled
+        self.spans = deque(maxlen=max_spans)
+        self.counters = defaultdict(float)
+        self.histograms = defaultdict(Histogram)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        span = Span(name,
+                    trace_id=parent.trace_id if parent is not None else next(self._ids),
+                    span_id=next(self._ids),
+                    parent_id=parent.span_id if parent is not None else None,
+                    attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            span.end = time.time_ns()
+            _current_span.reset(token)
+            self.__finish(span)
+
+    def __finish(self, span: Span):
+        labels = (("span", span.name), ("agent", str(span.attributes.get("agent", ""))))
+        with self._lock:
+            self.spans.append(span)
+            self.histograms[("span_duration_seconds", labels)].observe(span.duration)
+            self.counters[("spans_total", labels)] += 1
+            for attribute in ("prompt_tokens", "eval_tokens"):
+                if span.attributes.get(attribute):
+                    self.counters[(f"{attribute}_total", labels)] += span.attributes[attribute]
+            if span.attributes.get("cache_hit"):
+                self.counters[("cache_hits_total", labels)] += 1
+            if "error" in span.attributes:
+                self.counters[("errors_total", labels)] += 1
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self, prefix: str = "bring_a_crew_") -> str:
+        def _labels(labels, extra=()):
+            return "{" + ",".join(f'{key}="{value}"' for key, value in (*labels, *extra)) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {prefix}{name} counter")
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f"{prefix}{name}{_labels(labels)} {value:g}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for bucket, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{prefix}{name}_bucket{_labels(labels, [('le', bucket)])} {count}")
+                    lines.append(f"{prefix}{name}_bucket{_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{prefix}{name}_sum{_labels(labels)} {histogram.sum:g}")
+                    lines.append(f"{prefix}{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_chrome_trace(self) -> dict:
+        """
+        The spans in the Chrome trace event format, open the file in chrome://tracing or Perfetto. Every trace,
+        one question, gets its own row.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        return {"traceEvents": [{
+            "name": span.name,
+            "cat": str(span.attributes.get("agent", "")),
+            "ph": "X",
+            "ts": span.start / 1000,
+            "dur": (span.end - span.start) / 1000,
+            "pid": 1,
+            "tid": span.trace_id,
+            "args": span.attributes
+        } for span in spans]}
+
+    def to_otlp(self, service_name: str = "bring-a-crew") -> dict:
+        """
+        The spans in the OTLP json format, as used by the OpenTelemetry collector.
+        """
+        def _value(value):
+            if isinstance(value, bool):
+                return {"boolValue": value}
+            if isinstance(value, int):
+                return {"intValue": str(value)}
+            if isinstance(value, float):
+                return {"doubleValue": value}
+            return {"stringValue": str(value)}
+
+        with self._lock:
+            spans = list(self.spans)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "bring_a_crew"},
+                "spans": [{
+                    "traceId": f"{span.trace_id:032x}",
+                    "spanId": f"{span.span_id:016x}",
+                    "parentSpanId": f"{span.parent_id:016x}" if span.parent_id is not None else "",
+                    "name": span.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(span.start),
+                    "endTimeUnixNano": str(span.end),
+                    "attributes": [{"key": key, "value": _value(value)} for key, value in span.attributes.items()]
+                } for span in spans]
+            }]
+        }]}
+
+    def write_chrome_trace(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_chrome_trace(), file)
+
+    def write_otlp(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_otlp(), file)
+
+
+def current_span():
+    """
+    The span that is active in the current task, attributes set on it end up in the metrics.
+    """
+    span = _current_span.get()
+    return span if span is not None else _NOOP_SPAN
+
+
+_tracer = Tracer(enabled=False)
+
+
+def get_tracer() -> Tracer:
+    """
+    Returns the tracer used by the agents, it is disabled until enable_tracing is called.
+    """
+    return _tracer
+
+
+def enable_tracing(max_spans: int = 10000) -> Tracer:
+    global _tracer
+    _tracer = Tracer(enabled=True, max_spans=max_spans)
+    return _tracer
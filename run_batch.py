@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import json
+import logging
+
+from bring_a_crew.batch import answer_batch
+from bring_a_crew.registry import get_default_registry
+from bring_a_crew.setup_logging import setup_logging
+from run_orchestration import create_orchestration_agent
+
+
+async def run(questions: list[str], concurrency: int, request_timeout: float | None):
+    await get_default_registry().warm_up(keep_alive=-1)
+    return await answer_batch(create_orchestration_agent, questions, concurrency=concurrency,
+                              request_timeout=request_timeout)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Answer a file of questions, one per line, as one batch")
+    parser.add_argument("questions", help="A text file with a question per line")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, help="Seconds per question")
+    parser.add_argument("--output", default="batch_answers.json")
+    args = parser.parse_args()
+
+    load_dotenv()
+    setup_logging()
+    logging.getLogger("main.ActionAgent").setLevel(logging.WARNING)
+    logging.getLogger("main.OrchestrationAgent").setLevel(logging.WARNING)
+
+    with open(args.questions) as file:
+        questions = [line.strip() for line in file if line.strip()]
+    answers, stats = asyncio.run(run(questions, args.concurrency, args.timeout))
+    with open(args.output, "w") as file:
+        json.dump({"answers": [{"question": question, "answer": str(answer)}
+                               for question, answer in zip(questions, answers)], "stats": stats}, file, indent=2)
+    print(json.dumps(stats, indent=2))
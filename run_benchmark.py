@@ -0,0 +1,69 @@
+import argparse
+import json
+import logging
+
+from bring_a_crew.benchmark import demo_corpus, run_benchmark
+from bring_a_crew.llm_backend import set_default_backend
+from bring_a_crew.registry import AgentRegistry
+from bring_a_crew.tracing import enable_tracing
+from run_orchestration import register_agents
+
+
+def orchestration_runner(backend):
+    set_default_backend(backend)
+    # The agents are built with the backend of the benchmark, every question gets its own session
+    registry = register_agents(AgentRegistry())
+
+    async def _run(question):
+        return await registry.session("orchestration_agent").acall_agent(question)
+    return _run
+
+
+def room_manager_runner(backend):
+    set_default_backend(backend)
+    registry = register_agents(AgentRegistry())
+
+    async def _run(command):
+        return await registry.session("room_manager").aperform_action(command)
+    return _run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the agents against a scripted fake LLM")
+    parser.add_argument("--target", choices=["orchestration", "room_manager"], default="orchestration")
+    parser.add_argument("--corpus", help="A json file with questions and the script for the fake LLM")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64, 256])
+    parser.add_argument("--questions", type=int, help="The number of questions per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--trace", help="Write the spans as a Chrome trace to this file")
+    args = parser.parse_args()
+
+    # Logging every prompt and response would dominate the measurements
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.corpus:
+        with open(args.corpus) as file:
+            corpus = json.load(file)
+    else:
+        corpus = demo_corpus()
+    if args.target == "room_manager":
+        corpus = {**corpus, "questions": [key for key in corpus["script"] if key.startswith("book a room")]}
+
+    tracer = enable_tracing() if args.trace else None
+    results = run_benchmark(
+        orchestration_runner if args.target == "orchestration" else room_manager_runner,
+        corpus,
+        concurrency_levels=args.concurrency,
+        questions_per_level=args.questions,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        output=args.output
+    )
+    for level in results["levels"]:
+        print(f"concurrency {level['concurrency']:>4}: {level['throughput_qps']:8.1f} questions/s, "
+              f"p50 {level['latency']['p50']:.3f}s, p99 {level['latency']['p99']:.3f}s, "
+              f"python {level['python_time_per_question'] * 1000:.1f}ms/question")
+    if tracer is not None:
+        tracer.write_chrome_trace(args.trace)
@@ -1,31 +1,63 @@
 import logging
 
-from dotenv import load_dotenv
-
+from bring_a_crew.agent_cache import AgentResultCache
 from bring_a_crew.food_manager_action_agent import create_agent as create_agent_food_manager
+from bring_a_crew.llm_backend import DEFAULT_MODEL
 from bring_a_crew.orchestration_agent import OrchestrationAgent
+from bring_a_crew.registry import AgentRegistry, get_default_registry
 from bring_a_crew.room_manager_action_agent import create_agent as create_agent_room_manager
 from bring_a_crew.schedule_manager_action_agent import create_agent as create_agent_schedule_manager
 from bring_a_crew.setup_logging import setup_logging
 
 
-def main(question: str):
-    main_log.info("Start handling question: %s", question)
-    room_manager = create_agent_room_manager()
-    schedule_manager = create_agent_schedule_manager()
-    food_manager = create_agent_food_manager()
-
-    or_agent = OrchestrationAgent(
+def register_agents(registry: AgentRegistry, models: dict[str, str] | None = None,
+                    fast_path: bool = False, agent_cache: AgentResultCache | None = None) -> AgentRegistry:
+    """
+    Registers the agents of the crew, they are built on first use. Models maps the name of an agent to its model,
+    or to a tier of a RoutingBackend like "fast", the other agents use the default model. With fast_path, the
+    agents answer the commands they recognise without the LLM. The agent_cache keeps the results of the agents
+    for the orchestrator, across requests.
+    """
+    models = models or {}
+    registry.register("room_manager", lambda: create_agent_room_manager(
+        model=models.get("room_manager", DEFAULT_MODEL), fast_path=fast_path))
+    registry.register("schedule_manager", lambda: create_agent_schedule_manager(
+        model=models.get("schedule_manager", DEFAULT_MODEL), fast_path=fast_path))
+    registry.register("food_manager", lambda: create_agent_food_manager(
+        model=models.get("food_manager", DEFAULT_MODEL), fast_path=fast_path))
+    registry.register("orchestration_agent", lambda parallel_actions=False, planning=False: OrchestrationAgent(
         name="orchestration_agent",
         description="This agent orchestrates the conversation between the user and the other agents",
-        agents=[room_manager, food_manager, schedule_manager]
-    )
+        agents=[registry.get("room_manager"), registry.get("food_manager"), registry.get("schedule_manager")],
+        parallel_actions=parallel_actions,
+        planning=planning,
+        model=models.get("orchestration_agent", DEFAULT_MODEL),
+        agent_cache=agent_cache
+    ))
+    return registry
+
+
+register_agents(get_default_registry())
+
+
+def create_orchestration_agent(parallel_actions: bool = False, planning: bool = False):
+    """
+    A session of the orchestrator and its agents for one question, the agents themselves are only built once.
+    """
+    return get_default_registry().session("orchestration_agent", parallel_actions=parallel_actions, planning=planning)
+
+
+def main(question: str, parallel_actions: bool = False):
+    main_log.info("Start handling question: %s", question)
+    or_agent = create_orchestration_agent(parallel_actions=parallel_actions)
 
     response = or_agent.call_agent(question)
     main_log.info("Final response: %s", response)
     return response
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
     load_dotenv()
     setup_logging()
     main_log = logging.getLogger("main")
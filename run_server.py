@@ -0,0 +1,56 @@
+import asyncio
+import logging
+
+from bring_a_crew.checkpoint import CheckpointStore
+from bring_a_crew.registry import get_default_registry
+from bring_a_crew.serving import ServingEngine
+from bring_a_crew.setup_logging import setup_logging
+from bring_a_crew.tracing import enable_tracing
+from run_orchestration import create_orchestration_agent
+
+log = logging.getLogger("main.ServingEngine")
+# The event loop only keeps weak references to tasks, these are kept until they are done
+_background_tasks = set()
+
+
+def _resumed(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        log.error("Resuming the unfinished requests failed: %s", task.exception())
+        return
+    for request_id, result in task.result().items():
+        if isinstance(result, BaseException):
+            log.error("Resumed request %s failed: %s", request_id, result)
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8080, workers: int = 8, queue_size: int = 64,
+                request_timeout: float = 60.0):
+    # Build the agents and keep the model loaded, before the first request comes in
+    await get_default_registry().warm_up(keep_alive=-1)
+    checkpoints = CheckpointStore("checkpoints.db")
+    checkpoints.prune()
+    async with ServingEngine(create_orchestration_agent, workers=workers, queue_size=queue_size,
+                             admission_timeout=1.0, checkpoints=checkpoints,
+                             request_timeout=request_timeout) as engine:
+        # Finish the requests that were running when the server stopped
+        resuming = asyncio.create_task(engine.resume_unfinished())
+        _background_tasks.add(resuming)
+        resuming.add_done_callback(_resumed)
+        server = await engine.serve_http(host=host, port=port)
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    setup_logging()
+    # Logging every prompt and response is too expensive under load, use the metrics instead
+    logging.getLogger("main.ActionAgent").setLevel(logging.WARNING)
+    logging.getLogger("main.OrchestrationAgent").setLevel(logging.WARNING)
+    logging.getLogger("main.ServingEngine").setLevel(logging.INFO)
+    enable_tracing()
+
+    asyncio.run(serve())
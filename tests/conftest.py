@@ -0,0 +1,50 @@
+import asyncio
+from contextlib import nullcontext
+
+import pytest
+
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.budget import use_budget
+from bring_a_crew.tool_executor import ToolExecutor
+
+
+@pytest.fixture
+def bookings():
+    return []
+
+
+@pytest.fixture
+def room_agent(bookings):
+    """
+    Creates a room_manager ActionAgent on a backend, with a read-only check_room and a book_room that adds the room
+    to bookings. Both functions can be replaced, the other arguments go to the ActionAgent.
+    """
+    def _book(room):
+        bookings.append(room)
+        return f"Booked {room}"
+
+    def _create(backend, check=lambda room: f"{room} is free", book=_book, **kwargs):
+        actions = {
+            "check_room": {"description": "Check a room", "function": check, "pure": True,
+                           "arguments": [{"name": "room", "type": "str"}]},
+            "book_room": {"description": "Book a room", "function": book,
+                          "arguments": [{"name": "room", "type": "str"}]}
+        }
+        return ActionAgent(name="room_manager", intro="", backend=backend, tool_executor=ToolExecutor(),
+                           actions=actions, **kwargs)
+    return _create
+
+
+@pytest.fixture
+def ask():
+    """
+    Sends the commands, one after the other, to a new session of the agent, within the budget when one is given.
+    Returns the answers.
+    """
+    def _ask(agent, *commands, budget=None):
+        async def _run():
+            session = agent.session()
+            with use_budget(budget) if budget is not None else nullcontext():
+                return [await session.aperform_action(command) for command in commands]
+        return asyncio.run(_run())
+    return _ask
@@ -0,0 +1,101 @@
+import asyncio
+
+from bring_a_crew.agent_cache import AgentResultCache, canonicalise
+from bring_a_crew.batch import Batch, shared_agent_call, use_batch
+from bring_a_crew.llm_backend import FakeBackend
+
+SCRIPT = {
+    "check room r1": ['Action: check_room: {"room": "r1"}\nPAUSE', "Answer: r1 is free."],
+    "check room r2": ['Action: check_room: {"room": "r2"}\nPAUSE', "Answer: r2 is free."],
+    "reserve room r1": ['Action: book_room: {"room": "r1"}\nPAUSE', "Answer: r1 could not be booked."],
+    "is room r1 nice": ["Answer: It is."]
+}
+
+
+def _call(cache, agent, command):
+    return cache.call(agent, command, lambda: agent.aperform_action(command))
+
+
+def _cache():
+    return AgentResultCache(is_name=lambda word: False)
+
+
+def test_result_of_a_read_only_command_is_cached(room_agent):
+    backend = FakeBackend(SCRIPT)
+    agent, cache = room_agent(backend).session(), _cache()
+
+    async def _run():
+        return [await _call(cache, agent, command) for command in ["check room r1", "Check room r1."]]
+
+    assert asyncio.run(_run()) == ["r1 is free.", "r1 is free."]
+    assert backend.calls == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_failed_write_is_not_cached(room_agent):
+    def _book(room):
+        raise Exception("the room service is down")
+
+    backend = FakeBackend(SCRIPT)
+    agent, cache = room_agent(backend, book=_book).session(), _cache()
+
+    async def _run():
+        await _call(cache, agent, "reserve room r1")
+        await _call(cache, agent, "reserve room r1")
+
+    asyncio.run(_run())
+    assert backend.calls == 4
+    assert cache.stats()["entries"] == 0
+
+
+def test_failed_read_is_not_cached(room_agent):
+    def _check(room):
+        raise Exception("the calendar is down")
+
+    backend = FakeBackend(SCRIPT)
+    agent, cache = room_agent(backend, check=_check).session(), _cache()
+    asyncio.run(_call(cache, agent, "check room r1"))
+    assert cache.stats()["entries"] == 0
+
+
+def test_answer_without_an_action_is_not_cached(room_agent):
+    backend = FakeBackend(SCRIPT)
+    agent, cache = room_agent(backend).session(), _cache()
+    asyncio.run(_call(cache, agent, "is room r1 nice"))
+    assert cache.stats()["entries"] == 0
+
+
+def test_shared_result_does_not_use_the_counts_of_an_earlier_command(room_agent):
+    calls = []
+
+    def _check(room):
+        calls.append(room)
+        if len(calls) > 1:
+            raise Exception("the calendar is down")
+        return f"{room} is free"
+
+    backend = FakeBackend(SCRIPT)
+    agent = room_agent(backend, check=_check)
+    first, second, cache = agent.session(), agent.session(), _cache()
+
+    async def _run():
+        # The second session found r2 free before, the failed result for r1 it gets from the batch is not its own
+        await second.aperform_action("check room r2")
+        with use_batch(Batch()):
+            return await asyncio.gather(
+                first.aperform_action("check room r1"),
+                cache.call(second, "check room r1", lambda: shared_agent_call(
+                    "room_manager", "check room r1", lambda: second.aperform_action("check room r1"))))
+
+    asyncio.run(_run())
+    assert calls == ["r2", "r1"]
+    assert cache.stats()["entries"] == 0
+
+
+def test_names_come_from_the_agent(room_agent):
+    assert canonicalise("check bob") == ((), ("bob",))
+    backend = FakeBackend({"check room r1 for bob": ['Action: check_room: {"room": "r1"}\nPAUSE', "Answer: r1 is free."]})
+    agent, cache = room_agent(backend, is_name=lambda word: word == "bob").session(), AgentResultCache()
+    asyncio.run(_call(cache, agent, "check room r1 for bob"))
+    cache.invalidate("booked bob", is_name=agent.is_name)
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from bring_a_crew.availability import AvailabilityStore, TIMESLOTS, load_demo_data, set_default_store, weekly_bits
+from bring_a_crew.schedule_manager_action_agent import book_person, check_common_availability
+from bring_a_crew.tool_executor import ToolExecutor
+
+
+@pytest.fixture
+def store():
+    store = AvailabilityStore(start="2026-10-12")
+    load_demo_data(store, weeks=4)
+    set_default_store(store)
+    yield store
+    set_default_store(None)
+
+
+def test_free_slots_of_a_group_is_the_and_of_their_bitsets(store):
+    slots = store.free_slots(["Bob", "charlie"], "2026-10-19")
+    assert [(day.isoformat(), timeslot) for day, timeslot in slots] == [("2026-10-19", "afternoon")]
+    assert store.free_slots(["Alice", "Bob"], "2026-10-19") == []
+    with pytest.raises(KeyError):
+        store.free_slots(["Dave"], "2026-10-19")
+
+
+def test_booking_a_person_twice_conflicts(store):
+    assert store.book_person("Bob", "2026-10-19", "morning")
+    assert not store.book_person("bob", "2026-10-19", "morning")
+    assert ("2026-10-19", "morning") not in [(day.isoformat(), timeslot)
+                                            for day, timeslot in store.free_slots(["Bob"], "2026-10-19")]
+
+
+def test_find_rooms_returns_the_smallest_free_rooms_first(store):
+    assert store.find_rooms("2026-10-20", "morning", 6) == ["max_8_people", "max_12_people", "max_20_people"]
+    assert store.find_rooms("2026-10-20", "morning", 6, limit=1) == ["max_8_people"]
+    assert store.book_room("max_8_people", "2026-10-20", "morning")
+    assert not store.book_room("max_8_people", "2026-10-20", "morning")
+    assert store.find_rooms("2026-10-20", "morning", 6, limit=1) == ["max_12_people"]
+    # No rooms on Saturday
+    assert store.find_rooms("2026-10-24", "morning", 2) == []
+
+
+def test_weekly_bits_repeat_every_week():
+    store = AvailabilityStore(start="2026-10-12")
+    store.add_person("Eve", weekly_bits({"Friday": TIMESLOTS}), weeks=2)
+    slots = store.free_slots(["Eve"], "2026-10-12", days=14)
+    assert [day.isoformat() for day, _ in slots] == ["2026-10-16", "2026-10-16", "2026-10-23", "2026-10-23"]
+
+
+def test_booking_invalidates_the_cached_availability_of_a_group(store):
+    executor = ToolExecutor()
+    check = {"name": "check_common_availability", "function": check_common_availability, "cache_ttl": 60}
+    arguments = {"date": "2026-10-18", "people": "Bob, Charlie"}
+
+    async def _run():
+        before = await executor.execute(check, arguments)
+        booking = {"date": "2026-10-19", "timeslot": "afternoon", "person": "Bob"}
+        await executor.execute({"name": "book_person", "function": book_person}, booking)
+        executor.invalidate(booking.values())
+        return before, await executor.execute(check, arguments)
+
+    before, after = asyncio.run(_run())
+    assert "Monday afternoon" in before
+    assert "Monday afternoon" not in after
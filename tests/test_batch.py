@@ -0,0 +1,88 @@
+import asyncio
+
+from bring_a_crew.batch import Batch, answer_batch, shared_agent_call, use_batch
+from bring_a_crew.budget import PartialAnswer
+from bring_a_crew.memory import Memory
+
+
+def _counting(calls, result="r1 is free"):
+    async def _run():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return result
+    return _run
+
+
+def test_same_command_runs_once_in_a_batch():
+    calls = []
+
+    async def _run():
+        with use_batch(Batch()) as batch:
+            results = await asyncio.gather(*[shared_agent_call("room_manager", command, _counting(calls))
+                                             for command in ["Check r1", "check  r1"]])
+            return results, batch.shared
+
+    assert asyncio.run(_run()) == (["r1 is free", "r1 is free"], 1)
+    assert len(calls) == 1
+
+
+def test_call_with_side_effects_is_not_shared():
+    calls = []
+
+    async def _run():
+        with use_batch(Batch()):
+            return await asyncio.gather(*[shared_agent_call("room_manager", "book r1", _counting(calls, "booked"),
+                                                            shareable=lambda: False) for _ in range(2)])
+
+    assert asyncio.run(_run()) == ["booked", "booked"]
+    assert len(calls) == 2
+
+
+def test_partial_answer_is_not_shared():
+    calls = []
+
+    async def _run():
+        with use_batch(Batch()):
+            return await asyncio.gather(*[shared_agent_call(
+                "room_manager", "check r1", _counting(calls, PartialAnswer("deadline"))) for _ in range(2)])
+
+    asyncio.run(_run())
+    assert len(calls) == 2
+
+
+class EchoAgent:
+    bookings = []
+
+    def __init__(self):
+        self.memory = Memory()
+        self.known_agents = {}
+
+    async def acall_agent(self, question):
+        if question == "fail":
+            raise Exception("failed")
+        if not question.lower().startswith("book"):
+            return f"answer to {question}"
+
+        async def _book():
+            await asyncio.sleep(0.01)
+            if EchoAgent.bookings:
+                return "The room is already booked."
+            EchoAgent.bookings.append(question)
+            return "Booked the room."
+        return await shared_agent_call("room_manager", question, _book, shareable=lambda: False)
+
+
+def test_answer_batch_keeps_the_order_and_answers_every_question():
+    answers, stats = asyncio.run(answer_batch(EchoAgent, ["a", "fail", "A ", "b"]))
+    assert answers[0] == "answer to a"
+    assert isinstance(answers[1], Exception)
+    assert answers[2:] == ["answer to A ", "answer to b"]
+    assert (stats["questions"], stats["unique_questions"], stats["failed"]) == (4, 3, 1)
+
+
+def test_the_same_booking_question_twice_books_once_and_fails_once():
+    EchoAgent.bookings = []
+    question = "Book a room for 4 people on 2026-10-20 morning."
+    answers, _ = asyncio.run(answer_batch(EchoAgent, [question, question]))
+    assert sorted(answers) == ["Booked the room.", "The room is already booked."]
+    assert len(EchoAgent.bookings) == 1
@@ -0,0 +1,35 @@
+import json
+
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.benchmark import demo_corpus, run_benchmark
+
+CORPUS = {
+    "questions": ["check r1", "check r2"],
+    "script": {"check r1": ["Answer: r1 is free."], "check r2": ["Answer: r2 is free."]}
+}
+
+
+def _runner(backend):
+    async def _run(question):
+        return await ActionAgent(name="room_manager", intro="", actions={}, backend=backend).aperform_action(question)
+    return _run
+
+
+def test_reports_every_concurrency_level(tmp_path):
+    output = tmp_path / "results.json"
+    results = run_benchmark(_runner, CORPUS, concurrency_levels=(1, 4), latency=0.01, tokens_per_second=None,
+                            output=str(output))
+    assert [level["concurrency"] for level in results["levels"]] == [1, 4]
+    # A level has at least twice the concurrency in questions
+    assert [level["questions"] for level in results["levels"]] == [2, 8]
+    for level in results["levels"]:
+        assert level["turns_per_question"] == 1
+        assert level["prompt_tokens_per_turn"] > 0
+        assert 0.01 <= level["model_time_per_question"] <= level["latency"]["p99"]
+    assert json.loads(output.read_text())["levels"] == results["levels"]
+
+
+def test_demo_corpus_has_a_script_for_every_question():
+    corpus = demo_corpus(size=4)
+    assert len(corpus["questions"]) == 4
+    assert all(len(corpus["script"][question]) == 4 for question in corpus["questions"])
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+from bring_a_crew.budget import Budget, PartialAnswer, use_budget, within_deadline
+from bring_a_crew.llm_backend import FakeBackend
+
+
+def test_turn_budget_gives_a_partial_answer_with_the_observations(room_agent, ask):
+    backend = FakeBackend({"check r1": ['Action: check_room: {"room": "r1"}\nPAUSE', "Answer: r1 is free."]})
+    [answer] = ask(room_agent(backend), "check r1", budget=Budget(max_turns=1))
+    assert isinstance(answer, PartialAnswer)
+    assert (answer.reason, answer.observations, answer.turns) == ("turn budget", ["r1 is free"], 1)
+    assert backend.calls == 1
+
+
+def test_slow_llm_call_gives_a_partial_answer_at_the_deadline(room_agent, ask):
+    backend = FakeBackend({"check r1": ["Answer: r1 is free."]}, latency=1.0)
+    [answer] = ask(room_agent(backend), "check r1", budget=Budget(timeout=0.1))
+    assert isinstance(answer, PartialAnswer)
+    assert answer.reason == "deadline"
+
+
+def test_slow_tool_call_stops_at_the_deadline(room_agent, ask):
+    def _slow(room):
+        time.sleep(0.5)
+        return f"{room} is free"
+
+    backend = FakeBackend({"check r1": ['Action: check_room: {"room": "r1"}\nPAUSE', "Answer: r1 is free."]})
+    started = time.perf_counter()
+    [answer] = ask(room_agent(backend, check=_slow), "check r1", budget=Budget(timeout=0.1))
+    assert time.perf_counter() - started < 0.4
+    assert isinstance(answer, PartialAnswer)
+    assert answer.reason == "deadline"
+    assert answer.observations == ["The action check_room failed: TimeoutError"]
+
+
+def test_repeated_action_stops_the_agent(room_agent, ask):
+    backend = FakeBackend(default='Action: check_room: {"room": "r1"}\nPAUSE')
+    [answer] = ask(room_agent(backend), "check r1")
+    assert isinstance(answer, PartialAnswer)
+    assert answer.reason == "limit of repeated actions"
+    assert answer.observations == ["r1 is free"]
+
+
+def test_within_deadline_only_times_out_with_a_budget():
+    async def _slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    assert asyncio.run(within_deadline(_slow)) == "done"
+
+    async def _run():
+        with use_budget(Budget(timeout=0.01)):
+            return await within_deadline(_slow)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(_run())
@@ -0,0 +1,88 @@
+import asyncio
+
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.budget import PartialAnswer
+from bring_a_crew.checkpoint import CheckpointStore
+from bring_a_crew.fast_path import FastPath, Intent
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.tool_executor import ToolExecutor
+
+
+def test_partial_answer_stays_partial_after_a_restart(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+
+    async def _answer(question):
+        return PartialAnswer("deadline", ["Bob is free on Monday."], 3)
+
+    store = CheckpointStore(path)
+    first = asyncio.run(store.run("r1", "When is Bob free?", _answer))
+    store.close()
+    answer = CheckpointStore(path).answer("r1")
+    assert isinstance(first, PartialAnswer)
+    assert isinstance(answer, PartialAnswer)
+    assert (answer, answer.reason, answer.observations, answer.turns) == (first, "deadline", first.observations, 3)
+
+    async def _complete(question):
+        return "Bob is free on Monday."
+
+    store = CheckpointStore(path)
+    asyncio.run(store.run("r2", "When is Bob free?", _complete))
+    assert not isinstance(store.answer("r2"), PartialAnswer)
+
+
+def test_complete_answer_is_returned_again(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"))
+
+    async def _answer(question):
+        return "Bob is free on Monday."
+
+    asyncio.run(store.run("r1", "When is Bob free?", _answer))
+    assert store.answer("r1") == "Bob is free on Monday."
+    assert store.unfinished() == []
+
+
+def _booking_agent(bookings, llm_calls, **kwargs):
+    def _respond(messages):
+        llm_calls.append(messages)
+        if messages[-1]["content"].startswith("Observation"):
+            return "Answer: done"
+        return 'Action: book_person: {"person": "Bob"}\nPAUSE'
+
+    return ActionAgent(name="schedule_manager", intro="", backend=FakeBackend(_respond),
+                       tool_executor=ToolExecutor(), actions={"book_person": {
+                           "description": "Book a person", "function": lambda person: bookings.append(person) or "booked",
+                           "arguments": [{"name": "person", "type": "str"}]}}, **kwargs)
+
+
+def test_replay_does_not_book_again(tmp_path):
+    bookings, llm_calls = [], []
+    agent = _booking_agent(bookings, llm_calls)
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"))
+
+    async def _run():
+        with store.journal("r1", "book bob"):
+            return await agent.session().aperform_action("book bob")
+
+    assert asyncio.run(_run()) == "done"
+    # The LLM responses and the booking of the first run are replayed from the journal
+    assert asyncio.run(_run()) == "done"
+    assert bookings == ["Bob"]
+    assert len(llm_calls) == 2
+
+
+def test_replay_does_not_take_a_fast_path_learned_later(tmp_path):
+    bookings, llm_calls = [], []
+    fast_path = FastPath()
+    agent = _booking_agent(bookings, llm_calls, fast_path=fast_path)
+    store = CheckpointStore(str(tmp_path / "checkpoints.db"))
+
+    async def _run():
+        with store.journal("r1", "book bob"):
+            return await agent.session().aperform_action("book bob")
+
+    assert asyncio.run(_run()) == "done"
+    # An intent that is learned after the request started must not change the path of its replay
+    fast_path.intents.append(Intent("book_person", r'book (?P<person>\w+)'))
+    assert asyncio.run(_run()) == "done"
+    assert bookings == ["Bob"]
+    assert len(llm_calls) == 2
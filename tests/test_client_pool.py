@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from bring_a_crew.client_pool import AsyncClientPool
+
+
+def test_pool_bounds_the_concurrent_clients():
+    pool = AsyncClientPool(size=2)
+    in_use = []
+    most = 0
+
+    async def _borrow():
+        nonlocal most
+        async with pool.client() as client:
+            in_use.append(client)
+            most = max(most, len(in_use))
+            await asyncio.sleep(0.01)
+            in_use.remove(client)
+            return client
+
+    async def _run():
+        return await asyncio.gather(*[_borrow() for _ in range(6)])
+
+    clients = asyncio.run(_run())
+    assert most == 2
+    # Returned clients are reused, the pool never creates more than its size
+    assert len({id(client) for client in clients}) == 2
+
+
+def test_every_loop_has_its_own_clients():
+    pool = AsyncClientPool(size=1)
+
+    async def _borrow():
+        async with pool.client() as client:
+            return client
+
+    assert asyncio.run(_borrow()) is not asyncio.run(_borrow())
+
+
+def test_pool_needs_at_least_one_client():
+    with pytest.raises(ValueError):
+        AsyncClientPool(size=0)
@@ -0,0 +1,67 @@
+import re
+
+from bring_a_crew.fast_path import FastPath, Intent, learn_pattern
+from bring_a_crew.llm_backend import FakeBackend
+
+
+def _respond(messages):
+    if messages[-1]["content"].startswith("Observation"):
+        return "Answer: " + messages[-1]["content"][len("Observation: "):]
+    room = messages[-1]["content"].split()[-1]
+    action = "book_room" if messages[-1]["content"].startswith("book") else "check_room"
+    return f'Action: {action}: {{"room": "{room}"}}\nPAUSE'
+
+
+def _failing_check(room):
+    raise Exception("the calendar is down")
+
+
+def test_learns_a_read_only_action(room_agent, ask):
+    backend = FakeBackend(_respond)
+    fast_path = FastPath(learn=True)
+    agent = room_agent(backend, fast_path=fast_path)
+    ask(agent, "check r1", "check r2")
+    calls = backend.calls
+    assert ask(agent, "check r3") == ["r3 is free"]
+    assert backend.calls == calls
+    assert fast_path.stats()["intents"] == 1
+
+
+def test_does_not_learn_from_a_failed_action(room_agent, ask):
+    fast_path = FastPath(learn=True)
+    ask(room_agent(FakeBackend(_respond), check=_failing_check, fast_path=fast_path), "check r1", "check r2", "check r3")
+    assert fast_path.intents == []
+
+
+def test_does_not_learn_an_action_with_side_effects(room_agent, ask, bookings):
+    backend = FakeBackend(_respond)
+    fast_path = FastPath(learn=True)
+    agent = room_agent(backend, fast_path=fast_path)
+    ask(agent, "book r1", "book r2")
+    calls = backend.calls
+    ask(agent, "book r3")
+    assert fast_path.intents == []
+    assert backend.calls > calls
+    assert bookings == ["r1", "r2", "r3"]
+
+
+def test_explicit_intent_for_an_action_with_side_effects(room_agent, ask, bookings):
+    backend = FakeBackend(_respond)
+    agent = room_agent(backend, fast_path=FastPath([Intent("book_room", r'book (?P<room>\w+)')]))
+    assert ask(agent, "book r1") == ["Booked r1"]
+    assert backend.calls == 0
+    assert bookings == ["r1"]
+
+
+def test_failed_fast_path_falls_back_to_the_model(room_agent, ask):
+    backend = FakeBackend(_respond)
+    fast_path = FastPath([Intent("check_room", r'check (?P<room>\w+)')])
+    assert ask(room_agent(backend, check=_failing_check, fast_path=fast_path), "check r1") == [
+        "The action check_room failed: the calendar is down"]
+    assert backend.calls == 2
+
+
+def test_learned_pattern_matches_other_values():
+    pattern = learn_pattern("check bob in the week of 2026-10-19", {"person": "bob", "week": "2026-10-19"})
+    match = re.fullmatch(pattern, "check alice in the week of 2026-10-26")
+    assert match.groupdict() == {"person": "alice", "week": "2026-10-26"}
@@ -0,0 +1,48 @@
+import asyncio
+
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.react_parser import tools_for_actions
+
+
+def _chat(backend, messages, **kwargs):
+    return asyncio.run(backend.chat(model="fake", messages=messages, **kwargs))
+
+
+def test_script_gives_the_responses_of_the_turns_of_a_question():
+    backend = FakeBackend({"check r1": ["Action: check_room: r1\nPAUSE", "Answer: r1 is free."]})
+    messages = [{"role": "system", "content": "You are a room manager"}, {"role": "user", "content": "check r1"}]
+    assert _chat(backend, messages).message.content == "Action: check_room: r1\nPAUSE"
+    messages += [{"role": "assistant", "content": "Action: check_room: r1"},
+                 {"role": "user", "content": "Observation: r1 is free"}]
+    assert _chat(backend, messages).message.content == "Answer: r1 is free."
+    assert _chat(backend, [{"role": "user", "content": "check r2"}]).message.content == "Answer: I do not know."
+    assert backend.calls == 3
+
+
+def test_stop_sequences_cut_the_response():
+    backend = FakeBackend(lambda messages: "Action: check_room: r1\nPAUSE\nObservation: made up")
+    response = _chat(backend, [{"role": "user", "content": "check r1"}], options={"stop": ["PAUSE"]})
+    assert response.message.content == "Action: check_room: r1\n"
+    assert response.prompt_eval_count > 0 and response.eval_count > 0
+
+
+def test_stream_returns_the_response_in_chunks():
+    backend = FakeBackend(lambda messages: "Answer: " + "r1 is free. " * 4, chunk_size=8)
+
+    async def _stream():
+        return [chunk async for chunk in backend.chat_stream(model="fake", messages=[])]
+
+    chunks = asyncio.run(_stream())
+    assert "".join(chunk.message.content for chunk in chunks) == "Answer: " + "r1 is free. " * 4
+    assert len(chunks) > 2
+    assert [chunk.done for chunk in chunks] == [False] * (len(chunks) - 1) + [True]
+
+
+def test_action_lines_become_tool_calls_when_tools_are_given():
+    tools = tools_for_actions({"check_room": {"description": "Check a room",
+                                              "arguments": [{"name": "room", "type": "str"}]}})
+    backend = FakeBackend(lambda messages: 'Think: I check the room.\nAction: check_room: {"room": "r1"}')
+    response = _chat(backend, [{"role": "user", "content": "check r1"}], tools=tools)
+    assert response.message.content == "Think: I check the room."
+    assert [(call.function.name, call.function.arguments) for call in response.message.tool_calls] == [
+        ("check_room", {"room": "r1"})]
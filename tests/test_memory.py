@@ -0,0 +1,60 @@
+from bring_a_crew.memory import Memory, WindowMemory
+
+
+def _count_words(text):
+    return len(text.split())
+
+
+def test_long_call_keeps_its_command():
+    memory = WindowMemory(max_tokens=12, count_tokens=_count_words)
+    memory.append({"role": "system", "content": "You are an agent."})
+    for message in [("user", "When is Bob free?"), ("assistant", "Action: check Bob"), ("user", "Observation: Monday"),
+                    ("assistant", "Action: check Bob again"), ("user", "Observation: still Monday")]:
+        memory.append({"role": message[0], "content": message[1]})
+    assert memory.messages()[1] == {"role": "user", "content": "When is Bob free?"}
+    assert memory.evicted_turns == 0
+
+
+def test_oldest_turns_are_evicted_with_their_observations():
+    memory = WindowMemory(max_tokens=14, count_tokens=_count_words)
+    memory.append({"role": "system", "content": "You are an agent."})
+    for message in [("user", "When is Bob free?"), ("assistant", "Action: check Bob"), ("user", "Observation: Monday"),
+                    ("assistant", "Answer: Monday"), ("user", "Book Bob on Monday.")]:
+        memory.append({"role": message[0], "content": message[1]})
+    assert [message["content"] for message in memory.messages()] == ["You are an agent.", "Book Bob on Monday."]
+    assert memory.evicted_turns == 1
+
+
+def test_old_observations_are_summarised():
+    memory = WindowMemory(keep_observations=1, summarise=lambda text: text[:15] + "...")
+    for content in ["Check Bob", "Observation: Bob is free on Monday", "Observation: Bob is free on Tuesday",
+                    "Observation: Bob is free on Thursday"]:
+        memory.append({"role": "user", "content": content})
+    assert [message["content"] for message in memory.history] == [
+        "Check Bob", "Observation: Bo...", "Observation: Bo...", "Observation: Bob is free on Thursday"]
+    assert memory.compacted_observations == 2
+
+
+def test_tool_results_are_observations():
+    memory = WindowMemory(keep_observations=1, summarise=lambda text: text[:15] + "...")
+    memory.append({"role": "user", "content": "Check Bob"})
+    memory.append({"role": "tool", "content": "Bob is free on Monday and Tuesday"})
+    memory.append({"role": "tool", "content": "Bob is free on Thursday"})
+    assert memory.history[1] == {"role": "tool", "content": "Bob is free on ..."}
+    assert memory.compacted_observations == 1
+
+
+def test_isolated_calls_start_with_an_empty_history():
+    memory = Memory(isolate_calls=True)
+    memory.append({"role": "system", "content": "You are an agent."})
+    memory.append({"role": "user", "content": "When is Bob free?"})
+    memory.start_call()
+    assert memory.messages() == [{"role": "system", "content": "You are an agent."}]
+
+
+def test_fork_has_a_history_of_its_own():
+    memory = Memory()
+    memory.append({"role": "system", "content": "You are an agent."})
+    forked = memory.fork()
+    forked.append({"role": "user", "content": "Book Bob."})
+    assert len(memory) == 1 and len(forked) == 2
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.orchestration_agent import OrchestrationAgent
+
+QUESTION = "Plan a meeting with Bob and a room"
+
+
+def _orchestrator(started, **kwargs):
+    def _agent(name, answer):
+        def _respond(messages):
+            started.append(time.perf_counter())
+            return f"Answer: {answer}"
+        return ActionAgent(name=name, intro=f"The {name}", actions={}, backend=FakeBackend(_respond, latency=0.1))
+
+    agents = [_agent("schedule_manager", "Bob is free."), _agent("room_manager", "Room r1 is free.")]
+    backend = FakeBackend({QUESTION: [
+        "Action: schedule_manager: check Bob\nAction: room_manager: check the rooms\nPAUSE",
+        "Answer: Bob and room r1 are free."
+    ]})
+    return OrchestrationAgent(name="orchestrator", description="", agents=agents, backend=backend, **kwargs)
+
+
+def test_independent_actions_run_concurrently():
+    started = []
+    orchestrator = _orchestrator(started, parallel_actions=True)
+    assert asyncio.run(orchestrator.acall_agent(QUESTION)) == "Bob and room r1 are free."
+    # The second agent was called before the first one answered
+    assert len(started) == 2 and started[1] - started[0] < 0.1
+    observations = [message["content"] for message in orchestrator.memory.history
+                    if message["content"].startswith("Observation")]
+    assert observations == ["Observation: schedule_manager: Bob is free.\nObservation: room_manager: Room r1 is free."]
+
+
+def test_without_parallel_actions_only_the_first_action_runs():
+    started = []
+    orchestrator = _orchestrator(started)
+    assert asyncio.run(orchestrator.acall_agent(QUESTION)) == "Bob and room r1 are free."
+    assert len(started) == 1
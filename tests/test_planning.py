@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.budget import PartialAnswer
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.orchestration_agent import OrchestrationAgent
+from bring_a_crew.planning import check_plan, execute_plan
+from bring_a_crew.react_parser import parse_plan
+
+AGENTS = {"schedule_manager": None, "room_manager": None}
+
+
+def test_parse_plan_adds_the_placeholders_to_after():
+    plan = parse_plan('Thought: two steps\nPlan: [{"id": "s1", "agent": "schedule_manager", "command": "When is Bob '
+                      'free?"}, {"agent": "room_manager", "command": "Book a room at {s1}", "after": []}]')
+    assert plan == [{"id": "s1", "agent": "schedule_manager", "command": "When is Bob free?", "after": []},
+                    {"id": "s2", "agent": "room_manager", "command": "Book a room at {s1}", "after": ["s1"]}]
+    assert parse_plan("Answer: done") is None
+    with pytest.raises(ValueError):
+        parse_plan('Plan: [{"id": "s1"}]')
+
+
+def test_check_plan_rejects_invalid_plans():
+    def _step(step_id, after, agent="schedule_manager"):
+        return {"id": step_id, "agent": agent, "command": "c", "after": after}
+
+    check_plan([_step("s1", []), _step("s2", ["s1"])], AGENTS, {})
+    check_plan([_step("s3", ["s1"])], AGENTS, {"s1": "done earlier"})
+    for plan in ([], [_step("s1", ["s2"]), _step("s2", ["s1"])], [_step("s1", ["s1"])], [_step("s1", ["s9"])],
+                 [_step("s1", [], agent="food_manager")], [_step("s1", []), _step("s1", [])]):
+        with pytest.raises(ValueError):
+            check_plan(plan, AGENTS, {})
+
+
+def test_execute_plan_runs_steps_after_their_dependencies():
+    calls = []
+
+    async def _call_agent(agent, command):
+        calls.append(command)
+        await asyncio.sleep(0.01)
+        if command == "fail":
+            raise Exception("down")
+        if command == "partial":
+            return PartialAnswer("deadline")
+        return command.upper()
+
+    plan = [{"id": "s1", "agent": "schedule_manager", "command": "bob", "after": []},
+            {"id": "s2", "agent": "room_manager", "command": "room for {s1}", "after": ["s1"]},
+            {"id": "s3", "agent": "food_manager", "command": "fail", "after": []},
+            {"id": "s4", "agent": "schedule_manager", "command": "after {s3}", "after": ["s3"]},
+            {"id": "s5", "agent": "room_manager", "command": "partial", "after": []}]
+    results = {}
+    outcomes = asyncio.run(execute_plan(plan, results, _call_agent))
+    assert [(step["id"], status) for step, status, _ in outcomes] == [
+        ("s1", "done"), ("s2", "done"), ("s3", "failed"), ("s4", "skipped"), ("s5", "failed")]
+    assert results == {"s1": "BOB", "s2": "ROOM FOR BOB"}
+    assert calls.index("room for BOB") > calls.index("bob")
+    assert "after {s3}" not in calls
+
+
+def _orchestrator(responses):
+    agent = ActionAgent(name="schedule_manager", intro="Schedules people", backend=FakeBackend(), actions={})
+    return OrchestrationAgent(name="orchestrator", description="", agents=[agent], planning=True,
+                              backend=FakeBackend({"When is Bob free?": responses}), max_turns=4)
+
+
+def test_empty_plan_is_rejected_and_the_model_answers():
+    orchestrator = _orchestrator(["Plan: []", "Answer: Nothing to plan."]).session()
+    assert asyncio.run(orchestrator.acall_agent("When is Bob free?")) == "Nothing to plan."
+    assert any("The plan is not valid" in message["content"] for message in orchestrator.memory.history)
+
+
+def test_empty_plan_with_an_answer_is_the_answer():
+    orchestrator = _orchestrator(["Plan: []\nAnswer: Bob is always free."]).session()
+    assert asyncio.run(orchestrator.acall_agent("When is Bob free?")) == "Bob is always free."
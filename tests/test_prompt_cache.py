@@ -0,0 +1,17 @@
+from bring_a_crew.prompt_cache import PromptCacheStats
+
+
+def test_server_hit_rate_is_unavailable_without_the_server_total():
+    stats = PromptCacheStats()
+    stats.record([{"role": "system", "content": "x" * 400}], prompt_eval_count=7)
+    assert stats.stats()["evaluated_tokens"] == 7
+    assert stats.stats()["server_hit_rate"] is None
+
+
+def test_server_hit_rate_uses_the_server_counts():
+    stats = PromptCacheStats()
+    messages = [{"role": "system", "content": "x" * 40}]
+    stats.record(messages, prompt_eval_count=100, prompt_tokens=100)
+    stats.record(messages, prompt_eval_count=20, prompt_tokens=100)
+    assert stats.stats()["server_hit_rate"] == 0.4
+    assert stats.stats()["prefix_hit_rate"] == 0.5
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.react_parser import ReActParser, parse_arguments, parse_response, tools_for_actions
+from bring_a_crew.tool_executor import ToolExecutor
+
+
+def test_parses_lenient_action_and_answer_lines():
+    actions, answer = parse_response('Thought: check\n**Action:** `check_room` {"room": "r1"}\n'
+                                     'Action: book_room: {"room": "r2"}\n**Answer:** done\nAnswer: ignored')
+    assert actions == [("check_room", '{"room": "r1"}'), ("book_room", '{"room": "r2"}')]
+    assert answer == "done"
+
+
+def test_feed_finds_lines_split_over_chunks():
+    parser = ReActParser()
+    assert not parser.feed("Action: check_")
+    assert parser.feed('room: {"room": "r1"}\nAnsw')
+    assert parser.actions == [("check_room", '{"room": "r1"}')]
+    assert parser.feed("er: r1 is free") is False
+    assert parser.close()
+    assert parser.answer == "r1 is free"
+
+
+def test_parse_arguments_ignores_text_around_the_json():
+    assert parse_arguments('```json\n{"room": "r1", "n": 2}\n``` as asked') == {"room": "r1", "n": 2}
+    assert parse_arguments({"room": "r1"}) == {"room": "r1"}
+    with pytest.raises(ValueError):
+        parse_arguments("r1")
+    with pytest.raises(ValueError):
+        parse_arguments('{"room": ')
+
+
+def test_tools_for_actions():
+    tools = tools_for_actions({"check_room": {"description": "Check a room", "arguments": [
+        {"name": "room", "type": "str"}, {"name": "n", "type": "int"}]}})
+    assert tools[0]["function"]["name"] == "check_room"
+    assert tools[0]["function"]["parameters"]["properties"] == {"room": {"type": "string"}, "n": {"type": "integer"}}
+    assert tools[0]["function"]["parameters"]["required"] == ["room", "n"]
+
+
+def test_stream_stops_at_a_lenient_action_line():
+    def _respond(messages):
+        if messages[-1]["content"].startswith("Observation"):
+            return "Answer: r1 is free."
+        return '**Action:** `check_room`: {"room": "r1"}\nObservation: r1 is booked\nAnswer: made up\n'
+
+    agent = ActionAgent(name="room_manager", intro="", backend=FakeBackend(_respond), stream=True,
+                        tool_executor=ToolExecutor(), actions={"check_room": {
+                            "description": "Check a room", "function": lambda room: f"{room} is free", "pure": True,
+                            "arguments": [{"name": "room", "type": "str"}]}})
+    assert asyncio.run(agent.aperform_action("check r1")) == "r1 is free."
+    assert not any("made up" in message["content"] for message in agent.memory.history)
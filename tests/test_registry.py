@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.registry import AgentRegistry
+
+
+class PreloadingBackend(FakeBackend):
+    def __init__(self):
+        super().__init__({"check r1": ["Answer: r1 is free."]})
+        self.preloaded = []
+
+    async def preload(self, model, keep_alive=None):
+        self.preloaded.append((model, keep_alive))
+
+
+def _registry(backend, built):
+    def _create(model="small"):
+        built.append(model)
+        return ActionAgent(name="room_manager", intro="", actions={}, backend=backend, model=model)
+
+    registry = AgentRegistry()
+    registry.register("room_manager", _create)
+    return registry
+
+
+def test_agents_are_built_once_per_set_of_options():
+    built = []
+    registry = _registry(FakeBackend(), built)
+    assert registry.get("room_manager") is registry.get("room_manager")
+    assert registry.get("room_manager", model="large") is not registry.get("room_manager")
+    assert built == ["small", "large"]
+    with pytest.raises(Exception):
+        registry.get("food_manager")
+
+
+def test_sessions_share_the_agent_but_not_the_memory():
+    built = []
+    registry = _registry(PreloadingBackend(), built)
+    first, second = registry.session("room_manager"), registry.session("room_manager")
+    assert asyncio.run(first.aperform_action("check r1")) == "r1 is free."
+    assert first.backend is second.backend and first.known_actions is second.known_actions
+    assert len(first.memory.history) > len(second.memory.history)
+    assert built == ["small"]
+
+
+def test_registering_again_replaces_the_built_agents():
+    built = []
+    registry = _registry(FakeBackend(), built)
+    template = registry.get("room_manager")
+    registry.register("room_manager", lambda: ActionAgent(name="room_manager", intro="", actions={},
+                                                          backend=FakeBackend()))
+    assert registry.get("room_manager") is not template
+
+
+def test_warm_up_preloads_every_model_once():
+    backend = PreloadingBackend()
+    registry = _registry(backend, [])
+    registry.register("food_manager", lambda: ActionAgent(name="food_manager", intro="", actions={},
+                                                          backend=backend, model="small"))
+    asyncio.run(registry.warm_up(keep_alive=-1))
+    assert backend.preloaded == [("small", -1)]
@@ -0,0 +1,32 @@
+import sqlite3
+import time
+
+from bring_a_crew.response_cache import ResponseCache
+
+
+def _rows(path):
+    with sqlite3.connect(path) as db:
+        return [key for key, in db.execute("SELECT key FROM responses ORDER BY created")]
+
+
+def test_database_keeps_only_the_newest_entries(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(max_entries=3, path=path)
+    for index in range(10):
+        cache.put(f"key{index}", f"content{index}")
+    cache.close()
+    assert _rows(path) == ["key7", "key8", "key9"]
+
+
+def test_database_deletes_expired_entries(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(ttl=0.05, path=path)
+    cache.put("old", "content")
+    time.sleep(0.1)
+    cache.put("new", "content")
+    cache.close()
+    assert _rows(path) == ["new"]
+    time.sleep(0.1)
+    # Opening the cache again removes the rows that expired in the meantime
+    ResponseCache(ttl=0.05, path=path).close()
+    assert _rows(path) == []
@@ -0,0 +1,46 @@
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.retrieval import BM25Index, tokenize
+
+AGENTS = {
+    "schedule_manager": "Manages the schedule of people, checks the availability of people and books meetings.",
+    "room_manager": "Finds available rooms for a number of people and books rooms.",
+    "food_manager": "Prepares lunch for people in a room.",
+    "parking_manager": "Reserves parking spaces for visitors."
+}
+
+
+def test_tokenize_removes_plurals_and_ing():
+    assert tokenize("Rooms, parking and the class!") == ["room", "park", "and", "the", "class"]
+
+
+def test_search_ranks_the_best_matches():
+    index = BM25Index(AGENTS)
+    assert index.search("Find an available room for six people", 1) == ["room_manager"]
+    assert index.search("Order lunch in room 3", 1) == ["food_manager"]
+    assert index.search("Reserve a parking space", 1) == ["parking_manager"]
+
+
+def test_search_keeps_the_order_of_the_documents():
+    index = BM25Index(AGENTS)
+    # The room matches best, the selection is still in the order the agents were added
+    assert index.search("book a room and lunch", 2) == ["room_manager", "food_manager"]
+    assert index.search("book a meeting room", 2) == ["schedule_manager", "room_manager"]
+
+
+def test_search_without_matches_gives_the_first_names():
+    index = BM25Index(AGENTS)
+    assert index.scores("weather") == [0.0] * 4
+    assert index.search("weather", 2) == ["schedule_manager", "room_manager"]
+    assert len(index) == 4
+
+
+def test_agent_only_puts_the_matching_actions_in_the_prompt(room_agent, ask):
+    prompts = []
+
+    def _respond(messages):
+        prompts.append(messages[0]["content"])
+        return "Answer: done"
+
+    ask(room_agent(FakeBackend(_respond), top_k_actions=1), "Book room r1", "Check room r1")
+    assert "book_room" in prompts[0] and "check_room" not in prompts[0]
+    assert "check_room" in prompts[1] and "book_room" not in prompts[1]
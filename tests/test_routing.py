@@ -0,0 +1,47 @@
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.routing import Endpoint, RoutingBackend
+
+MESSAGES = [{"role": "user", "content": "When is Bob free?"}]
+
+
+def test_stream_closed_early_counts_as_success():
+    endpoint = Endpoint(FakeBackend(default="Answer: Bob is free on Monday.\nThink: more text", chunk_size=4))
+    endpoint.consecutive_failures = 2
+    router = RoutingBackend([endpoint])
+
+    async def _first_chunk():
+        async with aclosing(router.chat_stream(model="m", messages=MESSAGES)) as chunks:
+            async for chunk in chunks:
+                return chunk.message.content
+
+    assert asyncio.run(_first_chunk()) == "Answ"
+    assert endpoint.latency is not None
+    assert endpoint.consecutive_failures == 0
+    assert endpoint.in_flight == 0
+
+
+def test_stream_fails_over_before_the_first_chunk():
+    down, up = FakeBackend(), FakeBackend(default="Answer: ok")
+    down.down = True
+    first, second = Endpoint(down, "down"), Endpoint(up, "up")
+    router = RoutingBackend([first, second])
+
+    async def _read():
+        return "".join([chunk.message.content async for chunk in router.chat_stream(model="m", messages=MESSAGES)])
+
+    assert asyncio.run(_read()) == "Answer: ok"
+    assert (first.consecutive_failures, second.consecutive_failures) == (1, 0)
+    assert first.latency is None
+
+
+def test_chat_raises_when_all_endpoints_fail():
+    down = FakeBackend()
+    down.down = True
+    router = RoutingBackend([Endpoint(down)])
+    with pytest.raises(ConnectionError):
+        asyncio.run(router.chat(model="m", messages=MESSAGES))
@@ -0,0 +1,44 @@
+import asyncio
+
+from bring_a_crew.memory import Memory
+from bring_a_crew.serving import ServingEngine
+
+
+class CountingAgent:
+    questions = []
+
+    def __init__(self):
+        self.memory = Memory()
+        self.known_agents = {}
+
+    async def acall_agent(self, question):
+        CountingAgent.questions.append(question)
+        await asyncio.sleep(0.05)
+        return f"answer to {question}"
+
+
+def test_requests_with_the_same_id_run_once():
+    async def _run():
+        CountingAgent.questions = []
+        # One worker and a queue of one, so both requests with the id wait for a place in the queue
+        async with ServingEngine(CountingAgent, workers=1, queue_size=1, admission_timeout=1.0) as engine:
+            return await asyncio.gather(engine.submit("busy"), engine.submit("queued"),
+                                        engine.submit("first", "r1"), engine.submit("second", "r1"))
+
+    assert asyncio.run(_run())[2:] == ["answer to first", "answer to first"]
+    assert sorted(CountingAgent.questions) == ["busy", "first", "queued"]
+
+
+def test_malformed_content_length_is_a_bad_request():
+    async def _run():
+        async with ServingEngine(CountingAgent) as engine:
+            server = await engine.serve_http(port=0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"POST /ask HTTP/1.1\r\nContent-Length: twelve\r\n\r\n")
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return response
+
+    assert asyncio.run(_run()).startswith(b"HTTP/1.1 400 Bad Request")
@@ -0,0 +1,56 @@
+import asyncio
+import os
+
+import pytest
+
+from bring_a_crew.memory import Memory
+from bring_a_crew.sharding import ShardedEngine
+
+
+class PidAgent:
+    def __init__(self):
+        self.memory = Memory()
+        self.known_agents = {}
+
+    async def acall_agent(self, question):
+        if question == "slow":
+            await asyncio.sleep(10)
+        return os.getpid()
+
+
+def create_pid_agent():
+    return PidAgent()
+
+
+def _key_for(engine, index):
+    return next(key for key in map(str, range(1000)) if engine.shard_for(key) is engine._shards[index])
+
+
+async def _wait_for_restart(engine, timeout=10.0):
+    for _ in range(int(timeout / 0.05)):
+        if engine.restarts and all(shard.alive for shard in engine._shards):
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError("The worker process was not restarted")
+
+
+def test_dead_process_is_replaced():
+    async def _run():
+        async with ShardedEngine(create_pid_agent, processes=2) as engine:
+            await asyncio.gather(*[engine.submit(str(i)) for i in range(4)])
+            dead = engine._shards[0]
+            in_flight = asyncio.ensure_future(engine.submit("slow", session_key=_key_for(engine, 0)))
+            await asyncio.sleep(0.5)
+            dead.process.kill()
+            # A question in flight on the dead process fails instead of waiting forever
+            with pytest.raises(Exception, match="stopped"):
+                await asyncio.wait_for(in_flight, 10)
+            await _wait_for_restart(engine)
+            pids = await asyncio.wait_for(asyncio.gather(*[engine.submit(str(i)) for i in range(8)]), 30)
+            session_pid = await asyncio.wait_for(engine.submit("1", session_key=_key_for(engine, 0)), 30)
+            return dead.process.pid, pids, session_pid, engine.stats()
+
+    dead_pid, pids, session_pid, stats = asyncio.run(_run())
+    assert dead_pid not in pids
+    assert session_pid != dead_pid
+    assert stats["restarts"] == 1
@@ -0,0 +1,48 @@
+import asyncio
+import re
+from types import SimpleNamespace
+
+from bring_a_crew.streaming import read_until_complete_line
+
+ACTION_RE = re.compile(r'^Action: (\w+): (.*)$')
+ANSWER_RE = re.compile(r'^Answer: (.*)$')
+
+
+def _read(chunks, line_res=(ACTION_RE, ANSWER_RE)):
+    closed = []
+
+    async def _stream():
+        try:
+            for chunk in chunks:
+                yield SimpleNamespace(message=SimpleNamespace(content=chunk))
+        finally:
+            closed.append(True)
+
+    received = []
+    content = asyncio.run(read_until_complete_line(_stream(), list(line_res), on_chunk=received.append))
+    return content, received, bool(closed)
+
+
+def test_stops_after_the_first_complete_action_line():
+    content, received, closed = _read(["Thought: check Bob\nAction: check_",
+                                       "person: Bob\nObservation: invented result\nAnswer: made up\n", "never read"])
+    assert content == "Thought: check Bob\nAction: check_person: Bob"
+    assert "never read" not in received
+    assert closed
+
+
+def test_an_action_line_is_only_complete_with_a_newline():
+    content, _, _ = _read(["Action: check_person: Bo", "b"])
+    assert content == "Action: check_person: Bob"
+
+
+def test_reads_everything_without_a_matching_line():
+    content, received, _ = _read(["Thought: one\n", "Thought: two\n", "Thought: three"])
+    assert content == "Thought: one\nThought: two\nThought: three"
+    assert len(received) == 3
+
+
+def test_only_stops_at_the_given_lines():
+    content, _, _ = _read(["Action: check_person: Bob\nAction: check_person: Alice\nAnswer: both\nmore"],
+                          line_res=[ANSWER_RE])
+    assert content == "Action: check_person: Bob\nAction: check_person: Alice\nAnswer: both"
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.tool_executor import ToolExecutor
+
+
+def _counting(calls):
+    def _function(**arguments):
+        calls.append(arguments)
+        return arguments
+    return _function
+
+
+def test_pure_results_are_cached_by_their_arguments():
+    executor = ToolExecutor()
+    calls = []
+    definition = {"name": "check", "function": _counting(calls), "pure": True}
+
+    async def _run():
+        return [await executor.execute(definition, arguments) for arguments in ({"room": "r1"}, {"room": "r1"},
+                                                                                 {"room": "r2"})]
+
+    assert asyncio.run(_run()) == [{"room": "r1"}, {"room": "r1"}, {"room": "r2"}]
+    assert calls == [{"room": "r1"}, {"room": "r2"}]
+    assert (executor.hits, executor.misses) == (1, 2)
+
+
+def test_results_expire_after_the_ttl():
+    executor = ToolExecutor()
+    calls = []
+    definition = {"name": "check", "function": _counting(calls), "cache_ttl": 0.05}
+
+    async def _run():
+        await executor.execute(definition, {"room": "r1"})
+        await executor.execute(definition, {"room": "r1"})
+        await asyncio.sleep(0.1)
+        await executor.execute(definition, {"room": "r1"})
+
+    asyncio.run(_run())
+    assert len(calls) == 2
+
+
+def test_concurrent_calls_share_one_execution():
+    executor = ToolExecutor()
+    batches = []
+
+    def _batch(requests):
+        batches.append(requests)
+        return [request["room"] for request in requests]
+
+    definition = {"name": "check", "function": lambda room: room, "batch_function": _batch, "pure": True}
+
+    async def _run():
+        return await asyncio.gather(*[executor.execute(definition, {"room": "r1"}) for _ in range(3)])
+
+    assert asyncio.run(_run()) == ["r1"] * 3
+    assert batches == [[{"room": "r1"}]]
+    assert executor.coalesced == 2
+
+
+def test_actions_without_caching_always_run():
+    executor = ToolExecutor()
+    calls = []
+    definition = {"name": "book", "function": _counting(calls)}
+
+    async def _run():
+        return await asyncio.gather(*[executor.execute(definition, {"room": "r1"}) for _ in range(2)])
+
+    asyncio.run(_run())
+    assert len(calls) == 2
+
+
+def test_calls_within_the_window_are_batched():
+    executor = ToolExecutor(batch_window=0.01)
+    batches = []
+
+    def _batch(requests):
+        batches.append(requests)
+        return [request["room"].upper() for request in requests]
+
+    definition = {"name": "check", "function": lambda room: room.upper(), "batch_function": _batch, "pure": True}
+
+    async def _run():
+        return await asyncio.gather(*[executor.execute(definition, {"room": room}) for room in ("r1", "r2", "r3")])
+
+    assert asyncio.run(_run()) == ["R1", "R2", "R3"]
+    assert batches == [[{"room": "r1"}, {"room": "r2"}, {"room": "r3"}]]
+    assert (executor.batches, executor.batched_calls) == (1, 3)
+
+
+def test_prefetched_result_is_used_by_the_call():
+    executor = ToolExecutor()
+    calls = []
+    definition = {"name": "check", "function": _counting(calls), "pure": True}
+
+    async def _run():
+        assert executor.prefetch(definition, {"room": "r1"}) is not None
+        # A second prefetch of the same call, and a prefetch of an action with side effects, do nothing
+        assert executor.prefetch(definition, {"room": "r1"}) is None
+        assert executor.prefetch({"name": "book", "function": _counting(calls)}, {"room": "r1"}) is None
+        return await executor.execute(definition, {"room": "r1"})
+
+    assert asyncio.run(_run()) == {"room": "r1"}
+    assert len(calls) == 1
+    assert (executor.prefetches, executor.prefetch_hits) == (1, 1)
+
+
+def test_agent_prefetches_the_predicted_calls_while_the_model_generates():
+    checked = []
+
+    def _check(room):
+        checked.append(time.perf_counter())
+        return f"{room} is free"
+
+    actions = {"check_room": {"description": "Check a room", "function": _check, "pure": True,
+                              "arguments": [{"name": "room", "type": "str"}],
+                              "predict": lambda command, previous_calls: [{"room": command.split()[-1]}]}}
+    backend = FakeBackend({"check r1": ['Action: check_room: {"room": "r1"}\nPAUSE', "Answer: r1 is free."]},
+                          latency=0.05)
+    agent = ActionAgent(name="room_manager", intro="", actions=actions, backend=backend, tool_executor=ToolExecutor())
+    started = time.perf_counter()
+    assert asyncio.run(agent.aperform_action("check r1")) == "r1 is free."
+    # The check ran once, during the first LLM call
+    assert len(checked) == 1 and checked[0] - started < 0.05
+    assert agent.tool_executor.prefetch_hits == 1
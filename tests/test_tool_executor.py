@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from bring_a_crew.tool_executor import ToolExecutor, ToolTimeout
+
+
+def _slow(x):
+    time.sleep(0.5)
+    return x
+
+
+def test_timeout_applies_to_plain_functions():
+    executor = ToolExecutor()
+    started = time.perf_counter()
+    with pytest.raises(ToolTimeout):
+        asyncio.run(executor.execute({"name": "slow", "function": _slow, "timeout": 0.1}, {"x": 1}))
+    assert time.perf_counter() - started < 0.4
+    assert executor.stats()["tools"]["slow"]["timeouts"] == 1
+
+
+def test_plain_functions_run_on_threads_and_inline_functions_on_the_loop():
+    executor = ToolExecutor()
+    main_thread = threading.get_ident()
+
+    async def _run():
+        current = lambda: threading.get_ident()
+        return (await executor.execute({"name": "threaded", "function": current}, {}),
+                await executor.execute({"name": "inline", "function": current, "inline": True}, {}))
+
+    threaded, inline = asyncio.run(_run())
+    assert threaded != main_thread
+    assert inline == main_thread
+
+
+def test_retries_only_idempotent_actions():
+    executor = ToolExecutor()
+    attempts = []
+
+    def _flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("down")
+        return "ok"
+
+    assert asyncio.run(executor.execute({"name": "read", "function": _flaky, "pure": True, "retries": 3,
+                                         "retry_backoff": 0.001}, {})) == "ok"
+    attempts.clear()
+    with pytest.raises(ConnectionError):
+        asyncio.run(executor.execute({"name": "book", "function": _flaky, "retries": 3}, {}))
+    assert len(attempts) == 1
+
+
+def test_max_concurrency_limits_calls():
+    executor = ToolExecutor()
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def _limited(x):
+        with lock:
+            active.append(x)
+            peak.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.remove(x)
+        return x
+
+    definition = {"name": "limited", "function": _limited, "max_concurrency": 2}
+
+    async def _run():
+        return await asyncio.gather(*[executor.execute(definition, {"x": i}) for i in range(6)])
+
+    assert asyncio.run(_run()) == list(range(6))
+    assert max(peak) == 2
+
+
+def _batch_definition(batch_function, **settings):
+    return {"name": "lookup", "function": lambda x: x, "batch_function": batch_function, "pure": True, **settings}
+
+
+def test_batch_does_not_block_the_loop_and_gets_a_timeout():
+    executor = ToolExecutor(batch_window=0.001)
+    ticks = []
+
+    def _slow_batch(requests):
+        time.sleep(0.5)
+        return [request["x"] for request in requests]
+
+    async def _tick():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    async def _run():
+        calls = asyncio.gather(*[executor.execute(_batch_definition(_slow_batch, timeout=0.1), {"x": i})
+                                 for i in range(3)], return_exceptions=True)
+        started = time.perf_counter()
+        _, results = await asyncio.gather(_tick(), calls)
+        return results, time.perf_counter() - started
+
+    results, duration = asyncio.run(_run())
+    assert all(isinstance(result, ToolTimeout) for result in results)
+    assert duration < 0.4
+    assert len(ticks) == 5
+    stats = executor.stats()
+    assert (stats["batches"], stats["batched_calls"], stats["tools"]["lookup"]["timeouts"]) == (1, 3, 1)
+
+
+def test_batch_is_retried():
+    executor = ToolExecutor(batch_window=0.001)
+    attempts = []
+
+    def _flaky_batch(requests):
+        attempts.append(len(requests))
+        if len(attempts) < 2:
+            raise ConnectionError("down")
+        return [request["x"] * 2 for request in requests]
+
+    async def _run():
+        definition = _batch_definition(_flaky_batch, retries=2, retry_backoff=0.001)
+        return await asyncio.gather(*[executor.execute(definition, {"x": i}) for i in range(3)])
+
+    assert asyncio.run(_run()) == [0, 2, 4]
+    assert attempts == [3, 3]
+    assert executor.stats()["tools"]["lookup"]["retries"] == 1
+
+
+def test_batch_with_too_few_results_fails_every_call():
+    executor = ToolExecutor(batch_window=0.001)
+
+    async def _run():
+        definition = _batch_definition(lambda requests: [requests[0]["x"]])
+        calls = [executor.execute(definition, {"x": i}) for i in range(3)]
+        return await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 2)
+
+    results = asyncio.run(_run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert "1 results for 3 calls" in str(results[0])
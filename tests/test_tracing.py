@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from bring_a_crew import tracing
+from bring_a_crew.action_agent import ActionAgent
+from bring_a_crew.llm_backend import FakeBackend
+from bring_a_crew.tracing import Tracer, enable_tracing, get_tracer
+
+
+@pytest.fixture
+def tracer():
+    yield enable_tracing()
+    tracing._tracer = Tracer(enabled=False)
+
+
+def test_nested_spans_share_the_trace():
+    tracer = Tracer()
+    with tracer.span("orchestrator.call", agent="orchestrator") as call:
+        with tracer.span("llm.call", agent="orchestrator") as llm_call:
+            llm_call.set(prompt_tokens=100, eval_tokens=20)
+    with tracer.span("orchestrator.call", agent="orchestrator") as other_call:
+        pass
+    assert (llm_call.trace_id, llm_call.parent_id) == (call.trace_id, call.span_id)
+    assert other_call.trace_id != call.trace_id
+    assert tracer.counters[("prompt_tokens_total", (("span", "llm.call"), ("agent", "orchestrator")))] == 100
+
+
+def test_failed_span_counts_an_error():
+    tracer = Tracer()
+    with pytest.raises(ValueError):
+        with tracer.span("tool.call", agent="room_manager"):
+            raise ValueError("the calendar is down")
+    assert tracer.spans[0].attributes["error"] == "ValueError"
+    assert tracer.counters[("errors_total", (("span", "tool.call"), ("agent", "room_manager")))] == 1
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+    with tracer.span("llm.call") as span:
+        span.set(prompt_tokens=100)
+    assert list(tracer.spans) == [] and tracer.counters == {}
+
+
+def test_metrics_and_traces_of_an_agent(tracer, tmp_path):
+    actions = {"check_room": {"description": "Check a room", "function": lambda room: f"{room} is free",
+                              "arguments": [{"name": "room", "type": "str"}]}}
+    backend = FakeBackend({"check r1": ['Action: check_room: {"room": "r1"}\nPAUSE', "Answer: r1 is free."]})
+    agent = ActionAgent(name="room_manager", intro="", actions=actions, backend=backend)
+    assert asyncio.run(agent.aperform_action("check r1")) == "r1 is free."
+    assert get_tracer() is tracer
+    assert [span.name for span in tracer.spans] == ["llm.call", "tool.call", "llm.call", "agent.perform_action"]
+
+    metrics = tracer.to_prometheus()
+    assert 'bring_a_crew_spans_total{span="llm.call",agent="room_manager"} 2' in metrics
+    assert 'bring_a_crew_span_duration_seconds_count{span="tool.call",agent="room_manager"} 1' in metrics
+
+    tracer.write_chrome_trace(str(tmp_path / "trace.json"))
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert len(events) == 4 and len({event["tid"] for event in events}) == 1
+    spans = tracer.to_otlp()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["parentSpanId"] == "" for span in spans] == [False, False, False, True]